@@ -1,21 +1,197 @@
+import math
 import os
 import re
+import sys
 from pathlib import Path
 
-def apply_lazy_loading(root_dir):
+from build_cache import cache_for_root, save_shared_caches
+from html_utils import iter_elements, resolve_local, set_attributes
+from responsive_images import image_size
+
+# Loading priorities for <img> tags.
+# Lazy loading every image (what this script used to do) delays the hero/banner image, which is
+# usually the Largest Contentful Paint element. Instead every image is scored by where it sits in
+# the document, what it sits in and how big it renders:
+#   high  - the best LCP candidates: fetchpriority="high", eager, plus a <link rel="preload"> in <head>
+#   eager - other images in the banner/hero area and the header logo: loaded normally
+#   lazy  - everything else: loading="lazy" decoding="async"
+# Inline style="background-image: url(...)" banners are scored too; they can only be preloaded.
+
+HERO_HINTS = ('banner', 'hero', 'breadcrumb')
+HEADER_HINTS = ('logo', 'navbar', 'header')
+# Containers that are hidden or far below the fold on first paint
+HIDDEN_HINTS = ('offcanvas', 'modal', 'preloader', 'popup', 'd-none', 'mobile-menu', 'sidebar', 'footer')
+
+MAX_HIGH_PRIORITY = 2
+HIGH_PRIORITY_SCORE = 70
+# Header images further down than this are in menus/dropdowns rather than the visible bar
+MAX_HEADER_POSITION = 4
+# Past this many images we're below the fold even inside a banner-classed section
+MAX_HERO_POSITION = 12
+# Below roughly 200x200 an image is very unlikely to be the LCP element
+MIN_LCP_AREA = 200 * 200
+
+background_url_pattern = re.compile(r'''background(?:-image)?\s*:[^;]*url\(\s*['"]?([^'")]+)['"]?\s*\)''', re.IGNORECASE)
+preload_pattern = re.compile(r'[ \t]*<link\b[^>]*\bdata-lcp-preload\b[^>]*>\n?', re.IGNORECASE)
+
+def hints_for(name, attributes):
+    return f"{name} {attributes.get('class', '')} {attributes.get('id', '')}".lower()
+
+def rendered_size(attributes, path, cache):
+    # Prefer the width/height attributes (the srcset stage fills them in), fall back to the file
+    try:
+        return int(attributes['width']), int(attributes['height'])
+    except (KeyError, ValueError):
+        pass
+    if path is not None and path.is_file():
+        return image_size(path, cache)
+    return None
+
+def score_candidate(index, own_hints, ancestor_hints, size):
+    # Returns the score, the reasons behind it and where the image sits (hidden/hero/header/None)
+    score = max(0, 30 - 3 * index)
+    reasons = [f"position {index + 1}"]
+    placement = None
+    context = own_hints + ' ' + ancestor_hints
+    if any(hint in context for hint in HIDDEN_HINTS):
+        score -= 100
+        reasons.append("hidden/off-screen container")
+        placement = 'hidden'
+    elif any(hint in context for hint in HERO_HINTS) and index < MAX_HERO_POSITION:
+        score += 40
+        reasons.append("banner/hero container")
+        placement = 'hero'
+    elif any(hint in context for hint in HEADER_HINTS) and index < MAX_HEADER_POSITION:
+        score += 15
+        reasons.append("header/logo")
+        placement = 'header'
+    if size:
+        score += min(40, math.sqrt(size[0] * size[1]) / 20)
+        reasons.append(f"{size[0]}x{size[1]}")
+    else:
+        reasons.append("unknown size")
+    return round(score), reasons, placement
+
+def collect_candidates(content, file_path, root_dir, cache):
+    candidates = []
+    for match, name, attributes, ancestors in iter_elements(content):
+        url = None
+        kind = None
+        if name == 'img':
+            url = attributes.get('src', '')
+            kind = 'img'
+        else:
+            background = background_url_pattern.search(attributes.get('style', ''))
+            if background:
+                url = background.group(1)
+                kind = 'background'
+        if kind is None:
+            continue
+        path = resolve_local(url, file_path, root_dir)
+        size = rendered_size(attributes, path, cache) if kind == 'img' else (image_size(path, cache) if path else None)
+        ancestor_hints = ' '.join(hints_for(n, a) for n, a in ancestors)
+        score, reasons, placement = score_candidate(len(candidates), hints_for(name, attributes), ancestor_hints, size)
+        candidates.append({
+            'match': match, 'kind': kind, 'url': url, 'attributes': attributes,
+            'size': size, 'score': score, 'reasons': reasons, 'placement': placement, 'decision': 'lazy',
+        })
+    return candidates
+
+def decide(candidates):
+    eligible = [
+        c for c in candidates
+        if c['score'] >= HIGH_PRIORITY_SCORE and c['size'] and c['size'][0] * c['size'][1] >= MIN_LCP_AREA
+        and not c['url'].startswith('data:')
+    ]
+    eligible.sort(key=lambda c: c['score'], reverse=True)
+    chosen = set()
+    for c in eligible:
+        # The same banner often appears twice (e.g. mirrored decorations); preload it once
+        if c['url'] in chosen:
+            continue
+        if len(chosen) == MAX_HIGH_PRIORITY:
+            break
+        c['decision'] = 'high'
+        chosen.add(c['url'])
+    for c in candidates:
+        if c['decision'] == 'lazy' and c['kind'] == 'img' and c['placement'] in ('hero', 'header'):
+            c['decision'] = 'eager'
+        if c['kind'] == 'background' and c['decision'] != 'high':
+            c['decision'] = None
+
+def preload_link(candidate):
+    attributes = candidate['attributes']
+    parts = ['<link rel="preload" as="image"', f'href="{candidate["url"]}"']
+    if candidate['kind'] == 'img' and attributes.get('srcset'):
+        parts.append(f'imagesrcset="{attributes["srcset"]}"')
+        if attributes.get('sizes'):
+            parts.append(f'imagesizes="{attributes["sizes"]}"')
+    parts.append('fetchpriority="high" data-lcp-preload>')
+    return ' '.join(parts)
+
+def prioritize_images(content, file_path, root_dir):
+    # Returns the new content and a report: one entry per image with the decision and why
+    cache = cache_for_root(root_dir)
+    candidates = collect_candidates(content, file_path, root_dir, cache)
+    decide(candidates)
+
+    pieces = []
+    last = 0
+    for c in candidates:
+        if c['kind'] != 'img':
+            continue
+        match = c['match']
+        if c['decision'] == 'high':
+            values = {'loading': 'eager', 'fetchpriority': 'high', 'decoding': None}
+        elif c['decision'] == 'eager':
+            values = {'loading': 'eager', 'fetchpriority': None, 'decoding': None}
+        else:
+            values = {'loading': 'lazy', 'decoding': 'async', 'fetchpriority': None}
+        pieces.append(content[last:match.start()])
+        pieces.append(set_attributes(match.group(0), values))
+        last = match.end()
+    pieces.append(content[last:])
+    new_content = ''.join(pieces)
+
+    # Replace the preloads from the previous build rather than piling up new ones
+    new_content = preload_pattern.sub('', new_content)
+    links = [preload_link(c) for c in candidates if c['decision'] == 'high']
+    head_end = new_content.lower().find('</head>')
+    if links and head_end != -1:
+        # Insert on their own lines just above </head>, indented one level deeper than it
+        line_start = new_content.rfind('\n', 0, head_end) + 1
+        indent = new_content[line_start:head_end]
+        if indent.strip():
+            line_start, indent = head_end, ''
+        block = ''.join(f"{indent}    {link}\n" for link in links)
+        new_content = new_content[:line_start] + block + new_content[line_start:]
+
+    report = [
+        {'url': c['url'], 'kind': c['kind'], 'decision': c['decision'], 'score': c['score'], 'reasons': c['reasons']}
+        for c in candidates if c['decision']
+    ]
+    return new_content, report
+
+def print_report(page, report, verbose=False):
+    counts = {}
+    for entry in report:
+        counts[entry['decision']] = counts.get(entry['decision'], 0) + 1
+        if verbose or entry['decision'] != 'lazy':
+            print(f"[{entry['decision'].upper()}] {page}: {entry['url']} "
+                  f"(score {entry['score']}: {', '.join(entry['reasons'])})")
+    if not counts.get('high'):
+        print(f"[NONE] {page}: no LCP image candidate")
+    return counts
+
+def loading_priority_stage(content, file_path, root_dir):
+    # Pipeline stage wrapper (see build_pipeline.py)
+    new_content, report = prioritize_images(content, file_path, root_dir)
+    print_report(os.path.relpath(file_path, root_dir), report)
+    return new_content
+
+def apply_lazy_loading(root_dir, verbose=False):
     files_modified = 0
-    images_patched = 0
-    
-    # Regex to find img tags.
-    # We want to match <img ... > and ensure it doesn't have loading="..."
-    # This regex is a bit simplistic but works for standard HTML.
-    # It looks for <img [attributes] >
-    
-    # Strategy: Find all <img ...> strings.
-    # For each match, check if 'loading=' is present.
-    # If not, insert 'loading="lazy"' before the closing > or />
-    
-    img_pattern = re.compile(r'<img\s+([^>]+)>', re.IGNORECASE)
+    totals = {}
     
     print(f"Scanning for HTML files in {root_dir}")
     
@@ -27,45 +203,31 @@ def apply_lazy_loading(root_dir):
             if file.endswith('.html'):
                 file_path = Path(root) / file
                 try:
-                    with open(file_path, 'r', encoding='utf-8') as f:
+                    with open(file_path, 'r', encoding='utf-8', newline='') as f:
                         content = f.read()
                     
-                    new_content = content
-                    file_changed = False
-                    
-                    def replacement(match):
-                        attrs = match.group(1)
-                        # Check if loading attribute exists
-                        if 'loading=' not in attrs.lower():
-                            # Check if it's a critical image (e.g., hero/banner)
-                            # Heuristic: if class contains 'hero', 'banner', 'logo' maybe skip?
-                            # User asked for "all pages and images", but lazy loading LCP images (hero) hurts performance.
-                            # Let's skip if class has 'hero-bg' or it's the logo.
-                            
-                            # However, to be safe and broadly compliant with "all", I'll apply to most.
-                            # But I'll preserve LCP if I see explicit "priority" or "eager" (unlikely here).
-                            
-                            nonlocal images_patched
-                            images_patched += 1
-                            return f'<img {attrs} loading="lazy">'
-                        
-                        return match.group(0) # No change
-                    
-                    new_content = img_pattern.sub(replacement, content)
+                    new_content, report = prioritize_images(content, file_path, root_dir)
+                    for decision, count in print_report(os.path.relpath(file_path, root_dir), report, verbose).items():
+                        totals[decision] = totals.get(decision, 0) + count
                     
                     if new_content != content:
-                        with open(file_path, 'w', encoding='utf-8') as f:
+                        with open(file_path, 'w', encoding='utf-8', newline='') as f:
                             f.write(new_content)
                         files_modified += 1
-                        # print(f"Updated: {file}")
                         
                 except Exception as e:
                     print(f"Error updating {file}: {e}")
 
+    save_shared_caches()
+
     print("-" * 30)
     print(f"Update Complete.")
     print(f"Files Modified: {files_modified}")
-    print(f"Images Patched: {images_patched}")
+    print(f"High Priority: {totals.get('high', 0)}")
+    print(f"Eager: {totals.get('eager', 0)}")
+    print(f"Lazy: {totals.get('lazy', 0)}")
 
 if __name__ == "__main__":
-    apply_lazy_loading("e:/appdev/vexil-logic-games")
+    verbose = '--verbose' in sys.argv
+    args = [arg for arg in sys.argv[1:] if arg != '--verbose']
+    apply_lazy_loading(args[0] if args else os.path.dirname(os.path.abspath(__file__)), verbose)
@@ -1,72 +1,25 @@
-document.addEventListener('DOMContentLoaded', () => {
-const container = document.getElementById('game-list-container');
-if (!container) return;
-const apps = [
-{
-"id": 1,
-"name": "Fruit Merge: Watermelon Game",
-"icon": "https://play-lh.googleusercontent.com/uGxRufJolsYYceWZ6Zdu-INEMxSk3aVktMkb3I1azKyfmj17cMWPb1R1MR8TNjTAbx4VSss-OAVYhs1gcseiUg=w240-h480-rw",
-"thumbnail": "https://lh3.googleusercontent.com/MnBC8QOWn76kZjdpgmjTH3bXTbb36XsH8yQb1Djt5NxVirLczbtN8vvgm9etPPPrZvw5KDq4knnxOBHsyU-kmw",
-"screenshots": [
-"https://play-lh.googleusercontent.com/0jeqU5r0ANxFUbFHZqAszNIP_l-2ZKyGdzbXkuakuzWQd9DldSpBiG6DCyzp0FQmv45sYeM-FIPoXxEPrjbJFA8=w526-h296-rw",
-"https://play-lh.googleusercontent.com/OXqrZurfr5t56Jcw7asBT5HKCVLJoOBu6mQiX4vNBXrGaNmEgbRxlpQy7KCTmxib6DKdqdhXJZynqh0TFgLBYQ=w526-h296-rw",
-"https://play-lh.googleusercontent.com/ku5jOHEMLoejfybesUi0zM29ox1px2b4YRTZcH8fgi6r_CdBEjJc_QYiyN_IfcHi2CapO11apkEyljDXlVVVLw=w526-h296-rw",
-"https://play-lh.googleusercontent.com/qarKuln8AJ1QxuoBljh1x9PpvU4Jj_KIH7r1hh22wJ5Ig4qlTxV0dYvUfvBLThxcrUw5I7LT1KyrtdNl05PkKw=w526-h296-rw",
-"https://play-lh.googleusercontent.com/jhKXhRwiUhl6qbRaBj0Xzovhpa7tvP91jIF-ZSqezih17w4EtYxo_UULI5sxJFVNhpi1Lsq_uYwlF4RF78rypg=w526-h296-rw"
-],
-"rating": "4.8",
-"category": "Puzzle",
-"orientation": "portrait",
-"description": "🍓 Dive into Juice Worlds: The Definitive Fruit Merge Adventure! 🍓\n\nAre you ready to challenge your mind with the most satisfying drop puzzle of the year? Welcome to Juice Worlds, a fresh and exciting twist on the viral Watermelon Game genre.\n\nIf you love the strategy of 2048, the physics of Tetris, and the fun of classic fruit match games, this is the perfect experience for you. Drop, merge, and grow your fruits to create the legendary Giant Watermelon! 🍉\n\n🎮 THE ULTIMATE FRUIT MERGE EXPERIENCE\n\nIn Juice Worlds, your goal is simple yet addictive: drop cute fruits onto the board and merge identical ones to evolve them into larger varieties. Start with small berries and work your way up to the massive Watermelon.\n\nBut be careful! The container fills up quickly. You will need to use smart strategy and physics to keep the board clear. It’s the classic Suika style gameplay you know, now enhanced with features you’ve never seen before.\n\n✨ EXCLUSIVE GAME FEATURES:\n\n🧩 Strategic Drop & Merge Gameplay\nExperience smooth, physics-based mechanics. Fruits roll, bounce, and settle realistically. Every drop matters in this brain teaser! Plan your moves to trigger satisfying chain reactions and massive combos.\n\n🌍 Unlock Stunning Worlds\nWhy play on a boring background? We bring you the first fruit merge game with customizable themes!\n• Classic Kitchen: The traditional look you love.\n• Cyberpunk City: Merge fruits under neon lights.\n• Desert Oasis: A sunny, relaxing puzzle environment.\n• Space Voyager: Drop fruits in zero-gravity style visuals.\n\n🚀 Powerful Boosts & Power-Ups\nStuck with a bad drop? Don’t worry! Unlike other Suika games, we give you the tools to win:\n• Hammer Smash: Destroy unwanted fruits to clear space.\n• Shuffle: Shake up the board to find new merge opportunities.\n• Evolution: Instantly upgrade a fruit to the next tier!\n\n🏆 Compete on Global Leaderboards\nDo you have what it takes to be the Fruit King? Challenge players from around the world. Climb the ranks, show off your high scores, and prove your skills in this competitive online puzzle.\n\n🧠 Relaxing Yet Challenging\nPerfect for quick breaks or long sessions. This is a casual game that helps you unwind while keeping your brain sharp. It’s easy to learn but hard to master—the hallmark of a great logic puzzle.\n\n📶 Play Offline Anywhere\nNo internet? No problem! Juice Worlds is a fully optimized offline game. Enjoy the fruit-dropping fun on the bus, on a plane, or anywhere without Wi-Fi.\n\nWHY PLAYERS LOVE JUICE WORLDS:\n🍒 Cute Graphics: Vibrant, juicy visuals and satisfying animations.\n🍒 ASMR Sounds: Relaxing sound effects with every pop and merge.\n🍒 Daily Rewards: Log in every day for free coins and boosters.\n🍒 Family Friendly: A fun puzzle game for kids and adults alike.\n\n🍉 TIPS TO MASTER THE GAME:\n1. Think Ahead: Don't just drop randomly. Look at the \"Next Fruit\" indicator.\n2. Big Fruits in Corners: Try to keep your largest fruits (like the Melon or Coconut) in the corners to avoid blocking the board.\n3. Use Physics: Drop fruits slightly off-center to push other fruits together.\n4. Save Your Boosts: Only use your power-ups when you are close to the red line!\n\nJoin the Fruit Fusion Frenzy!\n\nStop playing generic clones. Experience the fruit merge game that offers more strategy, more themes, and more fun. Whether you are a fan of merge puzzles, match 3 games, or just want a relaxing way to pass the time, this game is for you.\n\n⬇️ Download Fruit Merge: Watermelon Game now and start your journey to the Giant Watermelon! ⬇️",
-"url": "https://play.google.com/store/apps/details?id=com.exodium.juicyjunctionpuzzle"
-},
-{
-"id": 2,
-"name": "City Cargo Truck Parking Sim",
-"icon": "https://play-lh.googleusercontent.com/xZ4cbIGXWE5l5_HM_KhXpuBJExhT_viv_-_aHXrZw7YeHPRoCb7ZFghaTwyTrYk-Lve_nyby-LLKKgwbidlw=w240-h480-rw",
-"thumbnail": "https://play-lh.googleusercontent.com/fcwLBXP9mozBLrJtlheE4fnwwYyTEPF3J7lx3qnRxC6fUWXAK9qPFvCTj-r8BD-PRj0dXIumuZylod5tizBWGA=w416-h235-rw",
-"screenshots": [
-"https://play-lh.googleusercontent.com/gJdJ-gOD1ZYg3j-3qsnyX72Txx1Y_jZ7Ak16ukCc4Qj3HUs-Lg9ISDZ8MgKPbmhTei7fQ_vW_zW8UOk1jif3SwQ=w526-h296-rw",
-"https://play-lh.googleusercontent.com/OZ0yMsgiK_nNj-b9i9kyRzEr0VP6__E4WQYDXQI1gNLd7id-UARLUE_0TbOSdU4Gm9nYmylOnshBmoz2rxe3eg=w526-h296-rw",
-"https://play-lh.googleusercontent.com/3sJn5mnkp14ti3MdZC_ZwPiAoqV-1pr4KhY4n7kM8XWWxxmGJb9Vz2FdaLI343wWqPZfQlknAA56o1WhiiU7s8w=w526-h296-rw",
-"https://play-lh.googleusercontent.com/Y2m0FAb2pWWAIrQyUgr_q1E9sF2yh3pwDnjGJpd3MOMgm_I0gABHkz2IVCvO7HsGnN8EQd7aDY0aYX0DfsQAwg=w526-h296-rw",
-"https://play-lh.googleusercontent.com/ZpW6bmJx7FcXkk1SCFK7vWv7sbQYK0LPnVC1ezz1f-1bzrUXolqkuHycSvHTrJ_VbS7gdLRoK42k1grvgsPC=w526-h296-rw"
-],
-"rating": "4.5",
-"category": "Simulation",
-"orientation": "landscape",
-"description": "Become the ultimate city cargo truck driver!\n\nCity Cargo Truck Parking Sim – Real Truck Game brings you a realistic truck driving & parking simulator full of cargo missions, precision challenges, and urban environments.\n\n🚚 Realistic Vehicles & Physics\nDrive semi-trucks, box trucks, long trailers, vans, and forklifts. Every vehicle feels different — weight, suspension, manual/automatic gear shifts, brake dynamics. Tweak control styles like tilt, buttons, or wheel mode. Feel the roar of engines and squeal of brakes.\n\n🎯 Cargo Delivery Missions & Parking Challenges\nTransport loads: pallets, containers, barrels, tools across city zones. Face timed deliveries, route planning, and multi-stop missions. Reverse into tight docks, avoid collisions, park within narrow lines. Special forklift tasks let you load/unload cargo manually.\n\n🌆 Explore a Full 3D City World\nNavigate downtown roads, industrial areas, ports, and warehouse districts. Dynamic day/night cycle, rain, fog & weather effects influence driving. AI traffic, pedestrians, roadworks bring realism to your simulator.\n\n🔧 Customisation & Progression\nUnlock new trucks, upgrade parts, paint your rig, choose wheels and exhausts. Select your camera view (interior, exterior, top-down). Free drive mode lets you experiment, find shortcuts or practice parking.\n\n💡 Why You’ll Love This Truck Game\n• Focused on **city driving & parking** — no off-road distractions\n• Fully playable offline — fits your schedule\n• Replay missions, earn 3 stars, improve your skills\n• Free-to-play with optional cosmetic packs — not pay-to-win\n\nDownload City Cargo Truck Parking Sim – Real Truck Game now and master urban deliveries, park like a pro, tackle weather and tight spots, become the top cargo transporter!",
-"url": "https://play.google.com/store/apps/details?id=com.vexillogic.citycargotruck.simulator"
-}
-];
-container.innerHTML = ''; // Clear existing static cards
-apps.forEach((app, index) => {
-const delay = (0.2 + (index * 0.1)).toFixed(1);
-const cardHtml = `
-<div class="col-xl-3 col-md-6 d-flex">
-<div class="single-feature-inner fade-slide bottom" data-delay="${delay}">
-<h4 class="title d-flex justify-content-between align-items-center">
-${app.name}
-<img src="${app.icon}" alt="icon" style="width: 40px; height: 40px; border-radius: 8px; object-fit: cover;">
-</h4>
-<div class="thumb text-center">
-<img src="${app.thumbnail}" alt="feature graphic">
-</div>
-<div class="details d-flex justify-content-between align-items-center">
-<div class="left">
-<h5 class="d-block" style="font-size: 14px; opacity: 0.8; margin-bottom: 5px;">Vexil Logic Games</h5>
-<a href="game-details.html?id=${app.id}" class="bid" style="font-size: 12px;">
-<span class="icon"><i class="fa fa-info-circle"></i></span>
-Details
-</a>
-</div>
-<div class="right">
-<a class="btn btn-base" href="game-details.html?id=${app.id}">VIEW <i class="fa fa-arrow-right"></i></a>
-</div>
-</div>
-</div>
-</div>
-`;
-container.innerHTML += cardHtml;
-});
-});
\ No newline at end of file
+document.addEventListener('DOMContentLoaded',()=>{const container=document.getElementById('game-list-container');if(!container||container.hasAttribute('data-catalog'))return;const escapeHtml=(value)=>String(value).replace(/[&<>"']/g,(c)=>'&#'+c.charCodeAt(0)+';');const renderCard=(app,index)=>{const delay=(0.2+(index*0.1)).toFixed(1);const name=escapeHtml(app.name);return`
+            <div class="col-xl-3 col-md-6 d-flex">
+                <div class="single-feature-inner fade-slide bottom" data-delay="${delay}">
+                    <h4 class="title d-flex justify-content-between align-items-center">
+                        ${name}
+                        <img src="${escapeHtml(app.icon)}" alt="${name} icon" width="40" height="40" style="width: 40px; height: 40px; border-radius: 8px; object-fit: cover;">
+                    </h4>
+                    <div class="thumb text-center">
+                        <img src="${escapeHtml(app.thumbnail)}" alt="${name}">
+                    </div>
+                    <div class="details d-flex justify-content-between align-items-center">
+                        <div class="left">
+                            <h5 class="d-block" style="font-size: 14px; opacity: 0.8; margin-bottom: 5px;">Vexil Logic Games</h5>
+                            <a href="game-details.html?id=${escapeHtml(app.id)}" class="bid" style="font-size: 12px;">
+                                <span class="icon"><i class="fa fa-info-circle"></i></span>
+                                Details
+                            </a>
+                        </div>
+                        <div class="right">
+                            <a class="btn btn-base" href="game-details.html?id=${escapeHtml(app.id)}">VIEW <i class="fa fa-arrow-right"></i></a>
+                        </div>
+                    </div>
+                </div>
+            </div>
+        `;};fetch('catalog.json').then((response)=>response.ok?response.json():Promise.reject(response.status)).then((apps)=>{container.innerHTML=apps.map(renderCard).join('');}).catch(()=>{});});
\ No newline at end of file
@@ -0,0 +1,521 @@
+import argparse
+import builtins
+import contextlib
+import cProfile
+import io
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+# Benchmark for the build scripts on synthetic sites.
+# generate_site() writes a site shaped like this one (root level pages with the same head, nav,
+# banner, blog sections and footer; shared stylesheets and scripts; PNG/JPG/WebP images under
+# assets/img; apps.json for the games catalog; sitemap.xml) at any size, from a seed, so the same
+# arguments always give the same bytes. Pages reference images at about the density of the real
+# blog pages and a few of those references are broken, like ours were before fix_broken_links.
+#
+# The scripts then run over it in deploy order, each in its own process so its peak RSS is its own:
+#   convert_to_webp -> update_references_and_cleanup -> fix_broken_links -> apply_lazy_loading
+#   -> minify_assets -> pipeline (all stages) -> pipeline-rebuild (the same, with nothing changed)
+# Each run records wall time, peak RSS, files and bytes read and written, and for the pipeline the
+# per-stage times. Results go to a JSON file; --profile writes a cProfile dump per run.
+# --baseline compares against an earlier results file and exits 1 when something got slower or
+# bigger by more than --threshold.
+#
+# python bench_build.py                        # 100, 1000 and 10000 pages
+# python bench_build.py --pages 1000 --scripts pipeline,pipeline-rebuild --profile prof/
+# python bench_build.py --generate /tmp/site --pages 1000   # just write a site
+
+SITE_SIZES = (100, 1000, 10000)
+RESULTS_FILE_NAME = 'bench-results.json'
+DEFAULT_THRESHOLD = 0.25
+# Differences below this are timer noise, whatever the ratio
+NOISE_SECONDS = 0.05
+
+# Shared image pool per page; thumbnails and icons are reused across pages, headers mostly aren't
+IMAGES_PER_PAGE = 0.25
+MIN_IMAGES = 24
+IMAGE_REFS_PER_PAGE = (6, 14)
+LINKS_PER_PAGE = (10, 25)
+SECTIONS_PER_PAGE = (4, 9)
+# Share of image references that point at nothing
+BROKEN_REF_RATIO = 0.02
+APPS_PER_PAGE = 0.1
+
+IMAGE_KINDS = [
+    # (directory, size, weight)
+    ('banner', (1280, 640), 0.05),
+    ('blog', (800, 500), 0.15),
+    ('feature', (400, 300), 0.30),
+    ('icon', (96, 96), 0.50),
+]
+# Most of the real tree is WebP already; the rest still needs converting
+IMAGE_FORMATS = [('.webp', 0.4), ('.png', 0.4), ('.jpg', 0.2)]
+
+WORDS = ('game engine player level retention unity unreal store launch update build design mobile '
+         'monetization ads reward session arcade puzzle casual score tournament wallet creator asset '
+         'shader physics input frame budget release analytics funnel install review rating').split()
+
+# Classes the page template uses
+PAGE_CLASSES = ('navbar', 'navbar-area', 'nav-container', 'logo', 'navbar-nav', 'menu-open', 'banner-area',
+                'bg-relative', 'banner-inner', 'title', 'blog-area', 'single-blog-inner', 'fade-slide', 'thumb',
+                'footer-area', 'footer-links', 'container', 'row')
+
+SCRIPTS = ['convert_to_webp', 'update_references_and_cleanup', 'fix_broken_links', 'apply_lazy_loading',
+           'minify_assets', 'pipeline', 'pipeline-rebuild']
+
+PAGE_TEMPLATE = '''<!DOCTYPE html>
+<html lang="en">
+<head>
+    <meta charset="utf-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1">
+    <title>{title} | Vexil Logic</title>
+    <meta name="description" content="{description}">
+    <link rel=icon href="assets/img/favicon.png" sizes="20x20" type="image/png">
+    <link href="https://fonts.googleapis.com/css2?family=Rajdhani:wght@400;600;700&display=swap" rel="stylesheet">
+    <link rel="stylesheet" href="assets/css/bootstrap.min.css">
+    <link rel="stylesheet" href="assets/css/animate.min.css">
+    <link rel="stylesheet" href="assets/css/style.css">
+    <link rel="stylesheet" href="assets/css/responsive.css">
+</head>
+<body>
+    <nav class="navbar navbar-area navbar-expand-lg">
+        <div class="container nav-container">
+            <div class="logo">
+                <a href="index.html"><img src="assets/img/logo.png" alt="logo"></a>
+            </div>
+            <div class="collapse navbar-collapse" id="main_menu">
+                <ul class="navbar-nav menu-open text-lg-end">
+{nav}
+                </ul>
+            </div>
+        </div>
+    </nav>
+    <div class="banner-area bg-relative" style="background-image: url('{background}');">
+        <div class="container">
+            <div class="banner-inner">
+                <h1 class="title">{title}</h1>
+                <img src="{hero}" alt="{title}">
+            </div>
+        </div>
+    </div>
+    <section class="blog-area pd-top-120 pd-bottom-120">
+        <div class="container">
+{sections}
+{extra}
+        </div>
+    </section>
+    <footer class="footer-area bg-black">
+        <div class="container">
+            <ul class="footer-links">
+{footer}
+            </ul>
+        </div>
+    </footer>
+    <script src="assets/js/jquery.min.js"></script>
+    <script src="assets/js/bootstrap.min.js"></script>
+    <script src="assets/js/main.js"></script>
+{scripts}
+</body>
+</html>
+'''
+
+SECTION_TEMPLATE = '''            <div class="single-blog-inner fade-slide bottom">
+                <h2 class="title">{heading}</h2>
+{paragraphs}
+                <div class="thumb"><img src="{image}" alt="{heading}"></div>
+            </div>'''
+
+def weighted(rng, choices):
+    return rng.choices([value for value, _ in choices], weights=[weight for _, weight in choices])[0]
+
+def sentence(rng, words):
+    text = ' '.join(rng.choice(WORDS) for _ in range(words))
+    return text[0].upper() + text[1:] + '.'
+
+def make_paragraphs(rng, count):
+    # A fixed stock of paragraphs that pages draw from, so page text repeats about as much as real copy
+    return [' '.join(sentence(rng, rng.randint(8, 18)) for _ in range(rng.randint(3, 7))) for _ in range(count)]
+
+def make_stylesheet(rng, rules, images, minified=False):
+    # Plain rules, media blocks, keyframes, comments and url()s: what the CSS minifier has to deal with
+    blocks = []
+    for i in range(rules):
+        if i % 3 == 0:
+            # Some rules style the page markup, so critical CSS and selector pruning have something to keep
+            selector = f".{rng.choice(PAGE_CLASSES)} .{rng.choice(PAGE_CLASSES)}, .{rng.choice(PAGE_CLASSES)} {rng.choice(('a', 'img', 'h2', 'p'))}"
+        else:
+            selector = f".{rng.choice(WORDS)}-{i} .{rng.choice(WORDS)}, #{rng.choice(WORDS)}-{i} > a:hover"
+        declarations = [
+            f"color: rgb({rng.randint(0, 255)}, {rng.randint(0, 255)}, {rng.randint(0, 255)})",
+            f"margin: {rng.randint(0, 40)}px 0px {rng.randint(0, 40)}.50px",
+            f"transition: all 0.{rng.randint(1, 9)}0s ease-in-out",
+        ]
+        if images and i % 20 == 0:
+            declarations.append(f"background-image: url('../img/{rng.choice(images)}')")
+        rule = f"{selector} {{ {'; '.join(declarations)}; }}"
+        if i % 50 == 0:
+            rule = f"/* {sentence(rng, 6)} */\n{rule}"
+        if i % 15 == 0:
+            rule = f"@media (max-width: {rng.choice((575, 767, 991, 1199))}px) {{\n  {rule}\n}}"
+        blocks.append(rule)
+        if i % 200 == 0:
+            blocks.append(f"@keyframes {rng.choice(WORDS)}-{i} {{ 0% {{ opacity: 0; }} 100% {{ opacity: 1; }} }}")
+    return ('' if minified else '\n').join(blocks) + '\n'
+
+def make_script(rng, functions):
+    # Functions with comments, strings, template literals and regex literals
+    parts = ['(function ($) {', '    "use strict";']
+    for i in range(functions):
+        name = f"{rng.choice(WORDS)}{i}"
+        parts.append(f"    // {sentence(rng, 8)}")
+        parts.append(f"    function {name}(element, value) {{")
+        parts.append(f"        var pattern = /^{rng.choice(WORDS)}-(\\d+)$/i;")
+        parts.append(f"        var label = `{rng.choice(WORDS)} ${{value}}`;")
+        parts.append(f"        if (pattern.test(element.id) && value > {rng.randint(0, 100)}) {{")
+        parts.append(f"            $(element).addClass('{rng.choice(WORDS)}-active').attr('data-label', label);")
+        parts.append('        }')
+        parts.append(f"        return value / {rng.randint(2, 9)};")
+        parts.append('    }')
+    parts.append('})(jQuery);')
+    return '\n'.join(parts) + '\n'
+
+def make_image(size, rng):
+    # Like bench_optimize_images.make_image (noise over a gradient, compresses like a photo), but the
+    # noise comes from the seeded generator: Image.effect_noise uses the C library's own random state
+    noise = np.random.default_rng(rng.getrandbits(32)).normal(128, rng.randint(20, 80), (size[1], size[0]))
+    noise = Image.fromarray(np.clip(noise, 0, 255).astype(np.uint8), 'L')
+    gradient = Image.linear_gradient('L').resize(size)
+    flat = Image.new('L', size, rng.randint(0, 255))
+    return Image.merge('RGB', (noise, gradient, flat))
+
+def write_text(path, text):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        f.write(text)
+    return len(text.encode('utf-8'))
+
+def generate_images(root, count, rng):
+    # Returns the image keys (root relative) in creation order
+    keys = []
+    total = 0
+    for i in range(count):
+        directory, size, _ = rng.choices(IMAGE_KINDS, weights=[weight for _, _, weight in IMAGE_KINDS])[0]
+        suffix = weighted(rng, IMAGE_FORMATS)
+        key = f"assets/img/{directory}/{i}{suffix}"
+        path = root / key
+        path.parent.mkdir(parents=True, exist_ok=True)
+        make_image(size, rng).save(path)
+        total += path.stat().st_size
+        keys.append(key)
+    for key in ('assets/img/logo.png', 'assets/img/favicon.png'):
+        make_image((160, 48), rng).save(root / key)
+    return keys, total
+
+def page_name(index):
+    return 'index.html' if index == 0 else f"page-{index:05d}.html"
+
+def generate_site(directory, pages, seed=1):
+    # Writes a synthetic site of `pages` pages into directory; returns its stats
+    rng = random.Random(seed)
+    root = Path(directory)
+    root.mkdir(parents=True, exist_ok=True)
+    stats = {'pages': pages, 'bytes': 0}
+
+    images, stats['image_bytes'] = generate_images(root, max(MIN_IMAGES, int(pages * IMAGES_PER_PAGE)), rng)
+    stats['images'] = len(images)
+    stats['bytes'] += stats['image_bytes']
+    image_names = [key[len('assets/img/'):] for key in images]
+    stats['bytes'] += write_text(root / 'assets/css/bootstrap.min.css', make_stylesheet(rng, 3000, [], minified=True))
+    stats['bytes'] += write_text(root / 'assets/css/animate.min.css', make_stylesheet(rng, 400, [], minified=True))
+    stats['bytes'] += write_text(root / 'assets/css/style.css', make_stylesheet(rng, 2000, image_names))
+    stats['bytes'] += write_text(root / 'assets/css/responsive.css', make_stylesheet(rng, 600, image_names))
+    stats['bytes'] += write_text(root / 'assets/js/jquery.min.js', make_script(rng, 600).replace('\n    ', ''))
+    stats['bytes'] += write_text(root / 'assets/js/bootstrap.min.js', make_script(rng, 300).replace('\n    ', ''))
+    stats['bytes'] += write_text(root / 'assets/js/main.js', make_script(rng, 250))
+    stats['bytes'] += write_text(root / 'assets/js/app-loader.js', make_script(rng, 20))
+    stats['bytes'] += write_text(root / 'CNAME', 'example.com\n')
+
+    # The games catalog grows with the site
+    apps = [{'id': i + 1, 'name': f"{rng.choice(WORDS).title()} {rng.choice(WORDS).title()} {i + 1}",
+             'icon': rng.choice(images), 'thumbnail': rng.choice(images),
+             'description': sentence(rng, 12), 'rating': round(rng.uniform(3.5, 5.0), 1)}
+            for i in range(max(4, int(pages * APPS_PER_PAGE)))]
+    stats['bytes'] += write_text(root / 'apps.json', json.dumps(apps, indent=2))
+
+    paragraphs = make_paragraphs(rng, 300)
+    names = [page_name(i) for i in range(pages)]
+    nav = '\n'.join(f'                    <li><a href="{name}">{name[:-5].title()}</a></li>' for name in names[:8])
+
+    def image_ref():
+        key = rng.choice(images)
+        if rng.random() < BROKEN_REF_RATIO:
+            return key.rsplit('/', 1)[0] + f"/missing-{rng.randint(0, 999)}.webp"
+        return key
+
+    for i, name in enumerate(names):
+        title = sentence(rng, rng.randint(3, 7))[:-1]
+        refs = rng.randint(*IMAGE_REFS_PER_PAGE)
+        links = rng.randint(*LINKS_PER_PAGE)
+        sections = []
+        for _ in range(rng.randint(*SECTIONS_PER_PAGE)):
+            body = []
+            for paragraph in rng.sample(paragraphs, rng.randint(2, 4)):
+                words = paragraph.split(' ')
+                # Inline links to other pages inside the copy
+                if links:
+                    position = rng.randrange(len(words))
+                    words[position] = f'<a href="{rng.choice(names)}">{words[position]}</a>'
+                    links -= 1
+                body.append(f"                <p>{' '.join(words)}</p>")
+            sections.append(SECTION_TEMPLATE.format(heading=sentence(rng, 5)[:-1], paragraphs='\n'.join(body), image=image_ref()))
+            refs -= 1
+        # Whatever density is left goes into a gallery of thumbnails
+        gallery = [f'            <a href="{rng.choice(names)}"><img src="{image_ref()}" alt="thumb"></a>' for _ in range(max(0, refs - 2))]
+        extra = '\n'.join(gallery)
+        if i == 0:
+            extra += '\n            <div class="row" id="game-list-container"></div>'
+        footer = '\n'.join(f'                <li><a href="{rng.choice(names)}">{rng.choice(WORDS)}</a></li>' for _ in range(6))
+        page = PAGE_TEMPLATE.format(
+            title=title, description=sentence(rng, 20), nav=nav, background=image_ref(), hero=image_ref(),
+            sections='\n'.join(sections), extra=extra, footer=footer,
+            scripts='    <script src="assets/js/app-loader.js"></script>' if i == 0 else '',
+        )
+        stats['bytes'] += write_text(root / name, page)
+
+    sitemap = ''.join(f"  <url><loc>https://example.com/{name}</loc></url>\n" for name in names)
+    stats['bytes'] += write_text(root / 'sitemap.xml',
+                                 f'<?xml version="1.0" encoding="UTF-8"?>\n<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n{sitemap}</urlset>\n')
+    return stats
+
+# --- worker side: one script in this process, measured ---
+
+def run_script(script, root, options):
+    # Runs one build script over the site and returns its own stats (if it has any)
+    if script == 'convert_to_webp':
+        from build_cache import CACHE_FILE_NAME
+        from optimize_images import convert_to_webp
+        return convert_to_webp(os.path.join(root, 'assets', 'img'), quality=options.quality,
+                               cache_path=os.path.join(root, CACHE_FILE_NAME), jobs=options.jobs)
+    if script == 'update_references_and_cleanup':
+        from migrate_codebase import update_references_and_cleanup
+        return update_references_and_cleanup(root)
+    if script == 'fix_broken_links':
+        from fix_broken_webp_links import fix_broken_links
+        return fix_broken_links(root)
+    if script == 'apply_lazy_loading':
+        from apply_lazy_loading import apply_lazy_loading
+        return apply_lazy_loading(root)
+    if script == 'minify_assets':
+        from minify_assets import main
+        return main([root])
+    if script in ('pipeline', 'pipeline-rebuild'):
+        from build_pipeline import run_pipeline
+        stats, totals = run_pipeline(root)
+        return {'stages': stats, 'totals': totals}
+    raise ValueError(f"Unknown script: {script}")
+
+def proc_io():
+    # Bytes this process read and wrote through syscalls (Linux only)
+    try:
+        with open('/proc/self/io', 'r') as f:
+            fields = dict(line.split(': ') for line in f.read().splitlines())
+        return int(fields['rchar']), int(fields['wchar'])
+    except (OSError, KeyError, ValueError):
+        return None
+
+def peak_rss_kb():
+    # ru_maxrss is KB on Linux and bytes on macOS; worker pools count through RUSAGE_CHILDREN
+    scale = 1024 if sys.platform == 'darwin' else 1
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    return peak // scale
+
+def worker(script, root, options):
+    # Counts the distinct files opened for reading and for writing by wrapping open().
+    # Files opened inside worker processes (convert_to_webp with --jobs > 1) aren't seen.
+    files_read, files_written = set(), set()
+    real_open = builtins.open
+
+    def counting_open(file, mode='r', *args, **kwargs):
+        handle = real_open(file, mode, *args, **kwargs)
+        if isinstance(file, (str, bytes, os.PathLike)):
+            (files_written if set(mode) & set('wax+') else files_read).add(os.fspath(file))
+        return handle
+
+    start_rss = peak_rss_kb()
+    start_io = proc_io()
+    profiler = cProfile.Profile() if options.profile else None
+    builtins.open = io.open = counting_open
+    started = time.perf_counter()
+    try:
+        # The per-file reports are noise here, only the totals matter
+        with contextlib.redirect_stdout(io.StringIO()):
+            if profiler:
+                profiler.enable()
+            stats = run_script(script, root, options)
+            if profiler:
+                profiler.disable()
+    finally:
+        seconds = time.perf_counter() - started
+        builtins.open = io.open = real_open
+    end_io = proc_io()
+
+    result = {
+        'seconds': round(seconds, 4),
+        'peak_rss_kb': peak_rss_kb(),
+        'start_rss_kb': start_rss,
+        'files_read': len(files_read),
+        'files_written': len(files_written),
+    }
+    if start_io and end_io:
+        result['bytes_read'] = end_io[0] - start_io[0]
+        result['bytes_written'] = end_io[1] - start_io[1]
+    if isinstance(stats, dict) and 'stages' in stats:
+        result['stages'] = {name: {'seconds': round(s['seconds'], 4), 'files': s['files'], 'changed': s['changed']}
+                            for name, s in stats['stages'].items()}
+    if profiler:
+        profiler.dump_stats(options.profile)
+    return result
+
+# --- parent side ---
+
+def measure(script, root, options, profile_path):
+    # Runs the worker in a fresh interpreter so peak RSS and imports belong to this script alone
+    with tempfile.NamedTemporaryFile(suffix='.json', delete=False) as f:
+        result_path = f.name
+    command = [sys.executable, os.path.abspath(__file__), '--worker', script, '--site', root,
+               '--result', result_path, '--jobs', str(options.jobs)]
+    if options.quality is not None:
+        command += ['--quality', str(options.quality)]
+    if profile_path:
+        command += ['--profile', profile_path]
+    try:
+        completed = subprocess.run(command, cwd=os.path.dirname(os.path.abspath(__file__)))
+        if completed.returncode != 0:
+            return {'error': f"exit code {completed.returncode}"}
+        with open(result_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    finally:
+        os.remove(result_path)
+
+def print_size(pages, site):
+    print(f"{'Script':<32}{'Time (s)':>10}{'Peak RSS (MB)':>15}{'Read':>8}{'Written':>9}")
+    for script, result in site['scripts'].items():
+        if 'error' in result:
+            print(f"{script:<32}{'failed: ' + result['error']:>42}")
+            continue
+        print(f"{script:<32}{result['seconds']:>10.2f}{result['peak_rss_kb'] / 1024:>15.1f}"
+              f"{result['files_read']:>8}{result['files_written']:>9}")
+        for name, stage in result.get('stages', {}).items():
+            print(f"  {name:<30}{stage['seconds']:>10.2f}{'':>15}{stage['files']:>8}{stage['changed']:>9}")
+
+def compare(results, baseline, threshold):
+    # Returns regression lines for every (size, script) that got slower or bigger than the baseline allows
+    regressions = []
+    for pages, site in results['sites'].items():
+        previous_site = baseline.get('sites', {}).get(pages, {})
+        for script, result in site['scripts'].items():
+            previous = previous_site.get('scripts', {}).get(script)
+            if not previous or 'error' in previous or 'error' in result:
+                continue
+            slower = result['seconds'] - previous['seconds']
+            if slower > NOISE_SECONDS and result['seconds'] > previous['seconds'] * (1 + threshold):
+                regressions.append(f"{pages} pages {script}: {previous['seconds']:.2f}s -> {result['seconds']:.2f}s")
+            if result['peak_rss_kb'] > previous['peak_rss_kb'] * (1 + threshold):
+                regressions.append(f"{pages} pages {script}: peak RSS {previous['peak_rss_kb'] / 1024:.1f}MB -> "
+                                   f"{result['peak_rss_kb'] / 1024:.1f}MB")
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the build scripts on synthetic sites of growing size.")
+    parser.add_argument('--pages', default=','.join(map(str, SITE_SIZES)), help="comma separated site sizes")
+    parser.add_argument('--scripts', default=','.join(SCRIPTS), help="comma separated scripts to run, in this order")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--jobs', '-j', type=int, default=1,
+                        help="encoder processes for convert_to_webp (1 keeps the file counts complete)")
+    parser.add_argument('--quality', type=int, default=None, help="fixed WebP quality instead of the per-image search")
+    parser.add_argument('--output', default=RESULTS_FILE_NAME, help="results JSON file")
+    parser.add_argument('--baseline', help="earlier results file to compare against")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help="allowed growth in time or peak RSS over the baseline, as a fraction")
+    parser.add_argument('--profile', help="directory for cProfile dumps, one per size and script")
+    parser.add_argument('--keep', action='store_true', help="keep the generated sites")
+    parser.add_argument('--generate', metavar='DIR', help="only write a synthetic site of the first --pages size to DIR")
+    # Internal: run one script in this process and write its measurements to --result
+    parser.add_argument('--worker', help=argparse.SUPPRESS)
+    parser.add_argument('--site', help=argparse.SUPPRESS)
+    parser.add_argument('--result', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        result = worker(args.worker, args.site, args)
+        with open(args.result, 'w', encoding='utf-8') as f:
+            json.dump(result, f)
+        return 0
+
+    sizes = [int(size) for size in args.pages.split(',') if size.strip()]
+    scripts = [script.strip() for script in args.scripts.split(',') if script.strip()]
+    for script in scripts:
+        if script not in SCRIPTS:
+            parser.error(f"Unknown script: {script}")
+
+    if args.generate:
+        stats = generate_site(args.generate, sizes[0], args.seed)
+        print(f"Generated {stats['pages']} pages, {stats['images']} images, {stats['bytes'] / (1024*1024):.1f} MB in {args.generate}")
+        return 0
+
+    if args.profile:
+        os.makedirs(args.profile, exist_ok=True)
+    results = {'python': platform.python_version(), 'platform': platform.platform(), 'seed': args.seed,
+               'jobs': args.jobs, 'quality': args.quality, 'sites': {}}
+    for pages in sizes:
+        directory = tempfile.mkdtemp(prefix=f'bench-site-{pages}-')
+        try:
+            print(f"Generating {pages} pages in {directory}")
+            started = time.perf_counter()
+            stats = generate_site(directory, pages, args.seed)
+            stats['generate_seconds'] = round(time.perf_counter() - started, 2)
+            print(f"{stats['images']} images, {stats['bytes'] / (1024*1024):.1f} MB, {stats['generate_seconds']:.1f}s")
+            site = {'site': stats, 'scripts': {}}
+            for script in scripts:
+                profile_path = os.path.join(os.path.abspath(args.profile), f"{pages}-{script}.prof") if args.profile else None
+                site['scripts'][script] = measure(script, directory, args, profile_path)
+            results['sites'][str(pages)] = site
+            print("-" * 30)
+            print_size(pages, site)
+            print("-" * 30)
+        finally:
+            if args.keep:
+                print(f"Kept {directory}")
+            else:
+                shutil.rmtree(directory, ignore_errors=True)
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=1)
+    print(f"Results written to {args.output}")
+    if args.profile:
+        print(f"Profiles written to {args.profile} (python -m pstats <file>)")
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        for line in regressions:
+            print(f"[REGRESSION] {line}")
+        print(f"Regressions: {len(regressions)}")
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,76 @@
+import argparse
+import contextlib
+import io
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from PIL import Image
+
+from optimize_images import convert_to_webp
+
+# Benchmark for convert_to_webp: 1 job vs N jobs on a synthetic image set.
+# The set mixes a few large banners with many small icons and thumbnails, roughly like assets/img.
+
+SIZES = [
+    ((1920, 1080), 0.05),  # banners / hero backgrounds
+    ((1024, 768), 0.15),
+    ((512, 512), 0.30),
+    ((128, 128), 0.50),    # icons, wallet, footer images
+]
+
+def make_image(size, rng):
+    # Noise over a gradient compresses like a photo; pure flat colour would be unrealistically cheap
+    noise = Image.effect_noise(size, rng.randint(20, 80))
+    gradient = Image.linear_gradient('L').resize(size)
+    flat = Image.new('L', size, rng.randint(0, 255))
+    return Image.merge('RGB', (noise, gradient, flat))
+
+def generate_images(directory, count, seed=1):
+    rng = random.Random(seed)
+    total = 0
+    for i in range(count):
+        size = rng.choices([s for s, _ in SIZES], weights=[w for _, w in SIZES])[0]
+        path = Path(directory) / f"img_{i:04d}{'.png' if i % 2 else '.jpg'}"
+        make_image(size, rng).save(path)
+        total += path.stat().st_size
+    return total
+
+def run(directory, jobs, quality):
+    cache_path = os.path.join(directory, '.bench-cache.json')
+    started = time.perf_counter()
+    # The per-file report is noise here, only the totals matter
+    with contextlib.redirect_stdout(io.StringIO()):
+        stats = convert_to_webp(directory, quality=quality, cache_path=cache_path, force=True, jobs=jobs)
+    return time.perf_counter() - started, stats
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark convert_to_webp with 1 job vs N jobs.")
+    parser.add_argument('--images', type=int, default=400)
+    parser.add_argument('--jobs', '-j', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--quality', type=int, default=80)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args(argv)
+
+    directory = tempfile.mkdtemp(prefix='bench-webp-')
+    try:
+        print(f"Generating {args.images} synthetic images in {directory}")
+        total = generate_images(directory, args.images, args.seed)
+        print(f"Source Size: {total / (1024*1024):.2f} MB")
+
+        serial, serial_stats = run(directory, 1, args.quality)
+        parallel, parallel_stats = run(directory, args.jobs, args.quality)
+
+        print("-" * 30)
+        print(f"1 job:   {serial:.2f}s ({serial_stats['converted']} images, {serial_stats['errors']} errors)")
+        print(f"{args.jobs} jobs: {parallel:.2f}s ({parallel_stats['converted']} images, {parallel_stats['errors']} errors)")
+        print(f"Speedup: {serial / parallel:.2f}x")
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+if __name__ == "__main__":
+    sys.exit(main())
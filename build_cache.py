@@ -0,0 +1,105 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+
+# Persistent build manifest shared by the build scripts.
+# Files are fingerprinted by content hash (sha256). The hash is memoised against the file's
+# size and mtime, so an unchanged file costs a single stat() rather than a full read.
+# Stages keep their own entries in a namespace, e.g. cache.lookup('webp', 'assets/img/1.png').
+
+CACHE_VERSION = 1
+CACHE_FILE_NAME = '.build-cache.json'
+DEFAULT_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), CACHE_FILE_NAME)
+
+def hash_file(path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def hash_text(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+class BuildCache:
+    def __init__(self, path=DEFAULT_CACHE_PATH):
+        self.path = Path(path)
+        self.base_dir = self.path.resolve().parent
+        self.data = {'version': CACHE_VERSION, 'files': {}, 'entries': {}}
+        self.dirty = False
+        if self.path.exists():
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                if data.get('version') == CACHE_VERSION:
+                    self.data = data
+                else:
+                    print(f"Build cache {self.path} has an old format, starting fresh")
+            except (OSError, ValueError) as e:
+                print(f"Ignoring unreadable build cache {self.path}: {e}")
+
+    def key(self, path):
+        # Paths are stored relative to the cache file so the cache survives moving the checkout
+        return Path(os.path.relpath(Path(path).resolve(), self.base_dir)).as_posix()
+
+    def fingerprint(self, path):
+        # Returns the content hash of path, or None if it doesn't exist
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        key = self.key(path)
+        memo = self.data['files'].get(key)
+        if memo and memo[0] == st.st_size and memo[1] == st.st_mtime_ns:
+            return memo[2]
+        digest = hash_file(path)
+        self.data['files'][key] = [st.st_size, st.st_mtime_ns, digest]
+        self.dirty = True
+        return digest
+
+    def lookup(self, namespace, key):
+        return self.data['entries'].get(namespace, {}).get(key)
+
+    def store(self, namespace, key, entry):
+        self.data['entries'].setdefault(namespace, {})[key] = entry
+        self.dirty = True
+
+    def save(self):
+        if not self.dirty:
+            return
+        # Write to a temp file first so an interrupted build never leaves a corrupt cache
+        tmp_path = self.path.with_name(self.path.name + '.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.data, f, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.path)
+        self.dirty = False
+
+# Set by build_pipeline.run_pipeline for --dry-run. Stages that write files other than the page
+# they are given (bundles, fingerprinted copies, the sprite sheet, game sources) check it and
+# skip those writes; the pipeline skips the page writes and finishers itself.
+_dry_run = False
+
+def set_dry_run(value):
+    global _dry_run
+    _dry_run = bool(value)
+
+def is_dry_run():
+    return _dry_run
+
+# One cache instance per file for the whole process, so pipeline stages that run file by file
+# share it and it is written once at the end of the build (see build_pipeline.run_pipeline).
+_shared_caches = {}
+
+def shared_cache(path=DEFAULT_CACHE_PATH):
+    key = str(Path(path).resolve())
+    if key not in _shared_caches:
+        _shared_caches[key] = BuildCache(path)
+    return _shared_caches[key]
+
+def cache_for_root(root_dir):
+    return shared_cache(os.path.join(root_dir, CACHE_FILE_NAME))
+
+def save_shared_caches():
+    for cache in _shared_caches.values():
+        cache.save()
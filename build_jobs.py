@@ -0,0 +1,42 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# Process pool helpers shared by the build scripts that do CPU heavy work per file
+# (image encoding, compression). Workers must be module level functions that take plain
+# arguments and return plain data, since they run in other processes.
+
+def run_batch(worker, batch):
+    return [worker(*args) for _, args in batch]
+
+def make_batches(pending, workers):
+    # pending is a list of (source size, worker args).
+    # Largest files first so big ones start early instead of straggling at the end.
+    # Small files are grouped so each task carries roughly the same number of bytes,
+    # which keeps the per-task process overhead low without unbalancing the workers.
+    pending = sorted(pending, key=lambda job: job[0], reverse=True)
+    total = sum(job[0] for job in pending)
+    budget = max(1, total // (workers * 4))
+    batches = []
+    batch = []
+    batch_bytes = 0
+    for job in pending:
+        batch.append(job)
+        batch_bytes += job[0]
+        if batch_bytes >= budget:
+            batches.append(batch)
+            batch = []
+            batch_bytes = 0
+    if batch:
+        batches.append(batch)
+    return batches
+
+def run_jobs(worker, pending, jobs, label='files'):
+    # Yields worker results as they complete, in a process pool when jobs > 1
+    if jobs > 1 and len(pending) > 1:
+        print(f"Processing {len(pending)} {label} with {jobs} workers")
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            futures = [pool.submit(run_batch, worker, batch) for batch in make_batches(pending, jobs)]
+            for future in as_completed(futures):
+                yield from future.result()
+    else:
+        for _, args in pending:
+            yield worker(*args)
@@ -0,0 +1,199 @@
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+
+from apply_lazy_loading import loading_priority_stage
+from build_cache import save_shared_caches, set_dry_run
+from bundle_scripts import bundle_stage
+from critical_css import critical_css_stage
+from fingerprint_assets import MANIFEST_NAME, fingerprint_stage, is_fingerprinted, restore_stage, write_outputs
+from fix_broken_webp_links import fix_webp_stage
+from inline_images import inline_stage, prepare_sprites, report_inlining
+from migrate_codebase import migrate_extensions_stage
+from precache_games import game_assets_stage, write_service_worker
+from prerender_catalog import prerender_stage, write_catalog
+from responsive_images import srcset_stage
+from update_html_links import html_links_stage, refresh_pruned
+
+# Single-walk build runner.
+# The standalone scripts each walk the whole tree and rewrite every file on their own,
+# so a full build used to read/write each page once per script.
+# Here the tree is walked once, each text file is loaded once, every stage runs on the
+# in-memory content, and the file is written only if the final content differs.
+
+# Ordered registry of text transform stages.
+# name -> (file suffixes the stage applies to, stage function)
+# A stage function takes (content, file_path, root_dir) and returns the new content.
+STAGES = {
+    # First, so every other stage sees the original asset names (see fingerprint_assets.py)
+    'restore-fingerprints': (('.html', '.json', '.xml'), restore_stage),
+    'html-links': (('.html',), html_links_stage),
+    # Early, so the extracted game scripts and styles go through bundling and fingerprinting
+    'game-assets': (('.html',), game_assets_stage),
+    # Before the image stages, so the rendered cards get the same treatment as hand written markup
+    'prerender-catalog': (('.html',), prerender_stage),
+    # Extension migration must run before the webp fixer so broken links it creates get reverted
+    'migrate-extensions': (('.html', '.css', '.js', '.json', '.xml', '.txt', '.md'), migrate_extensions_stage),
+    'fix-webp': (('.html', '.css', '.js', '.json', '.xml'), fix_webp_stage),
+    'srcset': (('.html',), srcset_stage),
+    # After srcset: images that got a srcset are big enough to be left alone
+    'inline-images': (('.html',), inline_stage),
+    # Runs after srcset so the preload links can carry imagesrcset/imagesizes
+    'loading-priority': (('.html',), loading_priority_stage),
+    # Last, so it sees the final stylesheet links and markup
+    'critical-css': (('.html',), critical_css_stage),
+    'bundle-js': (('.html',), bundle_stage),
+    # Last: every reference is final by now
+    'fingerprint': (('.html', '.json', '.xml'), fingerprint_stage),
+}
+
+# Run once before the walk for stages that plan from the whole site, so the plan is made from
+# the tree as it was at the start of the build and not from a mix of rewritten and pending pages.
+# Site-wide files written here are walked like any other, so the fingerprint stage reaches them
+# in the same build. name -> function(root_dir)
+PREPARERS = {
+    # Before the pages are pointed at the pruned vendor stylesheets
+    'html-links': refresh_pruned,
+    'prerender-catalog': write_catalog,
+    'inline-images': prepare_sprites,
+}
+
+# Run once after the walk (unless dry running) for stages that write site-wide outputs.
+# name -> function(root_dir)
+FINISHERS = {
+    'inline-images': report_inlining,
+    'fingerprint': write_outputs,
+    # Reads the final pages, so it has to come after every stage's output is on disk
+    'game-assets': write_service_worker,
+}
+
+DEFAULT_STAGES = list(STAGES)
+
+SKIP_DIRS = {'node_modules', '.git'}
+
+def iter_files(root_dir, suffixes):
+    for root, dirs, files in os.walk(root_dir):
+        # Prune in place so os.walk never descends into skipped directories
+        dirs[:] = [d for d in dirs if d not in SKIP_DIRS]
+        for file in files:
+            # Dotfiles are build state (e.g. .build-cache.json), not site content
+            if file.startswith('.'):
+                continue
+            # Generated outputs: content-hashed copies must never change, the manifest is derived
+            if is_fingerprinted(file) or file == MANIFEST_NAME:
+                continue
+            file_path = Path(root) / file
+            if file_path.suffix in suffixes:
+                yield file_path
+
+def run_pipeline(root_dir, stage_names=None, dry_run=False):
+    stage_names = list(stage_names or DEFAULT_STAGES)
+    for name in stage_names:
+        if name not in STAGES:
+            raise ValueError(f"Unknown stage: {name}")
+
+    stages = [(name, STAGES[name][0], STAGES[name][1]) for name in stage_names]
+    suffixes = set()
+    for _, stage_suffixes, _ in stages:
+        suffixes.update(stage_suffixes)
+
+    stats = {name: {'seconds': 0.0, 'files': 0, 'changed': 0, 'bytes': 0} for name in stage_names}
+    totals = {'files_read': 0, 'files_written': 0, 'bytes_read': 0, 'bytes_written': 0, 'errors': 0}
+
+    started = time.perf_counter()
+    # Stages check this before writing anything besides the page they are given
+    # (bundles, fingerprinted copies, the sprite sheet, game sources)
+    set_dry_run(dry_run)
+    try:
+        for name in stage_names:
+            if name in PREPARERS:
+                PREPARERS[name](root_dir)
+        for file_path in iter_files(root_dir, suffixes):
+            try:
+                # newline='' keeps the original line endings so untouched files round-trip exactly
+                with open(file_path, 'r', encoding='utf-8', newline='') as f:
+                    content = f.read()
+            except (OSError, UnicodeDecodeError) as e:
+                print(f"Error reading {file_path}: {e}")
+                totals['errors'] += 1
+                continue
+
+            totals['files_read'] += 1
+            totals['bytes_read'] += len(content.encode('utf-8'))
+
+            new_content = content
+            for name, stage_suffixes, stage in stages:
+                if file_path.suffix not in stage_suffixes:
+                    continue
+                stage_stats = stats[name]
+                t0 = time.perf_counter()
+                try:
+                    result = stage(new_content, file_path, root_dir)
+                except Exception as e:
+                    print(f"Error in stage {name} for {file_path}: {e}")
+                    totals['errors'] += 1
+                    result = new_content
+                stage_stats['seconds'] += time.perf_counter() - t0
+                stage_stats['files'] += 1
+                stage_stats['bytes'] += len(new_content)
+                if result != new_content:
+                    stage_stats['changed'] += 1
+                    new_content = result
+
+            if new_content != content:
+                totals['files_written'] += 1
+                totals['bytes_written'] += len(new_content.encode('utf-8'))
+                if not dry_run:
+                    with open(file_path, 'w', encoding='utf-8', newline='') as f:
+                        f.write(new_content)
+    finally:
+        set_dry_run(False)
+
+    if not dry_run:
+        for name in stage_names:
+            if name in FINISHERS:
+                FINISHERS[name](root_dir)
+        # Stages memoise expensive lookups in the shared build cache; persist them once per build
+        save_shared_caches()
+    totals['seconds'] = time.perf_counter() - started
+    return stats, totals
+
+def print_report(stats, totals, dry_run=False):
+    print("-" * 30)
+    print(f"{'Stage':<22}{'Time (ms)':>11}{'Files':>8}{'Changed':>9}{'KB':>10}")
+    for name, s in stats.items():
+        print(f"{name:<22}{s['seconds'] * 1000:>11.1f}{s['files']:>8}{s['changed']:>9}{s['bytes'] / 1024:>10.1f}")
+    print("-" * 30)
+    print(f"Pipeline Complete{' (dry run)' if dry_run else ''}.")
+    print(f"Files Read: {totals['files_read']} ({totals['bytes_read'] / 1024:.1f}KB)")
+    print(f"Files Written: {totals['files_written']} ({totals['bytes_written'] / 1024:.1f}KB)")
+    print(f"Errors: {totals['errors']}")
+    print(f"Total Time: {totals['seconds']:.2f}s")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the asset pipeline over the site in a single walk.")
+    parser.add_argument('root', nargs='?', default=os.path.dirname(os.path.abspath(__file__)),
+                        help="site root (defaults to this script's directory)")
+    parser.add_argument('--stages', default=','.join(DEFAULT_STAGES),
+                        help="comma separated, ordered list of stages to run")
+    parser.add_argument('--dry-run', action='store_true', help="run all stages but don't write any files")
+    parser.add_argument('--list', action='store_true', help="list available stages and exit")
+    args = parser.parse_args(argv)
+
+    if args.list:
+        for name, (suffixes, _) in STAGES.items():
+            print(f"{name:<22}{' '.join(suffixes)}")
+        return 0
+
+    stage_names = [s.strip() for s in args.stages.split(',') if s.strip()]
+    try:
+        stats, totals = run_pipeline(args.root, stage_names, dry_run=args.dry_run)
+    except ValueError as e:
+        parser.error(str(e))
+    print_report(stats, totals, dry_run=args.dry_run)
+    return 1 if totals['errors'] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
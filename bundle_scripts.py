@@ -0,0 +1,218 @@
+import json
+import os
+import posixpath
+import re
+import sys
+from pathlib import Path
+
+from build_cache import hash_text, is_dry_run
+from html_utils import is_local_url, iter_elements, resolve_local
+from minify_assets import tokenize_js
+
+# Script bundling.
+# Most pages load a dozen or more local scripts one tag at a time (jquery, bootstrap, gsap, ...).
+# Each run of consecutive local classic scripts is concatenated, in document order, into one
+# content-hashed bundle (bundle.<hash>.js next to the first script) with a line-level source map,
+# and the run is replaced by a single tag. Pages that load the same set of scripts share a bundle.
+# The bundle tag keeps the original sources in data-bundle, so re-running the stage rebuilds from
+# the sources instead of bundling the bundle.
+#
+# The bundle is deferred unless an inline script after it runs straight away (i.e. not from a
+# DOMContentLoaded/load handler) and so needs the libraries to be there while the page parses.
+
+BUNDLE_ATTRIBUTE = 'data-bundle'
+BUNDLE_PREFIX = 'bundle.'
+# Runs shorter than this are left alone: there is nothing to save on a single request
+MIN_BUNDLE_SCRIPTS = 2
+
+# Bundles built during this run, keyed by the (path, mtime) of their scripts
+_bundles = {}
+
+source_map_comment_pattern = re.compile(r'^[ \t]*//[#@] sourceMappingURL=.*$', re.MULTILINE)
+
+VLQ_CHARS = 'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/'
+
+def vlq(value):
+    # Base64 VLQ encoding used by source map v3 mappings
+    value = (-value << 1) | 1 if value < 0 else value << 1
+    out = ''
+    while True:
+        digit = value & 31
+        value >>= 5
+        if value:
+            digit |= 32
+        out += VLQ_CHARS[digit]
+        if not value:
+            return out
+
+def is_bundleable(attributes):
+    # Local classic scripts whose loading behaviour doesn't change when concatenated
+    if not is_local_url(attributes.get('src', '')):
+        return False
+    if attributes.get('type', 'text/javascript').lower() not in ('', 'text/javascript', 'application/javascript'):
+        return False
+    return not any(name in attributes for name in ('async', 'nomodule', 'integrity', 'crossorigin'))
+
+def runs_after_dom(body):
+    # True if an inline script only registers a DOMContentLoaded/load handler,
+    # so it is safe for the libraries before it to be deferred
+    tokens = [value for kind, value in tokenize_js(body) if kind not in ('ws', 'newline', 'comment')]
+    if tokens[:4] in (['document', '.', 'addEventListener', '('], ['window', '.', 'addEventListener', '(']):
+        if len(tokens) < 5 or tokens[4].strip('\'"') not in ('DOMContentLoaded', 'load'):
+            return False
+        depth = 0
+        for i, token in enumerate(tokens[3:], 3):
+            if token in ('(', '[', '{'):
+                depth += 1
+            elif token in (')', ']', '}'):
+                depth -= 1
+                if depth == 0:
+                    return tokens[i + 1:] in ([], [';'])
+    return False
+
+def find_runs(content):
+    # Returns the runs of bundleable scripts as {'scripts': [(match, [srcs])...], 'blocking': bool},
+    # blocking meaning an inline script after the run executes immediately
+    runs = []
+    current = None
+    for match, name, attributes, _ in iter_elements(content):
+        if name != 'script':
+            continue
+        if BUNDLE_ATTRIBUTE in attributes or is_bundleable(attributes):
+            srcs = attributes[BUNDLE_ATTRIBUTE].split() if BUNDLE_ATTRIBUTE in attributes else [attributes['src']]
+            if current is None:
+                current = {'scripts': [], 'blocking': False}
+                runs.append(current)
+            current['scripts'].append((match, srcs))
+            continue
+        current = None
+        script_type = attributes.get('type', '').lower()
+        if 'src' not in attributes and script_type in ('', 'text/javascript', 'application/javascript'):
+            end = content.find('</script>', match.end())
+            body = content[match.end():end if end != -1 else len(content)]
+            # A blocking inline script needs every run before it to have executed already
+            if not runs_after_dom(body):
+                for run in runs:
+                    run['blocking'] = True
+    return runs
+
+def build_bundle(sources, out_dir):
+    # sources: [(path, text)]. Returns (bundle name, code, source map) for the concatenation.
+    lines = []
+    mappings = []
+    previous_source = previous_line = 0
+    for index, (path, text) in enumerate(sources):
+        text = source_map_comment_pattern.sub('', text).rstrip()
+        source_lines = text.split('\n') if text else []
+        for line_number in range(len(source_lines)):
+            # One segment per generated line: column 0 -> (source, line, column 0)
+            mappings.append('A' + vlq(index - previous_source) + vlq(line_number - previous_line) + 'A')
+            previous_source, previous_line = index, line_number
+        lines.extend(source_lines)
+        # Guard against a file that doesn't end its last statement
+        lines.append(';')
+        mappings.append('')
+    code = '\n'.join(lines)
+    name = f"{BUNDLE_PREFIX}{hash_text(code)[:10]}.js"
+    code += f'\n//# sourceMappingURL={name}.map\n'
+    source_map = {
+        'version': 3,
+        'file': name,
+        'sources': [Path(os.path.relpath(path, out_dir)).as_posix() for path, _ in sources],
+        'names': [],
+        'mappings': ';'.join(mappings),
+    }
+    return name, code, source_map
+
+def write_if_missing(path, text):
+    if path.exists() or is_dry_run():
+        return False
+    tmp_path = path.with_name(path.name + '.tmp')
+    with open(tmp_path, 'w', encoding='utf-8', newline='') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+    return True
+
+def write_bundle(paths):
+    # Builds (once per script set and build) and writes the bundle for these scripts.
+    # Returns (bundle name, bytes).
+    key = tuple((str(path), path.stat().st_mtime_ns) for path in paths)
+    if key not in _bundles:
+        sources = []
+        for path in paths:
+            with open(path, 'r', encoding='utf-8') as f:
+                sources.append((path, f.read()))
+        out_dir = paths[0].parent
+        name, code, source_map = build_bundle(sources, out_dir)
+        write_if_missing(out_dir / name, code)
+        write_if_missing(out_dir / f"{name}.map", json.dumps(source_map, separators=(',', ':')))
+        _bundles[key] = (name, len(code.encode('utf-8')))
+    return _bundles[key]
+
+def remove_tag(content, match):
+    # Span of a whole <script ...></script> element, plus its line if it sits on its own
+    end = content.find('</script>', match.end())
+    end = end + len('</script>') if end != -1 else match.end()
+    start = match.start()
+    line_start = content.rfind('\n', 0, start) + 1
+    line_end = content.find('\n', end)
+    line_end = len(content) if line_end == -1 else line_end
+    if not content[line_start:start].strip() and not content[end:line_end].strip():
+        return line_start, min(line_end + 1, len(content))
+    return start, end
+
+def bundle_page(content, file_path, root_dir):
+    # Returns the new content and a list of (bundle name, script count, bytes, deferred)
+    edits = []
+    report = []
+    for run in find_runs(content):
+        scripts, blocking = run['scripts'], run['blocking']
+        srcs = [src for _, run_srcs in scripts for src in run_srcs]
+        if len(srcs) < MIN_BUNDLE_SCRIPTS:
+            continue
+        paths = [resolve_local(src, file_path, root_dir) for src in srcs]
+        if any(path is None or not path.is_file() for path in paths):
+            # A missing script would silently disappear from the page; leave the run as it is
+            continue
+        name, size = write_bundle(paths)
+
+        src = posixpath.join(posixpath.dirname(srcs[0].split('?')[0].split('#')[0]), name)
+        defer = '' if blocking else ' defer'
+        tag = f'<script src="{src}"{defer} {BUNDLE_ATTRIBUTE}="{" ".join(srcs)}"></script>'
+        # The bundle takes the place of the last script in the run, the others go
+        for match, _ in scripts[:-1]:
+            edits.append(remove_tag(content, match) + ('',))
+        last = scripts[-1][0]
+        end = content.find('</script>', last.end())
+        edits.append((last.start(), end + len('</script>'), tag))
+        report.append((name, len(srcs), size, not blocking))
+
+    for start, end, replacement in sorted(edits, reverse=True):
+        content = content[:start] + replacement + content[end:]
+    return content, report
+
+def bundle_stage(content, file_path, root_dir):
+    # Pipeline stage wrapper (see build_pipeline.py)
+    new_content, report = bundle_page(content, file_path, root_dir)
+    for name, count, size, deferred in report:
+        print(f"[BUNDLE] {os.path.relpath(file_path, root_dir)}: {count} scripts -> {name} "
+              f"({size/1024:.1f}KB{', deferred' if deferred else ''})")
+    return new_content
+
+def bundle_scripts(root_dir):
+    for root, dirs, files in os.walk(root_dir):
+        dirs[:] = [d for d in dirs if d not in ('node_modules', '.git')]
+        for file in files:
+            if not file.endswith('.html'):
+                continue
+            file_path = os.path.join(root, file)
+            with open(file_path, 'r', encoding='utf-8', newline='') as f:
+                content = f.read()
+            new_content = bundle_stage(content, file_path, root_dir)
+            if new_content != content:
+                with open(file_path, 'w', encoding='utf-8', newline='') as f:
+                    f.write(new_content)
+
+if __name__ == "__main__":
+    root = sys.argv[1] if len(sys.argv) > 1 else os.path.dirname(os.path.abspath(__file__))
+    bundle_scripts(root)
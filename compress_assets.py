@@ -0,0 +1,164 @@
+import argparse
+import os
+import sys
+import zlib
+from pathlib import Path
+
+from build_cache import BuildCache, CACHE_FILE_NAME
+from build_jobs import run_jobs
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Precompressed sidecars.
+# Writes file.gz (and file.br when the brotli module is installed) next to every text asset above
+# MIN_COMPRESS_SIZE, at maximum compression, so the host can serve them as-is instead of
+# compressing on the fly at a low level on every request.
+# Files are streamed through the compressors in chunks, in a process pool, and skipped when the
+# source, the settings and the sidecars are all unchanged since the last build.
+# Run this last, after the pipeline and minify_assets.py, so it sees the final outputs.
+
+COMPRESS_SUFFIXES = {'.html', '.css', '.js', '.json', '.svg', '.xml', '.map', '.txt'}
+# Below this a compressed response barely beats the raw one once headers are counted
+MIN_COMPRESS_SIZE = 1024
+CHUNK_SIZE = 256 * 1024
+GZIP_LEVEL = 9
+BROTLI_QUALITY = 11
+
+SKIP_DIRS = {'node_modules', '.git'}
+
+def compression_settings(use_brotli):
+    # Everything that affects the sidecar bytes. A change here invalidates the cached entries.
+    settings = {'gzip': GZIP_LEVEL}
+    if use_brotli:
+        settings['brotli'] = BROTLI_QUALITY
+        settings['brotli_version'] = getattr(brotli, '__version__', '')
+    return settings
+
+def sidecars(file_path, settings):
+    paths = [file_path + '.gz']
+    if 'brotli' in settings:
+        paths.append(file_path + '.br')
+    return paths
+
+def is_up_to_date(cache, file_path, settings):
+    entry = cache.lookup('compress', cache.key(file_path))
+    if not entry or entry.get('settings') != settings:
+        return False
+    if entry.get('source') != cache.fingerprint(file_path):
+        return False
+    # A missing or replaced sidecar no longer matches its stored hash and gets rebuilt
+    return all(entry.get('outputs', {}).get(os.path.basename(path)) == cache.fingerprint(path)
+               for path in sidecars(file_path, settings))
+
+def stream_to(file_path, out_path, compressor):
+    # compressor is (process(chunk) -> bytes, finish() -> bytes); written via a temp file
+    # so a half written sidecar is never served
+    process, finish = compressor
+    tmp_path = out_path + '.tmp'
+    with open(file_path, 'rb') as src, open(tmp_path, 'wb') as dst:
+        for chunk in iter(lambda: src.read(CHUNK_SIZE), b''):
+            dst.write(process(chunk))
+        dst.write(finish())
+    os.replace(tmp_path, out_path)
+    return os.stat(out_path).st_size
+
+def gzip_compressor():
+    # wbits=31 makes zlib emit a gzip container; its header carries no name or mtime,
+    # so the output is byte-identical between builds
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+    return compressor.compress, compressor.flush
+
+def compress_file(file_path, settings):
+    # Runs in a worker process, so it only returns plain data and never touches the cache
+    try:
+        sizes = {'raw': os.stat(file_path).st_size}
+        sizes['gz'] = stream_to(file_path, file_path + '.gz', gzip_compressor())
+        if 'brotli' in settings:
+            compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+            sizes['br'] = stream_to(file_path, file_path + '.br', (compressor.process, compressor.finish))
+        return {'file': file_path, 'sizes': sizes, 'error': None}
+    except Exception as e:
+        return {'file': file_path, 'error': str(e)}
+
+def iter_assets(root_dir, min_size):
+    for root, dirs, files in os.walk(root_dir):
+        dirs[:] = [d for d in dirs if d not in SKIP_DIRS]
+        for file in files:
+            if file.startswith('.') or Path(file).suffix.lower() not in COMPRESS_SUFFIXES:
+                continue
+            file_path = os.path.join(root, file)
+            size = os.stat(file_path).st_size
+            if size >= min_size:
+                yield file_path, size
+
+def compress_assets(root_dir, min_size=MIN_COMPRESS_SIZE, use_brotli=True, force=False, jobs=None):
+    jobs = jobs or os.cpu_count() or 1
+    use_brotli = use_brotli and brotli is not None
+    if not use_brotli:
+        print("brotli module not available, writing .gz sidecars only" if brotli is None else "Writing .gz sidecars only")
+    cache = BuildCache(os.path.join(root_dir, CACHE_FILE_NAME))
+    settings = compression_settings(use_brotli)
+
+    pending = []
+    skips = 0
+    for file_path, size in iter_assets(root_dir, min_size):
+        if not force and is_up_to_date(cache, file_path, settings):
+            skips += 1
+            continue
+        pending.append((size, (file_path, settings)))
+
+    count = errors = 0
+    totals = {'raw': 0, 'gz': 0, 'br': 0}
+    for result in run_jobs(compress_file, pending, jobs):
+        rel_path = os.path.relpath(result['file'], root_dir)
+        if result['error']:
+            print(f"Error compressing {rel_path}: {result['error']}")
+            errors += 1
+            continue
+        sizes = result['sizes']
+        for name, size in sizes.items():
+            totals[name] += size
+        br = f" | br {sizes['br']/1024:.1f}KB" if 'br' in sizes else ''
+        print(f"Compressed: {rel_path} | {sizes['raw']/1024:.1f}KB -> gz {sizes['gz']/1024:.1f}KB{br}")
+        count += 1
+
+        file_path = result['file']
+        cache.store('compress', cache.key(file_path), {
+            'source': cache.fingerprint(file_path),
+            'settings': settings,
+            'outputs': {os.path.basename(path): cache.fingerprint(path) for path in sidecars(file_path, settings)},
+        })
+
+    cache.save()
+
+    print("-" * 30)
+    print(f"Compression Complete.")
+    print(f"Files Compressed: {count}")
+    print(f"Skipped (unchanged): {skips}")
+    if count:
+        br = f", br {totals['br']/1024:.1f}KB" if use_brotli else ''
+        print(f"Raw: {totals['raw']/1024:.1f}KB -> gz {totals['gz']/1024:.1f}KB{br}")
+    print(f"Errors: {errors}")
+    return {'compressed': count, 'skipped': skips, 'errors': errors, 'sizes': totals}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write precompressed .gz/.br sidecars for the site's text assets.")
+    parser.add_argument('root', nargs='?', default=os.path.dirname(os.path.abspath(__file__)),
+                        help="site root (defaults to this script's directory)")
+    parser.add_argument('--jobs', '-j', type=int, default=os.cpu_count() or 1,
+                        help="number of compressor processes (default: CPU count)")
+    parser.add_argument('--min-size', type=int, default=MIN_COMPRESS_SIZE,
+                        help=f"skip files smaller than this many bytes (default: {MIN_COMPRESS_SIZE})")
+    parser.add_argument('--no-brotli', action='store_true', help="only write .gz sidecars")
+    parser.add_argument('--force', action='store_true', help="recompress even if the cache says nothing changed")
+    args = parser.parse_args(argv)
+
+    stats = compress_assets(args.root, min_size=args.min_size, use_brotli=not args.no_brotli,
+                            force=args.force, jobs=args.jobs)
+    return 1 if stats['errors'] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,175 @@
+import os
+import posixpath
+import re
+from pathlib import Path
+
+from build_cache import cache_for_root, hash_text
+from html_utils import iter_elements, resolve_local, set_attributes
+from minify_assets import ALWAYS_USED_TAGS, parse_stylesheet, prune_stylesheet, serialize_stylesheet
+
+# Per-page critical CSS.
+# For each page the elements that render above the fold (everything up to the end of the first
+# banner/hero/breadcrumb section, or the first CRITICAL_ELEMENT_LIMIT elements) are collected,
+# the page's stylesheets are pruned down to the rules that can match them, and the result is
+# inlined in a <style data-critical> block. The stylesheet links themselves become non-blocking
+# (media="print" swapped to "all" on load) with a <noscript> fallback.
+# This runs as a pipeline stage after html-links, so it sees the minified/pruned stylesheet links.
+# Pages built from the same template load the same stylesheets and show the same elements above
+# the fold, so the pruned CSS is computed once per (stylesheet set, fold selectors) and shared;
+# only the url() rebasing is done per page.
+
+FOLD_HINTS = ('banner', 'hero', 'breadcrumb')
+# Containers that start out hidden: their own rules are critical (they keep them hidden),
+# the rules for what's inside them are not
+HIDDEN_CONTAINER_HINTS = ('offcanvas', 'popup', 'modal', 'sub-menu', 'dropdown-menu', 'collapse')
+CRITICAL_ELEMENT_LIMIT = 400
+
+DEFERRED_ATTRIBUTE = 'data-critical-deferred'
+
+critical_style_pattern = re.compile(r'[ \t]*<style\b[^>]*\bdata-critical\b[^>]*>.*?</style>\n?', re.DOTALL | re.IGNORECASE)
+critical_noscript_pattern = re.compile(rf'[ \t]*<noscript\b[^>]*\b{DEFERRED_ATTRIBUTE}\b[^>]*>.*?</noscript>\n?', re.DOTALL | re.IGNORECASE)
+url_pattern = re.compile(r'''url\((['"]?)([^'")]+)\1\)''')
+
+# Parsed stylesheets, keyed by (path, content hash), so each one is parsed once per build
+_stylesheets = {}
+
+def template_key(css_hash, used):
+    # Identifies what the pruned CSS depends on: the stylesheets and the above the fold selectors
+    return hash_text(css_hash + repr([sorted(used['classes']), sorted(used['ids']), sorted(used['tags'])]))
+
+def critical_parts(sheets, used, cache, css_hash):
+    # The pruned (not yet rebased) CSS of each stylesheet, computed once per template
+    key = template_key(css_hash, used)
+    entry = cache.lookup('critical-css-templates', key)
+    if entry is None:
+        entry = [serialize_stylesheet(prune_stylesheet(load_stylesheet(path, digest), used, standalone=False))
+                 for path, digest in sheets]
+        cache.store('critical-css-templates', key, entry)
+    return key, entry
+
+def restore_page(content):
+    # Undoes a previous run so the stage always starts from the authored markup
+    content = critical_style_pattern.sub('', content)
+    content = critical_noscript_pattern.sub('', content)
+    pieces = []
+    last = 0
+    for match, name, attributes, _ in iter_elements(content):
+        if name == 'link' and DEFERRED_ATTRIBUTE in attributes:
+            pieces.append(content[last:match.start()])
+            pieces.append(set_attributes(match.group(0), {'media': None, 'onload': None, DEFERRED_ATTRIBUTE: None}))
+            last = match.end()
+    pieces.append(content[last:])
+    return ''.join(pieces)
+
+def stylesheet_links(content):
+    # <link rel="stylesheet"> tags in <head> that can be deferred, in document order
+    links = []
+    for match, name, attributes, ancestors in iter_elements(content):
+        if name == 'body':
+            break
+        if name != 'link' or 'stylesheet' not in attributes.get('rel', '').lower().split():
+            continue
+        # A link that already targets a media query isn't render-blocking in the same way; leave it
+        if attributes.get('media', 'all').lower() not in ('', 'all', 'screen'):
+            continue
+        links.append((match, attributes.get('href', '')))
+    return links
+
+def fold_selectors(content):
+    # Classes, ids and elements used above the fold
+    used = {'classes': set(), 'ids': set(), 'tags': set(ALWAYS_USED_TAGS), 'first_paint': True}
+    in_body = False
+    count = 0
+    fold_depth = None
+    for match, name, attributes, ancestors in iter_elements(content):
+        if name == 'body':
+            in_body = True
+        if not in_body:
+            continue
+        # Stop at the first element after the first banner/hero section has closed
+        if fold_depth is not None and len(ancestors) <= fold_depth:
+            break
+        count += 1
+        if count > CRITICAL_ELEMENT_LIMIT:
+            break
+        if any(hint in a.get('class', '').lower() for _, a in ancestors for hint in HIDDEN_CONTAINER_HINTS):
+            continue
+        used['tags'].add(name)
+        used['classes'].update(attributes.get('class', '').split())
+        used['ids'].update(attributes.get('id', '').split())
+        classes = attributes.get('class', '').lower()
+        if fold_depth is None and any(hint in classes for hint in FOLD_HINTS):
+            fold_depth = len(ancestors)
+    return used
+
+def rebase_urls(css, css_path, page_path):
+    # url()s in a stylesheet are relative to the stylesheet; once inlined they must be relative to the page
+    css_dir = os.path.dirname(os.path.abspath(css_path))
+    page_dir = os.path.dirname(os.path.abspath(page_path))
+
+    def replacement(match):
+        quote, url = match.groups()
+        if re.match(r'^([a-zA-Z][\w+.-]*:|/|#)', url):
+            return match.group(0)
+        target = os.path.normpath(os.path.join(css_dir, url))
+        rebased = Path(os.path.relpath(target, page_dir)).as_posix()
+        return f'url({quote}{rebased}{quote})'
+
+    return url_pattern.sub(replacement, css)
+
+def load_stylesheet(path, digest):
+    key = (str(path), digest)
+    if key not in _stylesheets:
+        with open(path, 'r', encoding='utf-8') as f:
+            _stylesheets[key] = parse_stylesheet(f.read())
+    return _stylesheets[key]
+
+def inline_critical_css(content, file_path, root_dir):
+    # Returns the new content and a short report (critical bytes, deferred links)
+    cache = cache_for_root(root_dir)
+    content = restore_page(content)
+    links = stylesheet_links(content)
+    if not links:
+        return content, None
+
+    sheets = []
+    for match, href in links:
+        path = resolve_local(href, file_path, root_dir)
+        if path is not None and path.is_file():
+            sheets.append((path, cache.fingerprint(path)))
+
+    page_hash = hash_text(content)
+    css_hash = hash_text(''.join(f"{path}:{digest}" for path, digest in sheets))
+    key = cache.key(file_path)
+    entry = cache.lookup('critical-css', key)
+    parts = None
+    if entry and entry['page'] == page_hash and entry['css'] == css_hash:
+        parts = cache.lookup('critical-css-templates', entry.get('template'))
+    if parts is None:
+        template, parts = critical_parts(sheets, fold_selectors(content), cache, css_hash)
+        cache.store('critical-css', key, {'page': page_hash, 'css': css_hash, 'template': template})
+    critical = ''.join(rebase_urls(css, path, file_path) for css, (path, _) in zip(parts, sheets))
+
+    # Defer every stylesheet link and put the critical block where the first one was
+    first, last_link = links[0][0], links[-1][0]
+    line_start = content.rfind('\n', 0, first.start()) + 1
+    indent = content[line_start:first.start()] if not content[line_start:first.start()].strip() else ''
+    pieces = [content[:first.start()], f'<style data-critical>{critical}</style>\n{indent}' if critical else '']
+    last = first.start()
+    for match, href in links:
+        pieces.append(content[last:match.start()])
+        pieces.append(set_attributes(match.group(0), {'media': 'print', 'onload': "this.media='all'", DEFERRED_ATTRIBUTE: ''}))
+        last = match.end()
+    fallback = ''.join(match.group(0) for match, _ in links)
+    pieces.append(f'\n{indent}<noscript {DEFERRED_ATTRIBUTE}>{fallback}</noscript>')
+    pieces.append(content[last:])
+    report = {'critical_bytes': len(critical.encode('utf-8')), 'deferred': len(links)}
+    return ''.join(pieces), report
+
+def critical_css_stage(content, file_path, root_dir):
+    # Pipeline stage wrapper (see build_pipeline.py)
+    new_content, report = inline_critical_css(content, file_path, root_dir)
+    if report:
+        print(f"[CRITICAL] {os.path.relpath(file_path, root_dir)}: {report['critical_bytes']/1024:.1f}KB inlined, "
+              f"{report['deferred']} stylesheets deferred")
+    return new_content
@@ -0,0 +1,263 @@
+import json
+import os
+import re
+import shutil
+import sys
+from pathlib import Path
+
+from build_cache import cache_for_root, hash_text, is_dry_run
+from bundle_scripts import BUNDLE_PREFIX
+from html_utils import site_origins
+
+# Content-hashed asset fingerprinting.
+# Every local asset a page, stylesheet, apps.json or sitemap.xml references is copied to
+# name.<hash>.ext next to the original, and the reference is rewritten to the copy. A changed asset
+# gets a new name, so the copies can be served with far-future, immutable cache headers.
+# The originals stay where they are: they are the sources every other stage reads.
+#
+# Stylesheet copies get their own url()s rewritten first, so a CSS hash covers the fonts and images
+# it pulls in. The pipeline runs 'restore-fingerprints' first and 'fingerprint' last, so the stages in
+# between always see the original names and a re-run converges on the same output.
+#
+# Outputs at the site root:
+#   asset-manifest.json   original path -> fingerprinted path (root relative)
+#   _headers              Cache-Control: immutable for every fingerprinted path (Netlify/Cloudflare
+#                         Pages format; hosts without _headers support ignore it)
+
+MANIFEST_NAME = 'asset-manifest.json'
+HEADERS_NAME = '_headers'
+HASH_LENGTH = 8
+IMMUTABLE_HEADER = 'Cache-Control: public, max-age=31536000, immutable'
+# Files that must keep their URL: browsers look for updates to a service worker at the URL it
+# was registered with (see precache_games.py)
+UNHASHED_NAMES = {'sw.js'}
+SKIP_DIRS = {'node_modules', '.git'}
+
+FINGERPRINT_SUFFIXES = {
+    '.css', '.js', '.webp', '.png', '.jpg', '.jpeg', '.gif', '.svg', '.avif', '.ico',
+    '.woff', '.woff2', '.ttf', '.otf', '.eot', '.mp4', '.webm', '.mp3', '.ogg', '.wav',
+}
+
+# A reference ends in a fingerprintable suffix followed by a delimiter, and starts after a quote, =,
+# (, comma, whitespace or tag end. The scan looks for the suffix (a literal '.', which the regex
+# engine can skip to) and walks back to the start in iter_refs: a pattern anchored at the start
+# of the reference has to be tried at every character of the page, inline CSS included.
+suffix_pattern = re.compile(
+    r'\.(?:' + '|'.join(re.escape(suffix[1:]) for suffix in sorted(FINGERPRINT_SUFFIXES, key=len, reverse=True))
+    + r''')(?=[?#"'\s),;<>\\]|$)''',
+    re.IGNORECASE,
+)
+# Besides word characters
+REF_CHARS = frozenset('./%@-')
+REF_START_AFTER = frozenset(' \t\n\r\f\v"\'=(,>')
+fingerprinted_pattern = re.compile(r'\.[0-9a-f]{8,}(\.[A-Za-z0-9]+)$')
+url_pattern = re.compile(r'''url\(\s*(['"]?)([^'")]+)\1\s*\)''')
+# Attributes recording original sources for a later run: data-bundle (bundle_scripts.py) and
+# data-inline/data-sprite (inline_images.py). Those must keep their original names.
+# Starts with the literal so the engine can skip ahead; the word boundary is checked in protected_spans
+source_attribute_pattern = re.compile(r'''data-(?:bundle|inline|sprite)\s*=\s*("[^"]*"|'[^']*')''')
+
+# Built during a run: original path -> fingerprinted path, and already content-hashed files (bundles)
+_manifest = {}
+_immutable = set()
+# Fingerprinted name per asset for this run, so each asset is hashed (and each stylesheet rewritten) once
+_names = {}
+# original_of() per path for this run: every reference to a copy would otherwise stat its original
+_originals = {}
+
+def is_fingerprinted(name):
+    return fingerprinted_pattern.search(name) is not None
+
+def fingerprint_name(path, digest):
+    return f"{path.stem}.{digest[:HASH_LENGTH]}{path.suffix}"
+
+def resolve_ref(ref, file_path, root_dir):
+    # Local file a reference points at, or None for external URLs
+    for origin in site_origins(root_dir):
+        if ref.startswith(origin + '/'):
+            return Path(root_dir) / ref[len(origin) + 1:]
+    if re.match(r'^[a-zA-Z][a-zA-Z0-9+.-]*:|^//', ref):
+        return None
+    if ref.startswith('/'):
+        return Path(root_dir) / ref.lstrip('/')
+    return Path(file_path).parent / ref
+
+def original_of(path):
+    # The source a fingerprinted copy was made from, or None if path isn't one
+    match = fingerprinted_pattern.search(path.name)
+    if not match:
+        return None
+    key = str(path)
+    if key not in _originals:
+        original = path.with_name(path.name[:match.start()] + match.group(1))
+        _originals[key] = original if original.is_file() else None
+    return _originals[key]
+
+def root_key(path, root_dir):
+    return Path(os.path.relpath(path, root_dir)).as_posix()
+
+def rewrite_css_urls(css, css_path, root_dir):
+    def replacement(match):
+        quote, url = match.groups()
+        path = resolve_ref(url.split('?')[0].split('#')[0], css_path, root_dir)
+        if path is None:
+            return match.group(0)
+        path = original_of(path) or path
+        new_name = fingerprint(path, root_dir)
+        if new_name is None:
+            return match.group(0)
+        base = url.split('?')[0].split('#')[0]
+        rest = url[len(base):]
+        directory = base.rsplit('/', 1)[0] + '/' if '/' in base else ''
+        return f'url({quote}{directory}{new_name}{rest}{quote})'
+
+    return url_pattern.sub(replacement, css)
+
+def fingerprint(path, root_dir):
+    # Makes sure the fingerprinted copy of an asset exists; returns its file name (None if it isn't an asset)
+    path = Path(path)
+    if path.suffix.lower() not in FINGERPRINT_SUFFIXES or path.name in UNHASHED_NAMES or not path.is_file():
+        return None
+    key = os.path.abspath(path)
+    if key in _names:
+        return _names[key]
+    if is_fingerprinted(path.name):
+        # Already content-hashed (script bundles): reference as-is, but still cache it forever
+        _names[key] = path.name
+        _immutable.add(root_key(path, root_dir))
+        return path.name
+    # Guard against @import / url() cycles
+    _names[key] = path.name
+
+    if path.suffix.lower() == '.css':
+        with open(path, 'r', encoding='utf-8') as f:
+            css = rewrite_css_urls(f.read(), path, root_dir)
+        name = fingerprint_name(path, hash_text(css))
+        target = path.with_name(name)
+        if not target.exists() and not is_dry_run():
+            with open(target, 'w', encoding='utf-8', newline='') as f:
+                f.write(css)
+    else:
+        digest = cache_for_root(root_dir).fingerprint(path)
+        name = fingerprint_name(path, digest)
+        target = path.with_name(name)
+        if not target.exists() and not is_dry_run():
+            # A copy, not a link: in-place rewrites of the original must never reach the immutable file
+            shutil.copyfile(path, target)
+
+    _names[key] = name
+    _manifest[root_key(path, root_dir)] = root_key(target, root_dir)
+    return name
+
+def is_word_char(char):
+    return char.isalnum() or char == '_'
+
+def protected_spans(content):
+    return [match.span(1) for match in source_attribute_pattern.finditer(content)
+            if match.start() == 0 or not is_word_char(content[match.start() - 1])]
+
+def iter_refs(content):
+    # Yields the (start, end) of every asset reference, in text order
+    for match in suffix_pattern.finditer(content):
+        dot = match.start()
+        # The name needs a stem: not '.css' alone, nor 'dir/.css'
+        if dot == 0 or not (is_word_char(content[dot - 1]) or content[dot - 1] in '%@-'):
+            continue
+        start = dot
+        while start > 0 and (content[start - 1] in REF_CHARS or is_word_char(content[start - 1])):
+            start -= 1
+        if content.startswith('//', start):
+            for scheme in ('https:', 'http:'):
+                if content[max(0, start - len(scheme)):start].lower() == scheme:
+                    start -= len(scheme)
+                    break
+        if start > 0 and content[start - 1] not in REF_START_AFTER:
+            continue
+        yield start, match.end()
+
+def rewrite_refs(content, file_path, root_dir, restore_only=False):
+    # Both the matches and the protected spans come in text order, so one pointer walks the spans
+    spans = protected_spans(content)
+    span_index = 0
+    pieces = []
+    last = 0
+    for ref_start, ref_end in iter_refs(content):
+        while span_index < len(spans) and spans[span_index][1] <= ref_start:
+            span_index += 1
+        if span_index < len(spans) and spans[span_index][0] <= ref_start:
+            continue
+        ref = content[ref_start:ref_end]
+        path = resolve_ref(ref, file_path, root_dir)
+        if path is None:
+            continue
+        original = original_of(path)
+        if restore_only:
+            if original is None:
+                continue
+            new_name = original.name
+        else:
+            new_name = fingerprint(original or path, root_dir)
+            if new_name is None:
+                continue
+        old_name = ref.rsplit('/', 1)[-1]
+        if new_name == old_name:
+            continue
+        pieces.append(content[last:ref_start])
+        pieces.append(ref[:len(ref) - len(old_name)] + new_name)
+        last = ref_end
+    if not pieces:
+        return content
+    pieces.append(content[last:])
+    return ''.join(pieces)
+
+def restore_stage(content, file_path, root_dir):
+    # Pipeline stage wrapper (see build_pipeline.py): back to the original asset names
+    return rewrite_refs(content, file_path, root_dir, restore_only=True)
+
+def fingerprint_stage(content, file_path, root_dir):
+    # Pipeline stage wrapper (see build_pipeline.py)
+    return rewrite_refs(content, file_path, root_dir)
+
+def remove_stale_copies(root_dir, live):
+    # Deletes fingerprinted copies and script bundles (with their source maps) that nothing
+    # referenced during this run: earlier revisions of changed assets would otherwise pile up
+    removed = 0
+    for root, dirs, files in os.walk(root_dir):
+        dirs[:] = [d for d in dirs if d not in SKIP_DIRS]
+        for file in files:
+            name = file[:-len('.map')] if file.endswith('.map') else file
+            if not is_fingerprinted(name):
+                continue
+            path = Path(root) / name
+            if root_key(path, root_dir) in live:
+                continue
+            # Only files this build made: a copy next to its original, or a bundle
+            if original_of(path) is None and not name.startswith(BUNDLE_PREFIX):
+                continue
+            os.remove(Path(root) / file)
+            removed += 1
+    return removed
+
+def write_outputs(root_dir):
+    # Writes asset-manifest.json and _headers for everything fingerprinted during this run
+    # and removes the copies it no longer uses
+    manifest = dict(sorted(_manifest.items()))
+    with open(os.path.join(root_dir, MANIFEST_NAME), 'w', encoding='utf-8', newline='') as f:
+        json.dump(manifest, f, indent=2)
+        f.write('\n')
+
+    lines = ['# Generated by fingerprint_assets.py: content-hashed files never change']
+    for path in sorted(set(manifest.values()) | _immutable):
+        lines.append(f"/{path}")
+        lines.append(f"  {IMMUTABLE_HEADER}")
+    with open(os.path.join(root_dir, HEADERS_NAME), 'w', encoding='utf-8', newline='') as f:
+        f.write('\n'.join(lines) + '\n')
+    removed = remove_stale_copies(root_dir, set(manifest.values()) | _immutable)
+    print(f"[FINGERPRINT] {len(manifest)} assets fingerprinted, {len(_immutable)} already hashed "
+          f"-> {MANIFEST_NAME}, {HEADERS_NAME}; {removed} stale copies removed")
+
+if __name__ == "__main__":
+    # Standalone: run just the fingerprint stages through the pipeline
+    from build_pipeline import main
+    root = sys.argv[1] if len(sys.argv) > 1 else os.path.dirname(os.path.abspath(__file__))
+    sys.exit(main([root, '--stages', 'restore-fingerprints,fingerprint']))
@@ -1,7 +1,59 @@
 import os
-import re
+import sys
 from pathlib import Path
 
+from reference_graph import GRAPH_FILE_NAME, asset_index, build_graph, extract_refs, print_report, resolve, split_url, write_graph
+
+def fix_webp_links(content, file_path, root_dir):
+    # Returns the new content and the number of links reverted.
+    # References come from the reference graph, so each one is resolved against the right base
+    # (the page for HTML, the stylesheet for CSS, the site root for JS/JSON) and every existence
+    # check is a lookup in the asset index instead of a stat() call.
+    file_path = Path(file_path)
+    index = asset_index(root_dir)
+    pieces = []
+    last = 0
+    reversions = 0
+
+    for start, end, ref, kind, base_dir in extract_refs(content, file_path, root_dir):
+        path, rest = split_url(ref)
+        if not path.lower().endswith('.webp') or start < last:
+            continue
+        target = resolve(ref, base_dir, root_dir)
+        reverted = None
+
+        if target is None:
+            if ref.startswith('http'):
+                # External link: we can't check it, so revert to .png, the most common original
+                print(f"[EXT] Found external WebP link: {ref} in {file_path.name}")
+                reverted = path[:-len('.webp')] + '.png' + rest
+        elif not index.exists(target):
+            # The .webp doesn't exist: if the original does, we broke this link when migrating
+            stem = target[:-len('.webp')]
+            origin_ext = next((ext for ext in ('.png', '.jpg', '.jpeg') if index.exists(stem + ext)), None)
+            if origin_ext:
+                print(f"[MISSING] WebP not found: {ref}. Reverting to {origin_ext}")
+                reverted = path[:-len('.webp')] + origin_ext + rest
+            elif 'favicon' in ref:
+                # Neither WebP nor original exists. Only revert if we are sure it was broken by us.
+                print(f"[ICON] Reverting favicon to .png blindly")
+                reverted = path[:-len('.webp')] + '.png' + rest
+
+        if reverted is not None:
+            pieces.append(content[last:start])
+            pieces.append(reverted)
+            last = end
+            reversions += 1
+
+    if not pieces:
+        return content, 0
+    pieces.append(content[last:])
+    return ''.join(pieces), reversions
+
+def fix_webp_stage(content, file_path, root_dir):
+    # Pipeline stage wrapper (see build_pipeline.py)
+    return fix_webp_links(content, file_path, root_dir)[0]
+
 def fix_broken_links(root_dir):
     text_files_extensions = ['.html', '.css', '.js', '.json', '.xml' ]
     # Naive assumption: We replaced .png, .jpg, .jpeg with .webp
@@ -32,104 +84,10 @@ def fix_broken_links(root_dir):
                     with open(file_path, 'r', encoding='utf-8') as f:
                         content = f.read()
                     
-                    new_content = content
-                    
-                    # Regex to find .webp strings
-                    # We look for strings ending in .webp
-                    # This is tricky because we need the context (path).
-                    # Let's find common file path patterns: 
-                    # src="...", url('...'), href="..."
+                    new_content, reversions = fix_webp_links(content, file_path, root_dir)
+                    total_reversions += reversions
                     
-                    # Simple approach: Find all string tokens ending in .webp
-                    # This might be fragile, but let's try a regex for typical paths
-                    # matches:  assets/img/foo.webp,  favicon.webp,  https://.../foo.webp
-                    
-                    matches = list(set(re.findall(r'[\"\']([^\"\']+\.webp)[\"\']', content)))
-                    
-                    file_changed = False
-                    
-                    for match in matches:
-                        # Match is the full path string inside quotes, e.g. "assets/img/logo.webp"
-                        
-                        # Case 1: External Link
-                        if match.startswith('http'):
-                            print(f"[EXT] Found external WebP link: {match} in {file}")
-                            # Heuristic: Revert to png (most common for web graphics)
-                            # Or check if we can guess. 
-                            # If it was google fonts or similar, unlikely to end in image ext.
-                            # If it's a CDN image...
-                            # Let's try reverting to .png as safe default if we broke it.
-                            reverted = match.replace('.webp', '.png')
-                            new_content = new_content.replace(match, reverted)
-                            file_changed = True
-                            total_reversions += 1
-                        
-                        # Case 2: Local File
-                        else:
-                            # Resolve path relative to current file (if relative) or root (if absolute-like)
-                            # Web paths are tricky. 
-                            # If starts with /, it's root relative.
-                            # If relative, it depeneds on file location.
-                            
-                            # Let's check if the file exists on disk at the presumed location.
-                            # We assume the project root is e:\appdev\vexil-logic-games
-                            project_root = Path(root_dir)
-                            
-                            # Construct candidate path
-                            candidate_path = None
-                            
-                            if match.startswith('/'):
-                                # Absolute from root
-                                candidate_path = project_root / match.lstrip('/')
-                            else:
-                                # Relative to current file
-                                candidate_path = Path(root) / match
-                            
-                            # Also handle "assets/..." from css file which might be in assets/css/
-                            # If CSS is in assets/css/style.css and refers to "../img/foo.webp"
-                            
-                            # Simplified check:
-                            # 1. Does absolute path exist?
-                            # 2. Does root-relative path exist?
-                            
-                            exists = False
-                            if candidate_path and candidate_path.exists():
-                                exists = True
-                            
-                            # Check clean paths (remove anchors/queries if any - regex didn't imply them but good practice)
-                            
-                            if not exists:
-                                # Try to find if .png or .jpg version exists
-                                # This confirms we broke a link to a non-existent webp where original still exists
-                                
-                                # Check for .png
-                                png_candidate_path = candidate_path.with_suffix('.png')
-                                jpg_candidate_path = candidate_path.with_suffix('.jpg')
-                                jpeg_candidate_path = candidate_path.with_suffix('.jpeg')
-                                
-                                original_ext = None
-                                if png_candidate_path.exists(): origin_ext = '.png'
-                                elif jpg_candidate_path.exists(): origin_ext = '.jpg'
-                                elif jpeg_candidate_path.exists(): origin_ext = '.jpeg'
-                                else: origin_ext = None
-                                
-                                if origin_ext:
-                                    print(f"[MISSING] WebP not found: {match}. Reverting to {origin_ext}")
-                                    reverted = match.replace('.webp', origin_ext)
-                                    new_content = new_content.replace(match, reverted)
-                                    file_changed = True
-                                    total_reversions += 1
-                                else:
-                                    # Neither WebP nor Original exists. Only revert if we are sure it was broken by us.
-                                    # E.g. favicon.
-                                    if 'favicon' in match:
-                                        print(f"[ICON] Reverting favicon to .png blindly")
-                                        reverted = match.replace('.webp', '.png')
-                                        new_content = new_content.replace(match, reverted)
-                                        file_changed = True
-                                        total_reversions += 1
-
-                    if file_changed:
+                    if new_content != content:
                         with open(file_path, 'w', encoding='utf-8') as f:
                             f.write(new_content)
                         files_fixed += 1
@@ -142,5 +100,11 @@ def fix_broken_links(root_dir):
     print(f"Files Modified: {files_fixed}")
     print(f"Links Reverted: {total_reversions}")
 
+    # Index the fixed tree: what is still broken, what nothing uses, and a dump for other scripts
+    print("-" * 30)
+    graph = build_graph(root_dir)
+    write_graph(graph, os.path.join(root_dir, GRAPH_FILE_NAME))
+    print_report(graph)
+
 if __name__ == "__main__":
-    fix_broken_links("e:/appdev/vexil-logic-games")
+    fix_broken_links(sys.argv[1] if len(sys.argv) > 1 else os.path.dirname(os.path.abspath(__file__)))
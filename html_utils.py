@@ -0,0 +1,122 @@
+import functools
+import re
+from pathlib import Path
+
+# Small helpers shared by the HTML build stages.
+# These are regex based like the rest of the build scripts: good enough for the hand written
+# pages in this site, not a general HTML parser.
+
+img_tag_pattern = re.compile(r'<img\s+([^>]+)>', re.IGNORECASE)
+
+attr_pattern = re.compile(r'''([^\s=/>"']+)(?:\s*=\s*("[^"]*"|'[^']*'|[^\s"'>]+))?''')
+
+def parse_attributes(attrs):
+    # Returns {name (lowercase): value}. Valueless attributes map to ''.
+    result = {}
+    for name, value in attr_pattern.findall(attrs):
+        if value[:1] in ('"', "'"):
+            value = value[1:-1]
+        result.setdefault(name.lower(), value)
+    return result
+
+def add_attributes(tag, extra):
+    # Appends attributes to a start tag, keeping its original formatting and self-closing slash
+    if not extra:
+        return tag
+    addition = ''.join(f' {name}="{value}"' for name, value in extra.items())
+    body = tag[:-1].rstrip()
+    if body.endswith('/'):
+        return body[:-1].rstrip() + addition + ' />'
+    return body + addition + '>'
+
+def is_local_url(url):
+    url = url.strip()
+    if not url or url.startswith(('#', 'data:', 'mailto:', 'tel:', 'javascript:', '//')):
+        return False
+    return re.match(r'^[a-zA-Z][a-zA-Z0-9+.-]*:', url) is None
+
+def resolve_local(url, file_path, root_dir):
+    # Maps a local reference to a path on disk: root-relative (/x) against the site root,
+    # anything else against the directory of the file it appears in.
+    # Returns None for external or data URLs.
+    if not is_local_url(url):
+        return None
+    url = re.split(r'[?#]', url.strip(), maxsplit=1)[0]
+    if not url:
+        return None
+    if url.startswith('/'):
+        return Path(root_dir) / url.lstrip('/')
+    return Path(file_path).parent / url
+
+def site_origins(root_dir):
+    # Absolute URLs on the site's own domain (from the CNAME file) point at local files too.
+    # Called for every reference the build resolves, so the CNAME is read once per root.
+    return _site_origins(str(root_dir))
+
+@functools.lru_cache(maxsize=None)
+def _site_origins(root_dir):
+    cname = Path(root_dir) / 'CNAME'
+    if not cname.is_file():
+        return ()
+    domain = cname.read_text(encoding='utf-8').strip()
+    if not domain:
+        return ()
+    return tuple(f"{scheme}://{host}" for scheme in ('https', 'http') for host in (domain, f"www.{domain}"))
+
+VOID_ELEMENTS = {'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta', 'source', 'track', 'wbr'}
+RAW_TEXT_ELEMENTS = {'script', 'style'}
+
+tag_pattern = re.compile(r'''<!--.*?-->|<(/?)([a-zA-Z][a-zA-Z0-9-]*)((?:"[^"]*"|'[^']*'|[^'">])*)>''', re.DOTALL)
+
+def iter_elements(content):
+    # Yields (match, tag name, attribute dict, ancestors) for every start tag in document order.
+    # ancestors is the live list of open (tag name, attribute dict) pairs; copy it if you keep it.
+    # Comments and the bodies of <script>/<style> are skipped.
+    stack = []
+    pos = 0
+    while True:
+        match = tag_pattern.search(content, pos)
+        if not match:
+            return
+        pos = match.end()
+        if match.group(0).startswith('<!--'):
+            continue
+        closing, name, attrs = match.group(1), match.group(2).lower(), match.group(3)
+        if closing:
+            # Pop back to the matching element; stray closing tags are ignored
+            for i in range(len(stack) - 1, -1, -1):
+                if stack[i][0] == name:
+                    del stack[i:]
+                    break
+            continue
+        attributes = parse_attributes(attrs)
+        yield match, name, attributes, stack
+        if name in RAW_TEXT_ELEMENTS:
+            end = re.compile(rf'</{name}\s*>', re.IGNORECASE).search(content, pos)
+            pos = end.end() if end else len(content)
+        elif name not in VOID_ELEMENTS and not attrs.rstrip().endswith('/'):
+            stack.append((name, attributes))
+
+def set_attributes(tag, values):
+    # Sets, replaces or (with a value of None) removes attributes on a start tag.
+    # Untouched attributes keep their original formatting.
+    name_match = re.match(r'<[a-zA-Z][a-zA-Z0-9-]*', tag)
+    head, body = tag[:name_match.end()], tag[name_match.end():]
+    pending = {name.lower(): value for name, value in values.items()}
+    pieces = []
+    last = 0
+    for match in attr_pattern.finditer(body):
+        name = match.group(1).lower()
+        if name not in pending:
+            continue
+        value = pending.pop(name)
+        # Drop the whitespace in front of the attribute along with it
+        start = match.start()
+        while start > last and body[start - 1].isspace():
+            start -= 1
+        pieces.append(body[last:start])
+        if value is not None:
+            pieces.append(f' {match.group(1)}="{value}"')
+        last = match.end()
+    pieces.append(body[last:])
+    return add_attributes(head + ''.join(pieces), {name: value for name, value in pending.items() if value is not None})
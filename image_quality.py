@@ -0,0 +1,153 @@
+import io
+
+import numpy as np
+from PIL import Image
+
+# Per-image WebP encoder settings.
+# A single fixed quality over-spends on photos and smears flat UI art (icons, logos, the wallet
+# images). Instead each image is encoded a few times in memory and compared against the source with
+# an SSIM-style score taken over its worst windows, and the smallest encoding that still reaches
+# SIMILARITY_TARGET wins:
+#   - photos: binary search for the lowest lossy quality that reaches the target
+#   - flat or alpha-heavy images: lossless and near-lossless are tried as well, smallest kept
+# The comparison runs vectorised on numpy arrays of a copy downscaled to COMPARE_SIZE on the long
+# side: large enough to show ringing and banding at display size, small enough that scoring costs
+# less than the encode it checks.
+#
+# The returned params are plain data; optimize_images.py stores them in the build cache so the
+# search only runs again when the source or these settings change.
+
+SIMILARITY_TARGET = 0.95
+QUALITY_MIN = 40
+QUALITY_MAX = 95
+COMPARE_SIZE = 1024
+BLOCK = 8
+# Artifacts are local (ringing around edges, banding in one gradient), so the score is taken from
+# the worst windows rather than the average: this percentile of the per-window SSIM
+POOL_PERCENTILE = 5
+# A palette this small (or this much transparency) marks an image as flat UI art
+FLAT_MAX_COLORS = 256
+ALPHA_HEAVY_RATIO = 0.1
+# Low bits dropped per channel before a lossless encode. Pillow doesn't expose libwebp's
+# near_lossless option, so the same idea (fewer distinct values, longer runs) is applied here.
+NEAR_LOSSLESS_BITS = (1, 2)
+
+# SSIM stabilising constants for 8 bit data
+C1 = (0.01 * 255) ** 2
+C2 = (0.03 * 255) ** 2
+
+def search_settings():
+    # Everything that affects the chosen params. A change here invalidates the cached entries.
+    return {'target': SIMILARITY_TARGET, 'range': [QUALITY_MIN, QUALITY_MAX], 'compare': COMPARE_SIZE,
+            'pool': POOL_PERCENTILE, 'near_lossless': list(NEAR_LOSSLESS_BITS)}
+
+def normalize(img):
+    # The modes the WebP encoder takes as-is; everything else goes through RGBA
+    if img.mode in ('RGB', 'RGBA'):
+        return img
+    return img.convert('RGBA' if 'A' in img.getbands() or 'transparency' in img.info else 'RGB')
+
+def compare_planes(img):
+    # Float arrays of a downscaled copy: luma, plus alpha when the image has it.
+    # Colour is premultiplied by alpha so changes under fully transparent pixels don't count.
+    small = img.copy()
+    small.thumbnail((COMPARE_SIZE, COMPARE_SIZE), Image.BOX)
+    pixels = np.asarray(small, dtype=np.float32)
+    if pixels.ndim == 2:
+        return [pixels]
+    luma = pixels[..., 0] * 0.299 + pixels[..., 1] * 0.587 + pixels[..., 2] * 0.114
+    if pixels.shape[2] == 4:
+        alpha = pixels[..., 3]
+        return [luma * (alpha / 255.0), alpha]
+    return [luma]
+
+def _blocks(plane):
+    # Non-overlapping BLOCK x BLOCK windows as rows of a 2D array (edges cropped)
+    h = plane.shape[0] // BLOCK * BLOCK
+    w = plane.shape[1] // BLOCK * BLOCK
+    if not h or not w:
+        return plane.reshape(1, -1)
+    return plane[:h, :w].reshape(h // BLOCK, BLOCK, w // BLOCK, BLOCK).swapaxes(1, 2).reshape(-1, BLOCK * BLOCK)
+
+def similarity(reference, candidate):
+    # SSIM over BLOCK x BLOCK windows pooled at POOL_PERCENTILE, the worst plane wins. 1.0 means identical.
+    scores = []
+    for a, b in zip(reference, candidate):
+        a, b = _blocks(a), _blocks(b)
+        mu_a, mu_b = a.mean(axis=1), b.mean(axis=1)
+        var_a, var_b = a.var(axis=1), b.var(axis=1)
+        cov = ((a - mu_a[:, None]) * (b - mu_b[:, None])).mean(axis=1)
+        ssim = ((2 * mu_a * mu_b + C1) * (2 * cov + C2)) / ((mu_a ** 2 + mu_b ** 2 + C1) * (var_a + var_b + C2))
+        scores.append(float(np.percentile(ssim, POOL_PERCENTILE)))
+    return min(scores)
+
+def is_flat(img):
+    # Few distinct colours or lots of transparency: lossless usually wins and lossy shows the most
+    if img.mode == 'RGBA':
+        alpha = np.asarray(img.getchannel('A'))
+        if (alpha < 255).mean() > ALPHA_HEAVY_RATIO:
+            return True
+    return img.getcolors(FLAT_MAX_COLORS) is not None
+
+def quantize(img, bits):
+    # Near-lossless pre-pass: rounds every channel to a multiple of 2**bits (alpha kept exact)
+    pixels = np.asarray(img, dtype=np.int16)
+    step = 1 << bits
+    rounded = np.clip((pixels + step // 2) // step * step, 0, 255).astype(np.uint8)
+    if img.mode == 'RGBA':
+        rounded[..., 3] = pixels[..., 3]
+    return Image.fromarray(rounded, img.mode)
+
+def encode(img, params):
+    # Returns the WebP bytes for params ({'quality': q} or {'lossless': True, 'near_lossless': bits})
+    if params.get('near_lossless'):
+        img = quantize(img, params['near_lossless'])
+    buffer = io.BytesIO()
+    if params.get('lossless'):
+        # For lossless WebP quality is compression effort, not fidelity
+        img.save(buffer, 'WEBP', lossless=True, quality=100)
+    else:
+        img.save(buffer, 'WEBP', quality=params['quality'])
+    return buffer.getvalue()
+
+def score(reference, data):
+    with Image.open(io.BytesIO(data)) as decoded:
+        return similarity(reference, compare_planes(normalize(decoded)))
+
+def search_quality(img, reference):
+    # Lowest quality in [QUALITY_MIN, QUALITY_MAX] that reaches the target, with its bytes.
+    # Falls back to QUALITY_MAX when nothing in range does.
+    low, high = QUALITY_MIN, QUALITY_MAX
+    best = None
+    while low <= high:
+        quality = (low + high) // 2
+        data = encode(img, {'quality': quality})
+        if score(reference, data) >= SIMILARITY_TARGET:
+            best = ({'quality': quality}, data)
+            high = quality - 1
+        else:
+            low = quality + 1
+    if best is None:
+        best = ({'quality': QUALITY_MAX}, encode(img, {'quality': QUALITY_MAX}))
+    return best
+
+def choose_params(img):
+    # Returns (params, encoded bytes) for the smallest encoding that meets SIMILARITY_TARGET
+    img = normalize(img)
+    reference = compare_planes(img)
+    candidates = [search_quality(img, reference)]
+    if is_flat(img):
+        candidates.append(({'lossless': True}, encode(img, {'lossless': True})))
+        for bits in NEAR_LOSSLESS_BITS:
+            params = {'lossless': True, 'near_lossless': bits}
+            data = encode(img, params)
+            if score(reference, data) >= SIMILARITY_TARGET:
+                candidates.append((params, data))
+    return min(candidates, key=lambda candidate: len(candidate[1]))
+
+def describe(params):
+    if params.get('near_lossless'):
+        return f"near-lossless ({params['near_lossless']} bit)"
+    if params.get('lossless'):
+        return 'lossless'
+    return f"q{params['quality']}"
@@ -0,0 +1,288 @@
+import base64
+import os
+import re
+import sys
+from pathlib import Path
+
+from PIL import Image
+
+from build_cache import cache_for_root, is_dry_run
+from html_utils import iter_elements, set_attributes
+from image_quality import choose_params, search_settings
+from reference_graph import IMAGE_SUFFIXES, build_graph, derived_from, resolve, url_pattern
+from responsive_images import image_size
+
+# Tiny image inlining and sprite sheet.
+# The icon, wallet, footer and shape images are a few hundred bytes to a few KB each, yet every one
+# is a request of its own. Using the reference graph this stage finds the <img>s that point at an
+# image of at most INLINE_MAX_BYTES, and by how many pages use it:
+#   - used on fewer than SPRITE_MIN_PAGES pages: the src becomes a data: URI, if the image is
+#     shown only once on the page (a repeated data: URI costs more than the request it saves)
+#   - used on more: the image goes into assets/img/sprites.webp, which is downloaded once and
+#     cached for every page. The <img> gets a transparent placeholder src with the image's aspect
+#     ratio and sprite classes, and a <style data-sprites> block in the head positions the sheet. Sizes and offsets are
+#     percentages, so the sprite scales with whatever size the page CSS gives the <img>.
+# The original reference is kept in data-inline / data-sprite, so a re-run (or an image that grew
+# past the threshold) starts again from it. minify_assets.py inlines small url() images the same way
+# when it writes style.min.css.
+
+INLINE_MAX_BYTES = 4096
+SPRITE_MIN_PAGES = 3
+SPRITE_SHEET = 'assets/img/sprites.webp'
+# A page that would show fewer sprites than this inlines them rather than fetch the sheet
+MIN_PAGE_SPRITES = 2
+# Transparent gap between sprites, so scaled rendering doesn't bleed the neighbours in
+SPRITE_GAP = 2
+INLINE_ATTRIBUTE = 'data-inline'
+SPRITE_ATTRIBUTE = 'data-sprite'
+SPRITE_STYLE_ATTRIBUTE = 'data-sprites'
+SPRITE_CLASS = 'sprite'
+# Empty SVG with the sprite's aspect ratio: a 1x1 placeholder would make img{height:auto} render
+# every non-square sprite square
+PLACEHOLDER = "data:image/svg+xml,%3Csvg xmlns='http://www.w3.org/2000/svg' viewBox='0 0 {width} {height}'%3E%3C/svg%3E"
+RASTER_SUFFIXES = {'.webp', '.png', '.jpg', '.jpeg', '.gif'}
+MIME_TYPES = {
+    '.webp': 'image/webp', '.png': 'image/png', '.jpg': 'image/jpeg', '.jpeg': 'image/jpeg',
+    '.gif': 'image/gif', '.svg': 'image/svg+xml', '.avif': 'image/avif', '.ico': 'image/x-icon',
+}
+# Reference graph kinds that come from an <img> (or one of this stage's own attributes)
+IMAGE_REF_KINDS = {'src', INLINE_ATTRIBUTE, SPRITE_ATTRIBUTE}
+
+sprite_style_pattern = re.compile(rf'[ \t]*<style {SPRITE_STYLE_ATTRIBUTE}>.*?</style>\n?', re.DOTALL)
+
+# Per site root for this run: the sprite layout, and data: URIs already encoded
+_plans = {}
+_data_uris = {}
+# page -> (images inlined, images sprited, requests saved)
+_summary = {}
+
+def is_small(path):
+    try:
+        return os.path.getsize(path) <= INLINE_MAX_BYTES
+    except OSError:
+        return False
+
+def data_uri(path):
+    key = os.path.abspath(path)
+    if key not in _data_uris:
+        with open(path, 'rb') as f:
+            payload = base64.b64encode(f.read()).decode('ascii')
+        _data_uris[key] = f"data:{MIME_TYPES[Path(path).suffix.lower()]};base64,{payload}"
+    return _data_uris[key]
+
+def page_usage(root_dir):
+    # image key -> pages with an <img> that shows it
+    usage = {}
+    for edge in build_graph(root_dir)['edges']:
+        if not edge['exists'] or not edge['source'].endswith('.html') or edge['kind'] not in IMAGE_REF_KINDS:
+            continue
+        target = derived_from(edge['target'])
+        if Path(target).suffix.lower() in IMAGE_SUFFIXES:
+            usage.setdefault(target, set()).add(edge['source'])
+    return usage
+
+def sprite_class(key):
+    # assets/img/footer/1.webp -> sprite-footer-1
+    name = re.sub(r'^assets/img/', '', key).rsplit('.', 1)[0]
+    return f"{SPRITE_CLASS}-{re.sub(r'[^A-Za-z0-9]+', '-', name).strip('-').lower()}"
+
+def _percent(value):
+    return f"{round(value, 3):g}%"
+
+def layout_sprites(root_dir, keys):
+    # Stacks the images vertically; returns ({key: (y, width, height)}, sheet width, sheet height)
+    cache = cache_for_root(root_dir)
+    cells = {}
+    y = width = 0
+    for key in keys:
+        size = image_size(os.path.join(root_dir, key), cache)
+        if not size:
+            continue
+        cells[key] = (y, size[0], size[1])
+        width = max(width, size[0])
+        y += size[1] + SPRITE_GAP
+    return cells, width, max(0, y - SPRITE_GAP)
+
+def write_sheet(root_dir, cells, width, height):
+    # Encodes the sheet with the adaptive WebP settings; skipped when no member changed
+    cache = cache_for_root(root_dir)
+    sheet_path = os.path.join(root_dir, SPRITE_SHEET)
+    settings = {
+        'members': [[key, cache.fingerprint(os.path.join(root_dir, key))] for key in cells],
+        'gap': SPRITE_GAP,
+        'search': search_settings(),
+    }
+    entry = cache.lookup('sprites', SPRITE_SHEET)
+    if is_dry_run() or (entry and entry['settings'] == settings and entry['output'] == cache.fingerprint(sheet_path)):
+        return
+    sheet = Image.new('RGBA', (width, height), (0, 0, 0, 0))
+    for key, (y, w, h) in cells.items():
+        with Image.open(os.path.join(root_dir, key)) as img:
+            sheet.paste(img.convert('RGBA'), (0, y))
+    params, data = choose_params(sheet)
+    with open(sheet_path, 'wb') as f:
+        f.write(data)
+    cache.store('sprites', SPRITE_SHEET, {'settings': settings, 'output': cache.fingerprint(sheet_path)})
+    print(f"[SPRITE] {SPRITE_SHEET}: {len(cells)} images, {width}x{height}, {len(data)/1024:.1f}KB")
+
+def sprite_plan(root_dir):
+    # Which images go into the sheet and where; built once per run from the reference graph,
+    # before the pipeline rewrites any page (see prepare_sprites)
+    root_key = os.path.abspath(root_dir)
+    if root_key in _plans:
+        return _plans[root_key]
+    usage = page_usage(root_dir)
+    keys = sorted(
+        key for key, pages in usage.items()
+        if len(pages) >= SPRITE_MIN_PAGES and Path(key).suffix.lower() in RASTER_SUFFIXES
+        and is_small(os.path.join(root_dir, key))
+    )
+    cells, width, height = layout_sprites(root_dir, keys)
+    if cells:
+        write_sheet(root_dir, cells, width, height)
+    rules = {}
+    for key, (y, w, h) in cells.items():
+        position = _percent(y / (height - h) * 100) if height > h else '0%'
+        rules[key] = (f".{sprite_class(key)}{{background-size:{_percent(width / w * 100)} "
+                      f"{_percent(height / h * 100)};background-position:0 {position}}}")
+    _plans[root_key] = {'root': root_dir, 'usage': usage, 'cells': cells, 'rules': rules}
+    return _plans[root_key]
+
+def sprite_style(page_path, root_dir, keys, rules):
+    sheet = Path(os.path.relpath(os.path.join(root_dir, SPRITE_SHEET), os.path.dirname(page_path))).as_posix()
+    css = f".{SPRITE_CLASS}{{background:url({sheet}) no-repeat}}" + ''.join(rules[key] for key in sorted(keys))
+    return f"<style {SPRITE_STYLE_ATTRIBUTE}>{css}</style>"
+
+def original_src(attributes):
+    # The src as written before this stage touched the <img>
+    return attributes.get(INLINE_ATTRIBUTE) or attributes.get(SPRITE_ATTRIBUTE) or attributes.get('src', '')
+
+def image_tag(tag, attributes, src, decision, key, plan):
+    # Rewrites the <img> for decision ('sprite', 'inline' or None to restore it) in one pass,
+    # so attributes a previous run added keep their place and a re-run changes nothing
+    classes = attributes.get('class', '').split()
+    kept = [c for c in classes if c != SPRITE_CLASS and not c.startswith(SPRITE_CLASS + '-')]
+    values = {'src': src, INLINE_ATTRIBUTE: None, SPRITE_ATTRIBUTE: None}
+    if decision == 'sprite':
+        _, w, h = plan['cells'][key]
+        values.update({'src': PLACEHOLDER.format(width=w, height=h), SPRITE_ATTRIBUTE: src})
+        kept += [SPRITE_CLASS, sprite_class(key)]
+        # The placeholder only has an aspect ratio, not a size
+        if 'width' not in attributes and 'height' not in attributes:
+            values.update(width=str(w), height=str(h))
+    elif decision == 'inline':
+        values.update({'src': data_uri(os.path.join(plan['root'], key)), INLINE_ATTRIBUTE: src})
+    if kept != classes:
+        values['class'] = ' '.join(kept) or None
+    return set_attributes(tag, values)
+
+def inline_images(content, file_path, root_dir):
+    # Returns the new content and (images inlined, images sprited)
+    plan = sprite_plan(root_dir)
+    page_dir = os.path.dirname(os.path.abspath(file_path))
+    images = []
+    for match, name, attributes, ancestors in iter_elements(content):
+        if name != 'img' or 'srcset' in attributes or any(n == 'picture' for n, _ in ancestors):
+            continue
+        src = original_src(attributes)
+        key = resolve(src, page_dir, root_dir)
+        if key and key in plan['cells']:
+            decision = 'sprite'
+        elif key and Path(key).suffix.lower() in MIME_TYPES and is_small(os.path.join(root_dir, key)):
+            decision = 'inline'
+        else:
+            decision = None
+        images.append([match, attributes, src, key, decision])
+
+    # Like inline_css_images: an image shown more than once on the page would repeat its data: URI
+    # each time, so only single uses are inlined and repeated ones keep their (cached) URL
+    counts = {}
+    for _, _, _, key, _ in images:
+        counts[key] = counts.get(key, 0) + 1
+    for image in images:
+        if image[4] == 'inline' and counts[image[3]] > 1:
+            image[4] = None
+
+    # A page that needs a single sprite would fetch the whole sheet for it: inline that one instead
+    sprited = {key for _, _, _, key, decision in images if decision == 'sprite'}
+    if len(sprited) < MIN_PAGE_SPRITES:
+        for image in images:
+            if image[4] == 'sprite':
+                image[4] = 'inline' if counts[image[3]] == 1 else None
+        sprited = set()
+    inlined = {key for _, _, _, key, decision in images if decision == 'inline'}
+
+    pieces = []
+    last = 0
+    for match, attributes, src, key, decision in images:
+        tag = image_tag(match.group(0), attributes, src, decision, key, plan)
+        if tag != match.group(0):
+            pieces.append(content[last:match.start()])
+            pieces.append(tag)
+            last = match.end()
+    if pieces:
+        pieces.append(content[last:])
+        content = ''.join(pieces)
+
+    content = sprite_style_pattern.sub('', content)
+    if sprited:
+        head_end = content.find('</head>')
+        if head_end != -1:
+            line_start = content.rfind('\n', 0, head_end) + 1
+            indent = re.match(r'[ \t]*', content[line_start:]).group()
+            style = sprite_style(file_path, root_dir, sprited, plan['rules'])
+            content = content[:line_start] + indent + '    ' + style + '\n' + content[line_start:]
+    return content, (len(inlined), len(sprited))
+
+def inline_css_images(css, css_path, root_dir):
+    # url()s to small images become data: URIs. Only images used once in the stylesheet:
+    # a repeated data: URI would cost more than the request it saves.
+    css_dir = os.path.dirname(os.path.abspath(css_path))
+    counts = {}
+    for match in url_pattern.finditer(css):
+        key = resolve(match.group(2), css_dir, root_dir)
+        if key:
+            counts[key] = counts.get(key, 0) + 1
+
+    def replacement(match):
+        key = resolve(match.group(2), css_dir, root_dir)
+        if not key or counts[key] != 1 or Path(key).suffix.lower() not in MIME_TYPES:
+            return match.group(0)
+        path = os.path.join(root_dir, key)
+        if not os.path.isfile(path) or not is_small(path):
+            return match.group(0)
+        return f'url("{data_uri(path)}")'
+
+    return url_pattern.sub(replacement, css)
+
+def prepare_sprites(root_dir):
+    # Pipeline preparer: the plan has to come from the whole tree as it was before this build.
+    # Made lazily from the first page instead, it would see the pages written so far, and the
+    # next build would plan (and rewrite those pages) differently.
+    sprite_plan(root_dir)
+
+def inline_stage(content, file_path, root_dir):
+    # Pipeline stage wrapper (see build_pipeline.py)
+    new_content, (inlined, sprited) = inline_images(content, file_path, root_dir)
+    if inlined or sprited:
+        # The sheet itself is one request, shared with every other page
+        saved = inlined + sprited - (1 if sprited else 0)
+        page = os.path.relpath(file_path, root_dir)
+        _summary[page] = (inlined, sprited, saved)
+        print(f"[INLINE] {page}: {inlined} inlined, {sprited} sprited -> {saved} requests saved")
+    return new_content
+
+def report_inlining(root_dir):
+    # Pipeline finisher: totals for the per-page lines above
+    if not _summary:
+        return
+    inlined = sum(i for i, _, _ in _summary.values())
+    sprited = sum(s for _, s, _ in _summary.values())
+    saved = sum(r for _, _, r in _summary.values())
+    print(f"[INLINE] {len(_summary)} pages: {inlined} images inlined, {sprited} sprited, {saved} requests saved")
+
+if __name__ == "__main__":
+    # Standalone: run just this stage through the pipeline
+    from build_pipeline import main
+    root = sys.argv[1] if len(sys.argv) > 1 else os.path.dirname(os.path.abspath(__file__))
+    sys.exit(main([root, '--stages', 'inline-images']))
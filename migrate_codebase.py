@@ -1,8 +1,24 @@
 import os
+import sys
 from pathlib import Path
 
+extensions_to_replace = ['.png', '.jpg', '.jpeg', '.PNG', '.JPG', '.JPEG']
+
+def replace_image_extensions(content):
+    new_content = content
+    for ext in extensions_to_replace:
+        # Simple string replacement
+        # Limitation: might replace substrings incorrectly if filenames overlap
+        # e.g. 'image.png' -> 'image.webp'
+        # but 'image.png.bak' -> 'image.webp.bak' (acceptable)
+        new_content = new_content.replace(ext, '.webp')
+    return new_content
+
+def migrate_extensions_stage(content, file_path, root_dir):
+    # Pipeline stage wrapper (see build_pipeline.py)
+    return replace_image_extensions(content)
+
 def update_references_and_cleanup(root_dir):
-    extensions_to_replace = ['.png', '.jpg', '.jpeg', '.PNG', '.JPG', '.JPEG']
     text_files_extensions = ['.html', '.css', '.js', '.json', '.xml', '.txt', '.md']
     
     # 1. Collect all WebP files that exist now
@@ -33,13 +49,7 @@ def update_references_and_cleanup(root_dir):
                     with open(file_path, 'r', encoding='utf-8') as f:
                         content = f.read()
                     
-                    new_content = content
-                    for ext in extensions_to_replace:
-                        # Simple string replacement
-                        # Limitation: might replace substrings incorrectly if filenames overlap
-                        # e.g. 'image.png' -> 'image.webp'
-                        # but 'image.png.bak' -> 'image.webp.bak' (acceptable)
-                        new_content = new_content.replace(ext, '.webp')
+                    new_content = replace_image_extensions(content)
                         
                     if new_content != content:
                         with open(file_path, 'w', encoding='utf-8') as f:
@@ -83,4 +93,4 @@ def update_references_and_cleanup(root_dir):
     print(f"Space Reclaimed: {saved_space / (1024*1024):.2f} MB")
 
 if __name__ == "__main__":
-    update_references_and_cleanup("e:/appdev/vexil-logic-games")
+    update_references_and_cleanup(sys.argv[1] if len(sys.argv) > 1 else os.path.dirname(os.path.abspath(__file__)))
@@ -1,57 +1,764 @@
-import re
+import argparse
+import functools
+import glob
+import gzip
 import os
+import re
+import sys
+
+from inline_images import inline_css_images
+from reference_graph import derived_from
+
+# CSS minifier.
+# The stylesheet is tokenized (so strings, url() and comments are never mangled), parsed into
+# rules and at-rules, cleaned up and serialized again:
+#   - comments dropped (except /*! license */ comments), whitespace collapsed
+#   - #aabbcc -> #abc, rgb(255,0,0) -> #f00, 0.50em -> .5em, 0px -> 0, font-weight:bold -> 700
+#   - adjacent rules with the same selector or the same declarations merged, empty blocks dropped
+# Optionally rules are pruned against the selectors the site actually uses (see collect_used_selectors).
+
+css_token_pattern = re.compile(r'''
+    (?P<comment>/\*.*?(?:\*/|$))
+  | (?P<string>"(?:\\.|[^"\\\n])*"?|'(?:\\.|[^'\\\n])*'?)
+  | (?P<url>url\(\s*[^'"()\s][^()\s]*\s*\))
+  | (?P<ws>\s+)
+  | (?P<at>@-?[a-zA-Z][\w-]*)
+  | (?P<punct>[{};:,()])
+  | (?P<word>(?:\\.|[^\s{};:,()'"/\\@]|/(?!\*)|@)+)
+''', re.VERBOSE | re.DOTALL | re.IGNORECASE)
+
+# At-rules whose block holds rules rather than declarations
+NESTED_AT_RULES = {'media', 'supports', 'document', 'layer', 'container', 'keyframes'}
+
+LENGTH_UNITS = ('px', 'em', 'rem', 'ex', 'ch', 'vw', 'vh', 'vmin', 'vmax', 'cm', 'mm', 'in', 'pt', 'pc', 'q')
+
+def tokenize_css(content):
+    tokens = []
+    pos = 0
+    while pos < len(content):
+        match = css_token_pattern.match(content, pos)
+        if not match:
+            # Stray character (e.g. a lone backslash); keep it as a word so nothing is lost
+            tokens.append(('word', content[pos]))
+            pos += 1
+            continue
+        tokens.append((match.lastgroup, match.group()))
+        pos = match.end()
+    return tokens
+
+def at_rule_name(keyword):
+    # '@-webkit-keyframes' -> 'keyframes'
+    return re.sub(r'^@(-[a-z]+-)?', '', keyword.lower())
+
+def parse_css(tokens):
+    # Returns a list of nodes:
+    #   {'type': 'rule', 'prelude': tokens, 'declarations': [tokens, ...]}
+    #   {'type': 'at', 'name': '@media', 'prelude': tokens, 'block': [nodes] | [declarations] | None}
+    #   {'type': 'comment', 'text': '/*! ... */'}
+    nodes, _ = _parse_rule_list(tokens, 0, top_level=True)
+    return nodes
+
+def _parse_rule_list(tokens, pos, top_level=False):
+    nodes = []
+    prelude = []
+    while pos < len(tokens):
+        kind, value = tokens[pos]
+        if kind == 'comment':
+            if value.startswith('/*!'):
+                nodes.append({'type': 'comment', 'text': value})
+            pos += 1
+        elif kind == 'punct' and value == '}':
+            if not top_level:
+                return nodes, pos + 1
+            pos += 1
+        elif kind == 'at' and not any(t[0] != 'ws' for t in prelude):
+            pos = _parse_at_rule(tokens, pos, nodes)
+            prelude = []
+        elif kind == 'punct' and value == '{':
+            declarations, pos = _parse_declarations(tokens, pos + 1)
+            nodes.append({'type': 'rule', 'prelude': prelude, 'declarations': declarations})
+            prelude = []
+        elif kind == 'punct' and value == ';' and not any(t[0] != 'ws' for t in prelude):
+            pos += 1
+        else:
+            prelude.append(tokens[pos])
+            pos += 1
+    return nodes, pos
+
+def _parse_at_rule(tokens, pos, nodes):
+    name = tokens[pos][1]
+    prelude = []
+    pos += 1
+    while pos < len(tokens):
+        kind, value = tokens[pos]
+        if kind == 'punct' and value == ';':
+            nodes.append({'type': 'at', 'name': name, 'prelude': prelude, 'block': None})
+            return pos + 1
+        if kind == 'punct' and value == '{':
+            if at_rule_name(name) in NESTED_AT_RULES:
+                block, pos = _parse_rule_list(tokens, pos + 1)
+                nodes.append({'type': 'at', 'name': name, 'prelude': prelude, 'block': block, 'nested': True})
+            else:
+                block, pos = _parse_declarations(tokens, pos + 1)
+                nodes.append({'type': 'at', 'name': name, 'prelude': prelude, 'block': block, 'nested': False})
+            return pos
+        if kind != 'comment':
+            prelude.append(tokens[pos])
+        pos += 1
+    nodes.append({'type': 'at', 'name': name, 'prelude': prelude, 'block': None})
+    return pos
+
+def _parse_declarations(tokens, pos):
+    declarations = []
+    current = []
+    depth = 0
+    while pos < len(tokens):
+        kind, value = tokens[pos]
+        pos += 1
+        if kind == 'comment':
+            continue
+        if kind == 'punct':
+            if value == '(':
+                depth += 1
+            elif value == ')':
+                depth = max(0, depth - 1)
+            elif value == '{':
+                # Nested block inside a declaration list (CSS nesting); skip it rather than misparse
+                _, pos = _parse_rule_list(tokens, pos)
+                current = []
+                continue
+            elif value == '}' and depth == 0:
+                break
+            elif value == ';' and depth == 0:
+                declarations.append(current)
+                current = []
+                continue
+        current.append((kind, value))
+    declarations.append(current)
+    return [d for d in declarations if any(t[0] != 'ws' for t in d)], pos
+
+def _join(tokens, cleanup):
+    # Serializes tokens, running cleanup() only over the text outside strings and url()s
+    opaque = []
+    text = []
+    for kind, value in tokens:
+        if kind == 'comment':
+            continue
+        if kind in ('string', 'url'):
+            if kind == 'url':
+                value = re.sub(r'^url\(\s*|\s*\)$', '', value)
+                value = f'url({value})'
+            opaque.append(value)
+            # Placeholders use a private-use character so no cleanup regex can match inside them
+            text.append('\x00' + chr(0xe000 + len(opaque) - 1) + '\x00')
+        else:
+            text.append(value)
+    result = cleanup(''.join(text))
+    return re.sub('\x00(.)\x00', lambda m: opaque[ord(m.group(1)) - 0xe000], result)
+
+def _clean_selector(text):
+    text = re.sub(r'\s+', ' ', text).strip()
+    text = re.sub(r'\s*([>+~,])\s*', r'\1', text)
+    text = re.sub(r'\(\s+', '(', text)
+    return re.sub(r'\s+\)', ')', text)
+
+def _clean_prelude(text):
+    text = re.sub(r'\s+', ' ', text).strip()
+    text = re.sub(r'\s*,\s*', ',', text)
+    text = re.sub(r'\(\s+', '(', text)
+    text = re.sub(r'\s+\)', ')', text)
+    return re.sub(r'\s*:\s*', ':', text)
+
+def _short_hex(match):
+    digits = match.group(1).lower()
+    if digits[0] == digits[1] and digits[2] == digits[3] and digits[4] == digits[5]:
+        return '#' + digits[0] + digits[2] + digits[4]
+    return '#' + digits
+
+def _rgb_to_hex(match):
+    channels = [int(c) for c in match.groups()]
+    if any(c > 255 for c in channels):
+        return match.group(0)
+    return _short_hex(re.match('#(.*)', '#' + ''.join(f'{c:02x}' for c in channels)))
+
+number_pattern = re.compile(r'(?<![\w.#\\-])(-?)(\d*\.\d+|\d+\.?)(?![\d.])([a-zA-Z%]*)')
+
+def _short_number(match):
+    # 0.50em -> .5em, 2.0 -> 2, 0px -> 0 (the caller decides when unit stripping is safe)
+    sign, number, unit = match.groups()
+    if '.' in number:
+        whole, fraction = number.split('.')
+        whole = whole.lstrip('0')
+        fraction = fraction.rstrip('0')
+        number = whole + ('.' + fraction if fraction else '') or '0'
+    if number.strip('0') == '':
+        number = '0'
+        sign = ''
+        if unit.lower() in LENGTH_UNITS:
+            unit = ''
+    return sign + number + unit
+
+def _short_numbers(text):
+    # Unit stripping is not safe inside calc()/min()/max()/clamp(), where a unitless 0 is invalid
+    result = []
+    stack = []
+    for piece in re.split(r'([\w-]*\(|\))', text):
+        if piece.endswith('('):
+            stack.append(piece[:-1].lower())
+        elif piece == ')':
+            if stack:
+                stack.pop()
+        elif any(name in ('calc', 'min', 'max', 'clamp') or name.endswith('-calc') for name in stack):
+            piece = number_pattern.sub(lambda m: _short_number(m) if not m.group(3) or m.group(2).strip('0.') else m.group(0), piece)
+        else:
+            piece = number_pattern.sub(_short_number, piece)
+        result.append(piece)
+    return ''.join(result)
+
+def _clean_value(text, prop):
+    text = re.sub(r'\s+', ' ', text).strip()
+    text = re.sub(r'\s*,\s*', ',', text)
+    text = re.sub(r'\(\s+', '(', text)
+    text = re.sub(r'\s+\)', ')', text)
+    text = re.sub(r'\s*!\s*important$', '!important', text, flags=re.IGNORECASE)
+    if prop.startswith('--') or prop == 'unicode-range':
+        return text
+    text = re.sub(r'(?<![\w-])rgb\((\d{1,3}),(\d{1,3}),(\d{1,3})\)', _rgb_to_hex, text, flags=re.IGNORECASE)
+    text = re.sub(r'#([0-9a-fA-F]{6})(?![0-9a-fA-F])', _short_hex, text)
+    text = _short_numbers(text)
+    if prop == 'font-weight':
+        text = {'normal': '400', 'bold': '700'}.get(text.lower(), text)
+    return text
+
+def _serialize_declaration(tokens):
+    for i, (kind, value) in enumerate(tokens):
+        if kind == 'punct' and value == ':':
+            prop = _join(tokens[:i], lambda t: re.sub(r'\s+', '', t))
+            value = _join(tokens[i + 1:], lambda t: _clean_value(t, prop.lower()))
+            return prop, value
+    # Not a property: value pair (IE hacks and the like), keep it as-is
+    return _join(tokens, lambda t: re.sub(r'\s+', ' ', t).strip()), None
+
+def _declarations_text(declarations):
+    parts = []
+    seen = {}
+    for prop, value in declarations:
+        text = prop if value is None else f'{prop}:{value}'
+        # An exact duplicate declaration only matters at its last position
+        if text in seen:
+            parts[seen[text]] = None
+        seen[text] = len(parts)
+        parts.append(text)
+    return ';'.join(p for p in parts if p is not None)
+
+def _split_selectors(selector):
+    parts = []
+    depth = 0
+    current = ''
+    for ch in selector:
+        if ch in '([':
+            depth += 1
+        elif ch in ')]':
+            depth -= 1
+        if ch == ',' and depth == 0:
+            parts.append(current)
+            current = ''
+        else:
+            current += ch
+    parts.append(current)
+    return parts
+
+# User-action states; a page's first paint never needs these
+STATE_PSEUDO_CLASSES = re.compile(r':(hover|focus|focus-within|focus-visible|active|visited|checked|invalid|valid)\b')
+
+def _selector_can_match(selector, used):
+    # Conservative: only drop a selector when it requires a class, id or element the site never uses.
+    # used may also carry 'prefixes' (class prefixes that always count as used) and
+    # 'first_paint' (drop selectors that only apply after user interaction).
+    if used.get('first_paint') and STATE_PSEUDO_CLASSES.search(selector):
+        return False
+    if re.search(r':(is|where|has|matches|-\w+-any)\(', selector):
+        return True
+    selector = re.sub(r'\[[^\]]*\]', '', selector)
+    selector = re.sub(r':not\([^)]*\)', '', selector)
+    selector = re.sub(r'::?[\w-]+(\([^)]*\))?', '', selector)
+    for prefix, name in re.findall(r'([.#]?)((?:\\.|[\w-])+)', selector):
+        name = re.sub(r'\\(.)', r'\1', name)
+        if prefix == '.':
+            if name not in used['classes'] and not name.startswith(used.get('prefixes', ())):
+                return False
+        elif prefix == '#':
+            if name not in used['ids']:
+                return False
+        elif name.lower() not in used['tags'] and not re.match(r'^-?\d', name):
+            return False
+    return True
+
+def _minify_nodes(nodes):
+    out = []
+    for node in nodes:
+        if node['type'] == 'comment':
+            out.append({'kind': 'text', 'text': node['text']})
+        elif node['type'] == 'rule':
+            selector = _join(node['prelude'], _clean_selector)
+            declarations = [_serialize_declaration(d) for d in node['declarations']]
+            if not selector or not declarations:
+                continue
+            out.append({'kind': 'rule', 'selector': selector, 'declarations': declarations})
+        else:
+            name = node['name'].lower()
+            prelude = _join(node['prelude'], _clean_prelude)
+            head = name + (' ' + prelude if prelude and not prelude.startswith('(') else prelude)
+            if node['block'] is None:
+                out.append({'kind': 'text', 'text': head + ';'})
+            elif node.get('nested'):
+                children = _minify_nodes(node['block'])
+                if children:
+                    out.append({'kind': 'block', 'head': head, 'name': at_rule_name(name), 'prelude': prelude, 'children': children})
+            else:
+                declarations = [_serialize_declaration(d) for d in node['block']]
+                if declarations:
+                    out.append({'kind': 'rule', 'selector': head, 'declarations': declarations, 'at': True})
+    return _merge_rules(out)
+
+def _mergeable_selector(selector):
+    # A rule with a selector the browser doesn't understand is dropped entirely, so never merge
+    # vendor-prefixed pseudo selectors into another rule
+    return not re.search(r':-|::-', selector)
+
+def _merge_rules(items):
+    merged = []
+    for item in items:
+        previous = merged[-1] if merged else None
+        if previous and item['kind'] == 'rule' and previous['kind'] == 'rule' and not item.get('at') and not previous.get('at'):
+            if item['selector'] == previous['selector']:
+                previous['declarations'] = previous['declarations'] + item['declarations']
+                continue
+            if (_declarations_text(item['declarations']) == _declarations_text(previous['declarations'])
+                    and _mergeable_selector(item['selector']) and _mergeable_selector(previous['selector'])):
+                previous['selector'] = previous['selector'] + ',' + item['selector']
+                continue
+        merged.append(item)
+    return merged
+
+def _prune_rules(items, used):
+    # Returns new items without the selectors (and then rules) that can't match; input is untouched
+    kept = []
+    for item in items:
+        if item['kind'] == 'rule' and not item.get('at'):
+            selectors = [s for s in _split_selectors(item['selector']) if _selector_can_match(s, used)]
+            if selectors:
+                kept.append(dict(item, selector=','.join(selectors)))
+        elif item['kind'] == 'block' and item['name'] != 'keyframes':
+            children = _prune_rules(item['children'], used)
+            if children:
+                kept.append(dict(item, children=children))
+        else:
+            kept.append(item)
+    return kept
+
+def _prune_keyframes(items, used_animations):
+    kept = []
+    for item in items:
+        if item['kind'] == 'block':
+            if item['name'] == 'keyframes':
+                if item['prelude'] not in used_animations:
+                    continue
+            else:
+                children = _prune_keyframes(item['children'], used_animations)
+                if not children:
+                    continue
+                item = dict(item, children=children)
+        kept.append(item)
+    return kept
+
+def _used_animations(items, names):
+    for item in items:
+        if item['kind'] == 'rule':
+            for prop, value in item['declarations']:
+                if value and re.sub(r'^-[a-z]+-', '', prop.lower()) in ('animation', 'animation-name'):
+                    names.update(re.findall(r'[\w-]+', value))
+        elif item['kind'] == 'block':
+            _used_animations(item['children'], names)
+    return names
 
-def minify_css(content):
-    # Remove comments
-    content = re.sub(r'/\*[\s\S]*?\*/', '', content)
-    # Remove whitespace
-    content = re.sub(r'\s+', ' ', content)
-    content = re.sub(r'\s*([\{\};:,])\s*', r'\1', content)
-    content = content.replace(';}', '}')
-    return content.strip()
+def _serialize(items):
+    parts = []
+    for item in items:
+        if item['kind'] == 'text':
+            parts.append(item['text'])
+        elif item['kind'] == 'rule':
+            parts.append(item['selector'] + '{' + _declarations_text(item['declarations']) + '}')
+        else:
+            parts.append(item['head'] + '{' + _serialize(item['children']) + '}')
+    return ''.join(parts)
+
+def parse_stylesheet(content):
+    # Tokenized, cleaned and merged rules, ready for prune_stylesheet/serialize_stylesheet
+    return _minify_nodes(parse_css(tokenize_css(content)))
+
+def prune_stylesheet(items, used, standalone=True):
+    # used: {'classes', 'ids', 'tags'} sets, e.g. from collect_used_selectors().
+    # Drops rules that can't match, then @keyframes no remaining rule animates with.
+    # standalone=False also drops @import/@charset and license comments (for CSS inlined into a page).
+    items = _prune_rules(items, used)
+    items = _prune_keyframes(items, _used_animations(items, set()) | used['classes'])
+    if not standalone:
+        items = [i for i in items if i['kind'] != 'text']
+    return items
+
+def serialize_stylesheet(items):
+    return _serialize(items)
+
+def minify_css(content, used=None):
+    # used: the output of collect_used_selectors(); when given, rules that can't match any page are dropped
+    items = parse_stylesheet(content)
+    if used is not None:
+        items = prune_stylesheet(items, used)
+    return serialize_stylesheet(items)
+
+# Classes added at runtime that never appear in the HTML or in a plain JS string literal
+# (built by concatenation, or added by the vendor plugins).
+RUNTIME_CLASSES = {
+    'active', 'show', 'open', 'sopen', 'menu-open', 'sticky-active', 'collapsing', 'collapsed',
+    'fade', 'modal-open', 'modal-backdrop', 'offcanvas-backdrop', 'showing', 'hiding', 'animated',
+}
+RUNTIME_CLASS_PREFIXES = ('swiper-', 'mfp-', 'lenis', 'nice-select', 'wow', 'animate__')
+
+ALWAYS_USED_TAGS = {'html', 'body', '*'}
+
+def _js_tokens(content):
+    # Every identifier-like word inside a JS string or template literal
+    tokens = set()
+    for match in re.finditer(r'''"(?:\\.|[^"\\\n])*"|'(?:\\.|[^'\\\n])*'|`(?:\\.|[^`\\])*`''', content):
+        tokens.update(re.findall(r'[A-Za-z_-][\w-]*', match.group(0)[1:-1]))
+    return tokens
+
+def site_pages(root_dir):
+    pages = glob.glob(os.path.join(root_dir, '*.html'))
+    pages += glob.glob(os.path.join(root_dir, 'mini-games', '**', '*.html'), recursive=True)
+    return sorted(pages)
+
+def site_scripts(root_dir):
+    # The site's own scripts: assets/js and the mini-game code extracted by precache_games.py.
+    # Not .min.js files (the vendor libraries ship only minified; the site's own minified files
+    # are built from a source next to them), bundles or fingerprinted copies: their string
+    # literals would mark thousands of vendor class names as used.
+    scripts = glob.glob(os.path.join(root_dir, 'assets', 'js', '*.js'))
+    scripts += glob.glob(os.path.join(root_dir, 'mini-games', '*', '*.js'))
+    own = []
+    for script in sorted(scripts):
+        name = os.path.basename(script)
+        if name.endswith('.min.js') or derived_from(name) != name:
+            continue
+        own.append(script)
+    return own
+
+def collect_used_selectors(root_dir, skip_scripts=(), render=None):
+    # Every class, id and element used across the site's pages, plus anything the site's own
+    # scripts could add at runtime (string literals in site_scripts() and inline <script>s).
+    # skip_scripts: file names to ignore as well
+    # render: function(content, page path) -> content, to scan a page as a build will write it
+    used = {'classes': set(RUNTIME_CLASSES), 'ids': set(), 'tags': set(ALWAYS_USED_TAGS), 'prefixes': RUNTIME_CLASS_PREFIXES}
+    sources = []
+    for page in site_pages(root_dir):
+        with open(page, 'r', encoding='utf-8') as f:
+            content = f.read()
+        sources.append(render(content, page) if render else content)
+    scripts = []
+    for script in site_scripts(root_dir):
+        if os.path.basename(script) in skip_scripts:
+            continue
+        with open(script, 'r', encoding='utf-8') as f:
+            scripts.append(f.read())
+    for content in sources + scripts:
+        for match in re.finditer(r'''\bclass(?:Name)?\s*=\s*("[^"]*"|'[^']*')''', content):
+            used['classes'].update(match.group(1)[1:-1].split())
+        for match in re.finditer(r'''\bid\s*=\s*("[^"]*"|'[^']*')''', content):
+            used['ids'].update(match.group(1)[1:-1].split())
+        used['tags'].update(t.lower() for t in re.findall(r'<([a-zA-Z][\w-]*)', content))
+    for content in scripts + [s for page in sources for s in re.findall(r'<script\b[^>]*>(.*?)</script>', page, re.DOTALL | re.IGNORECASE)]:
+        tokens = _js_tokens(content)
+        used['classes'].update(tokens)
+        used['ids'].update(tokens)
+        used['tags'].update(t.lower() for t in tokens)
+    return used
+
+# JS minifier.
+# A small tokenizer that knows about strings, template literals (including nested ${} expressions),
+# regex literals and comments, so removing comments and whitespace can never touch their contents.
+# Newlines are kept wherever automatic semicolon insertion could depend on them.
+
+JS_KEYWORDS_BEFORE_EXPRESSION = {
+    'return', 'typeof', 'instanceof', 'in', 'of', 'new', 'delete', 'void', 'throw',
+    'case', 'do', 'else', 'yield', 'await',
+}
+
+js_word_pattern = re.compile(r'(?:[\w$]|\\u[0-9a-fA-F{]|[^\x00-\x7f])+')
+js_number_pattern = re.compile(r'(?:0[xXoObB][\da-fA-F_]+n?|(?:\d[\d_]*\.?[\d_]*|\.\d[\d_]*)(?:[eE][+-]?\d+)?n?)')
+js_punct_pattern = re.compile(r'>>>=|\.\.\.|===|!==|\*\*=|<<=|>>=|>>>|\?\?=|&&=|\|\|=|=>|==|!=|<=|>=|&&|\|\||\?\?|\?\.(?!\d)|\+\+|--|\+=|-=|\*=|/=|%=|&=|\|=|\^=|\*\*|<<|>>|[{}()\[\];,<>+\-*/%&|^!~?:=.@#]')
+
+# A newline can be dropped after these (nothing can end a statement there) ...
+JS_NO_ASI_AFTER = {
+    '{', '(', '[', ',', ';', ':', '?', '.', '?.', '...', '=>', '=', '==', '===', '!=', '!==', '<', '>', '<=', '>=',
+    '+', '-', '*', '/', '%', '**', '&', '|', '^', '!', '~', '&&', '||', '??', '<<', '>>', '>>>',
+    '+=', '-=', '*=', '/=', '%=', '**=', '&=', '|=', '^=', '<<=', '>>=', '>>>=', '&&=', '||=', '??=',
+}
+# ... or before these (they always continue the previous line)
+JS_NO_ASI_BEFORE = {'}', ')', ']', ',', ';', ':', '?', '.', '?.', '=', '==', '===', '!=', '!==', '=>', '&&', '||', '??'}
+
+def _skip_js_string(src, i):
+    quote = src[i]
+    i += 1
+    while i < len(src):
+        ch = src[i]
+        if ch == '\\':
+            i += 2
+            continue
+        if ch == quote or ch == '\n':
+            return i + 1
+        i += 1
+    return i
+
+def _skip_js_template(src, i):
+    # i points at the opening backtick; returns the index after the closing one
+    i += 1
+    while i < len(src):
+        ch = src[i]
+        if ch == '\\':
+            i += 2
+        elif ch == '`':
+            return i + 1
+        elif ch == '$' and src.startswith('${', i):
+            i = _skip_js_expression(src, i + 2)
+        else:
+            i += 1
+    return i
+
+def _skip_js_expression(src, i):
+    # Skips a ${ ... } template expression, honouring nested braces, strings, templates and comments
+    depth = 0
+    while i < len(src):
+        ch = src[i]
+        if ch in '\'"':
+            i = _skip_js_string(src, i)
+        elif ch == '`':
+            i = _skip_js_template(src, i)
+        elif src.startswith('//', i):
+            end = src.find('\n', i)
+            i = len(src) if end == -1 else end
+        elif src.startswith('/*', i):
+            end = src.find('*/', i + 2)
+            i = len(src) if end == -1 else end + 2
+        elif ch == '{':
+            depth += 1
+            i += 1
+        elif ch == '}':
+            if depth == 0:
+                return i + 1
+            depth -= 1
+            i += 1
+        else:
+            i += 1
+    return i
+
+def _skip_js_regex(src, i):
+    i += 1
+    in_class = False
+    while i < len(src):
+        ch = src[i]
+        if ch == '\\':
+            i += 2
+            continue
+        if ch == '\n':
+            break
+        if in_class:
+            if ch == ']':
+                in_class = False
+        elif ch == '[':
+            in_class = True
+        elif ch == '/':
+            i += 1
+            while i < len(src) and (src[i].isalnum() or src[i] in '_$'):
+                i += 1
+            return i
+        i += 1
+    return i
+
+def _regex_allowed(previous):
+    # Whether a '/' here starts a regex literal rather than a division
+    if previous is None:
+        return True
+    kind, value = previous
+    if kind == 'word':
+        return value in JS_KEYWORDS_BEFORE_EXPRESSION
+    if kind == 'punct':
+        return value not in (')', ']', '}', '++', '--')
+    return False
+
+def tokenize_js(src):
+    # Returns (kind, value) tokens; kind is one of ws, newline, comment, string, template, regex,
+    # number, word, punct
+    tokens = []
+    previous = None
+    i = 0
+    while i < len(src):
+        ch = src[i]
+        if ch in ' \t\r\n\f\v\ufeff\u00a0\u2028\u2029':
+            j = i
+            while j < len(src) and src[j] in ' \t\r\n\f\v\ufeff\u00a0\u2028\u2029':
+                j += 1
+            text = src[i:j]
+            tokens.append(('newline' if any(c in text for c in '\n\r\u2028\u2029') else 'ws', text))
+            i = j
+            continue
+        if src.startswith('//', i) or (src.startswith('<!--', i)) or (src.startswith('#!', i) and i == 0):
+            j = src.find('\n', i)
+            j = len(src) if j == -1 else j
+            tokens.append(('comment', src[i:j]))
+            i = j
+            continue
+        if src.startswith('/*', i):
+            j = src.find('*/', i + 2)
+            j = len(src) if j == -1 else j + 2
+            tokens.append(('comment', src[i:j]))
+            # A multi-line comment counts as a line terminator for ASI
+            if '\n' in src[i:j]:
+                tokens.append(('newline', '\n'))
+            i = j
+            continue
+        if ch in '\'"':
+            j = _skip_js_string(src, i)
+            token = ('string', src[i:j])
+        elif ch == '`':
+            j = _skip_js_template(src, i)
+            token = ('template', src[i:j])
+        elif ch == '/' and _regex_allowed(previous):
+            j = _skip_js_regex(src, i)
+            token = ('regex', src[i:j])
+        else:
+            match = js_number_pattern.match(src, i) if (ch.isdigit() or (ch == '.' and src[i + 1:i + 2].isdigit())) else None
+            if match:
+                token = ('number', match.group())
+            else:
+                match = js_word_pattern.match(src, i) or js_punct_pattern.match(src, i)
+                if match:
+                    token = ('word' if js_word_pattern.match(match.group()) else 'punct', match.group())
+                else:
+                    token = ('punct', ch)
+            j = i + len(token[1])
+        tokens.append(token)
+        previous = token
+        i = j
+    return tokens
+
+def _js_needs_space(left, right):
+    a, b = left[1], right[1]
+    if js_word_pattern.match(a[-1]) and js_word_pattern.match(b[0]):
+        return True
+    if left[0] == 'number' and b[0] == '.':
+        return True
+    # a + +b, a - -b, a+ ++b, a- --b
+    if a[-1] in '+-' and b[0] == a[-1]:
+        return True
+    # Don't glue something onto a regex literal's flags, or turn / / into a comment
+    if a.endswith('/') and b[0] in '/*':
+        return True
+    if left[0] == 'regex' and js_word_pattern.match(b[0]):
+        return True
+    if a == '<' and b.startswith('!--') or a.endswith('-') and b.startswith('->'):
+        return True
+    return False
 
 def minify_js(content):
-    # Very basic JS minification (safe removal of comments and whitespace)
-    # Removing single line comments (risky if inside strings, but for main.js usually safe if code is standard)
-    # We will use a simple approach: remove block comments, remove leading/trailing whitespace per line.
-    
-    # Remove block comments
-    content = re.sub(r'/\*[\s\S]*?\*/', '', content)
-    
-    lines = content.split('\n')
-    minified_lines = []
-    for line in lines:
-        # constant removal of // comments is risky without a proper parser
-        # so we will just strip whitespace and join
-        line = line.strip()
-        if line and not line.startswith('//'):
-             minified_lines.append(line)
-             
-    # This is a weak minification for JS but better than nothing without external deps.
-    # ideally we'd use a library. 
-    return '\n'.join(minified_lines)
-
-def process_file(file_path, minifier_func, ext):
+    tokens = [t for t in tokenize_js(content) if t[0] != 'comment' or t[1].startswith('/*!')]
+    out = []
+    previous = None
+    pending_newline = False
+    pending_space = False
+    for token in tokens:
+        kind, value = token
+        if kind == 'newline':
+            pending_newline = True
+            continue
+        if kind == 'ws':
+            pending_space = True
+            continue
+        if previous is not None:
+            if pending_newline and not (
+                (previous[0] == 'punct' and previous[1] in JS_NO_ASI_AFTER)
+                or (kind == 'punct' and value in JS_NO_ASI_BEFORE)
+            ):
+                out.append('\n')
+            elif (pending_space or pending_newline) and _js_needs_space(previous, token):
+                out.append(' ')
+            elif previous[0] == 'comment':
+                out.append('\n')
+        out.append(value)
+        previous = token
+        pending_newline = pending_space = False
+    return ''.join(out).strip()
+
+def process_file(file_path, minifier_func, ext, new_path=None):
     try:
         with open(file_path, 'r', encoding='utf-8') as f:
             content = f.read()
             
         minified = minifier_func(content)
         
-        new_path = file_path.replace(f'.{ext}', f'.min.{ext}')
+        new_path = new_path or file_path.replace(f'.{ext}', f'.min.{ext}')
         
         with open(new_path, 'w', encoding='utf-8') as f:
             f.write(minified)
             
         original_size = len(content)
         new_size = len(minified)
-        print(f"Minified {file_path}: {original_size/1024:.2f}KB -> {new_size/1024:.2f}KB (Saved: {(original_size-new_size)/1024:.2f}KB)")
+        # What actually goes over the wire (compress_assets.py writes the same level as a sidecar)
+        compressed_size = len(gzip.compress(minified.encode('utf-8'), compresslevel=9, mtime=0))
+        print(f"Minified {file_path}: {original_size/1024:.2f}KB -> {new_size/1024:.2f}KB "
+              f"(Saved: {(original_size-new_size)/1024:.2f}KB, gzip: {compressed_size/1024:.2f}KB)")
         return True
     except Exception as e:
         print(f"Error minifying {file_path}: {e}")
         return False
 
+# Vendor stylesheets that only ship as .min.css; --prune writes a pruned copy next to them
+# (update_html_links.py swaps the page links over once the pruned file exists)
+PRUNED_VENDOR_CSS = ['bootstrap.min.css', 'animate.min.css']
+
+def pruned_path(file_path):
+    return re.sub(r'(\.min)?\.css$', '.pruned.min.css', file_path)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Minify the site's own CSS and JS.")
+    parser.add_argument('root', nargs='?', default=os.path.dirname(os.path.abspath(__file__)),
+                        help="site root (defaults to this script's directory)")
+    parser.add_argument('--prune', action='store_true',
+                        help="drop CSS rules that can't match any page, and write pruned vendor stylesheets")
+    parser.add_argument('--no-inline', action='store_true', help="keep small url() images as separate requests")
+    args = parser.parse_args(argv)
+
+    css_dir = os.path.join(args.root, 'assets', 'css')
+    js_dir = os.path.join(args.root, 'assets', 'js')
+    css_minifier = minify_css
+    if args.prune:
+        used = collect_used_selectors(args.root)
+        print(f"Used selectors: {len(used['classes'])} classes, {len(used['ids'])} ids, {len(used['tags'])} elements")
+        css_minifier = functools.partial(minify_css, used=used)
+
+    style_path = os.path.join(css_dir, 'style.css')
+    style_minifier = css_minifier
+    if not args.no_inline:
+        # Small url() images become data: URIs in style.min.css (see inline_images.py)
+        style_minifier = lambda content: inline_css_images(css_minifier(content), style_path, args.root)
+    ok = process_file(style_path, style_minifier, 'css')
+    ok &= process_file(os.path.join(js_dir, 'main.js'), minify_js, 'js')
+    ok &= process_file(os.path.join(js_dir, 'app-loader.js'), minify_js, 'js')
+    if args.prune:
+        for name in PRUNED_VENDOR_CSS:
+            file_path = os.path.join(css_dir, name)
+            ok &= process_file(file_path, css_minifier, 'css', pruned_path(file_path))
+    return 0 if ok else 1
+
 if __name__ == "__main__":
-    process_file('e:/appdev/vexil-logic-games/assets/css/style.css', minify_css, 'css')
-    process_file('e:/appdev/vexil-logic-games/assets/js/main.js', minify_js, 'js')
-    process_file('e:/appdev/vexil-logic-games/assets/js/app-loader.js', minify_js, 'js')
+    sys.exit(main())
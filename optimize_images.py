@@ -1,62 +1,291 @@
+import argparse
 import os
+import sys
+import PIL
 from PIL import Image
 from pathlib import Path
 
-def convert_to_webp(directory):
+from build_cache import BuildCache, CACHE_FILE_NAME, DEFAULT_CACHE_PATH
+from build_jobs import run_jobs
+from fingerprint_assets import is_fingerprinted
+from image_quality import choose_params, describe, encode, normalize, search_settings
+from inline_images import SPRITE_SHEET
+from responsive_images import MIN_VARIANT_RATIO, WIDTHS, is_variant, variant_path
+
+extensions = {'.png', '.jpg', '.jpeg', '.PNG', '.JPG', '.JPEG'}
+# Variants of a WebP that is already lossy (no PNG/JPG left next to it) are encoded at this quality
+# instead of searched: scored against a source that has lost detail already, the search ends at
+# QUALITY_MIN nearly every time and costs most of the run
+LOSSY_SOURCE_QUALITY = 80
+
+def is_build_output(file_path):
+    # Fingerprinted copies and the sprite sheet are made from other images by the pipeline:
+    # converting them or giving them a width ladder only adds files nothing references
+    return is_fingerprinted(file_path.name) or file_path.resolve().as_posix().endswith('/' + SPRITE_SHEET)
+
+def encoder_settings(quality):
+    # Everything that affects the encoded bytes. A change here invalidates the cached entries.
+    # quality=None is the adaptive mode: params are searched per image (see image_quality.py)
+    if quality is None:
+        return {'format': 'WEBP', 'search': search_settings(), 'pillow': PIL.__version__}
+    return {'format': 'WEBP', 'quality': quality, 'pillow': PIL.__version__}
+
+def cached_params(entry, cache, file_path, settings):
+    # Params chosen by an earlier search for this exact source and settings, so a rebuilt output
+    # (deleted or hand-edited file) doesn't repeat the search
+    if entry and entry.get('settings') == settings and entry.get('source') == cache.fingerprint(file_path):
+        return entry.get('params')
+    return None
+
+def is_lossy_webp(path):
+    # True when the WebP's image data is VP8 (lossy) rather than VP8L (lossless)
+    with open(path, 'rb') as f:
+        if f.read(12)[8:12] != b'WEBP':
+            return False
+        while True:
+            header = f.read(8)
+            if len(header) < 8:
+                return False
+            chunk, size = header[:4], int.from_bytes(header[4:], 'little')
+            if chunk in (b'VP8 ', b'VP8L'):
+                return chunk == b'VP8 '
+            # Chunks are padded to an even size
+            f.seek(size + (size & 1), 1)
+
+def is_up_to_date(cache, file_path, webp_path, settings):
+    entry = cache.lookup('webp', cache.key(file_path))
+    if not entry or entry.get('settings') != settings:
+        return False
+    if entry.get('source') != cache.fingerprint(file_path):
+        return False
+    # A missing or hand-edited .webp no longer matches the stored output hash and gets rebuilt
+    return entry.get('output') == cache.fingerprint(webp_path)
+
+def encode_image(file_path, webp_path, params):
+    # Runs in a worker process, so it only returns plain data and never touches the cache.
+    # params None means search for them first.
+    try:
+        # Open image
+        with Image.open(file_path) as img:
+            # Converting PNG to WebP keeps transparency; palette and other modes go through RGB(A)
+            img = normalize(img)
+            
+            # Get original size
+            original_size = os.stat(file_path).st_size
+            
+            if params is None:
+                params, data = choose_params(img)
+            else:
+                data = encode(img, params)
+            
+            # Save as WebP
+            with open(webp_path, 'wb') as f:
+                f.write(data)
+            
+            # Get new size
+            new_size = os.stat(webp_path).st_size
+            
+        return {'file': file_path, 'original_size': original_size, 'new_size': new_size, 'params': params, 'error': None}
+    except Exception as e:
+        return {'file': file_path, 'error': str(e)}
+
+def resize_image(file_path, widths, params):
+    # Runs in a worker process. Writes one WebP per ladder width narrower than the source,
+    # all with the source's params (searched here first if it has none yet).
+    try:
+        outputs = []
+        with Image.open(file_path) as img:
+            img = normalize(img)
+            if params is None and any(width <= img.width * MIN_VARIANT_RATIO for width in widths):
+                params, _ = choose_params(img)
+            for width in widths:
+                if width > img.width * MIN_VARIANT_RATIO:
+                    continue
+                height = max(1, round(img.height * width / img.width))
+                # Always name-<width>w.webp, also when the source is the original PNG/JPG
+                out_path = variant_path(Path(file_path).with_suffix('.webp'), width)
+                with open(out_path, 'wb') as f:
+                    f.write(encode(img.resize((width, height), Image.LANCZOS), params))
+                outputs.append((width, os.stat(out_path).st_size))
+        return {'file': file_path, 'outputs': outputs, 'params': params, 'error': None}
+    except Exception as e:
+        return {'file': file_path, 'error': str(e)}
+
+def convert_to_webp(directory, quality=None, cache_path=DEFAULT_CACHE_PATH, force=False, jobs=None):
+    # quality=None searches the params per image; a number encodes everything at that quality
     total_savings = 0
-    params = [
-        ('assets/img', 80), # default quality
-    ]
     
-    extensions = {'.png', '.jpg', '.jpeg', '.PNG', '.JPG', '.JPEG'}
+    jobs = jobs or os.cpu_count() or 1
     
     print(f"Scanning directory: {directory}")
     
+    cache = BuildCache(cache_path)
+    settings = encoder_settings(quality)
+    
     count = 0
     errors = 0
     skips = 0
     
+    pending = []
     for root, dirs, files in os.walk(directory):
         for file in files:
             file_path = Path(root) / file
-            if file_path.suffix in extensions:
+            if file_path.suffix in extensions and not is_build_output(file_path):
                 # Target path
                 webp_path = file_path.with_suffix('.webp')
                 
-                # Skip if webp already exists and is newer? 
-                # For now, just overwrite or create.
+                # Skip if the source, the encoder settings and the stored output are all unchanged
+                if not force and is_up_to_date(cache, file_path, webp_path, settings):
+                    skips += 1
+                    continue
                 
-                try:
-                    # Open image
-                    with Image.open(file_path) as img:
-                        # Convert to RGB if necessary (for PNGs with alpha that might be saved as JPG, 
-                        # but WebP handles RGBA fine).
-                        # However, converting PNG to WebP keeps transparency.
-                        
-                        # Get original size
-                        original_size = file_path.stat().st_size
-                        
-                        # Save as WebP
-                        img.save(webp_path, 'WEBP', quality=80)
-                        
-                        # Get new size
-                        new_size = webp_path.stat().st_size
-                        
-                        savings = original_size - new_size
-                        total_savings += savings
-                        
-                        print(f"Converted: {file} | {original_size/1024:.1f}KB -> {new_size/1024:.1f}KB | Saved: {savings/1024:.1f}KB")
-                        count += 1
-                        
-                except Exception as e:
-                    print(f"Error converting {file}: {e}")
-                    errors += 1
+                params = {'quality': quality} if quality is not None else None
+                if params is None and not force:
+                    params = cached_params(cache.lookup('webp', cache.key(file_path)), cache, file_path, settings)
+                pending.append((file_path.stat().st_size, (str(file_path), str(webp_path), params)))
+    
+    for result in run_jobs(encode_image, pending, jobs, 'images'):
+        file = os.path.basename(result['file'])
+        if result['error']:
+            print(f"Error converting {file}: {result['error']}")
+            errors += 1
+            continue
+        
+        original_size = result['original_size']
+        new_size = result['new_size']
+        savings = original_size - new_size
+        total_savings += savings
+        
+        print(f"Converted: {file} | {original_size/1024:.1f}KB -> {new_size/1024:.1f}KB | Saved: {savings/1024:.1f}KB | {describe(result['params'])}")
+        count += 1
+        
+        file_path = Path(result['file'])
+        cache.store('webp', cache.key(file_path), {
+            'source': cache.fingerprint(file_path),
+            'settings': settings,
+            'output': cache.fingerprint(file_path.with_suffix('.webp')),
+            'params': result['params'],
+        })
+
+    cache.save()
 
     print("-" * 30)
     print(f"Conversion Complete.")
     print(f"Total Images: {count}")
+    print(f"Skipped (unchanged): {skips}")
     print(f"Total Space Saved: {total_savings / (1024*1024):.2f} MB")
     print(f"Errors: {errors}")
+    return {'converted': count, 'skipped': skips, 'errors': errors, 'savings': total_savings}
+
+def variant_source(webp_path):
+    # Prefer the original PNG/JPG when it is still around so variants aren't encoded twice
+    for ext in ('.png', '.jpg', '.jpeg', '.PNG', '.JPG', '.JPEG'):
+        original = webp_path.with_suffix(ext)
+        if original.exists():
+            return original
+    return webp_path
+
+def variants_up_to_date(cache, file_path, webp_path, settings):
+    entry = cache.lookup('variants', cache.key(webp_path))
+    if not entry or entry.get('settings') != settings:
+        return False
+    if entry.get('source') != cache.fingerprint(file_path):
+        return False
+    for width, digest in entry.get('outputs', {}).items():
+        if cache.fingerprint(variant_path(webp_path, int(width))) != digest:
+            return False
+    return True
+
+def generate_variants(directory, widths=WIDTHS, quality=None, cache_path=DEFAULT_CACHE_PATH, force=False, jobs=None):
+    # Writes the responsive width ladder (name-320w.webp, name-640w.webp, ...) for every WebP image
+    jobs = jobs or os.cpu_count() or 1
+    widths = sorted(widths)
+    
+    print(f"Generating {'/'.join(map(str, widths))}w variants in: {directory}")
+    
+    cache = BuildCache(cache_path)
+    settings = dict(encoder_settings(quality), widths=widths)
+    if quality is None:
+        settings['lossy_source_quality'] = LOSSY_SOURCE_QUALITY
+    
+    count = 0
+    errors = 0
+    skips = 0
+    variant_bytes = 0
+    
+    pending = []
+    for root, dirs, files in os.walk(directory):
+        for file in files:
+            webp_path = Path(root) / file
+            if webp_path.suffix != '.webp' or is_variant(webp_path) or is_build_output(webp_path):
+                continue
+            file_path = variant_source(webp_path)
+            if not force and variants_up_to_date(cache, file_path, webp_path, settings):
+                skips += 1
+                continue
+            params = {'quality': quality} if quality is not None else None
+            if params is None and file_path == webp_path and is_lossy_webp(webp_path):
+                params = {'quality': LOSSY_SOURCE_QUALITY}
+            if params is None and not force:
+                # The full-size WebP's params when it was converted from this source, else an earlier search
+                params = (cached_params(cache.lookup('webp', cache.key(file_path)), cache, file_path, encoder_settings(quality))
+                          or cached_params(cache.lookup('variants', cache.key(webp_path)), cache, file_path, settings))
+            pending.append((file_path.stat().st_size, (str(file_path), widths, params)))
+    
+    for result in run_jobs(resize_image, pending, jobs, 'images'):
+        file = os.path.basename(result['file'])
+        if result['error']:
+            print(f"Error resizing {file}: {result['error']}")
+            errors += 1
+            continue
+        
+        if result['outputs']:
+            sizes = ', '.join(f"{width}w {size/1024:.1f}KB" for width, size in result['outputs'])
+            print(f"Variants: {file} | {sizes} | {describe(result['params'])}")
+            variant_bytes += sum(size for _, size in result['outputs'])
+        count += 1
+        
+        file_path = Path(result['file'])
+        webp_path = file_path.with_suffix('.webp')
+        cache.store('variants', cache.key(webp_path), {
+            'source': cache.fingerprint(file_path),
+            'settings': settings,
+            'outputs': {str(width): cache.fingerprint(variant_path(webp_path, width)) for width, _ in result['outputs']},
+            'params': result['params'],
+        })
+
+    cache.save()
+
+    print("-" * 30)
+    print(f"Variants Complete.")
+    print(f"Images Resized: {count}")
+    print(f"Skipped (unchanged): {skips}")
+    print(f"Variant Size: {variant_bytes / (1024*1024):.2f} MB")
+    print(f"Errors: {errors}")
+    return {'resized': count, 'skipped': skips, 'errors': errors, 'bytes': variant_bytes}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert PNG/JPG images under assets/img to WebP.")
+    parser.add_argument('root', nargs='?', default=os.path.dirname(os.path.abspath(__file__)),
+                        help="site root (defaults to this script's directory)")
+    parser.add_argument('--jobs', '-j', type=int, default=os.cpu_count() or 1,
+                        help="number of encoder processes (default: CPU count)")
+    parser.add_argument('--quality', type=int, default=None,
+                        help="encode everything at this fixed quality instead of searching per image")
+    parser.add_argument('--force', action='store_true', help="re-encode images even if the cache says they are unchanged")
+    parser.add_argument('--widths', default=','.join(map(str, WIDTHS)), help="responsive variant widths")
+    parser.add_argument('--no-variants', action='store_true', help="skip generating responsive variants")
+    args = parser.parse_args(argv)
+    
+    directory = os.path.join(args.root, "assets", "img")
+    cache_path = os.path.join(args.root, CACHE_FILE_NAME)
+    stats = convert_to_webp(directory, quality=args.quality, cache_path=cache_path, force=args.force, jobs=args.jobs)
+    errors = stats['errors']
+    if not args.no_variants:
+        widths = [int(w) for w in args.widths.split(',') if w.strip()]
+        stats = generate_variants(directory, widths, quality=args.quality, cache_path=cache_path, force=args.force, jobs=args.jobs)
+        errors += stats['errors']
+    return 1 if errors else 0
 
 if __name__ == "__main__":
-    convert_to_webp("e:/appdev/vexil-logic-games/assets/img")
+    sys.exit(main())
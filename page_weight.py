@@ -0,0 +1,390 @@
+import argparse
+import json
+import os
+import re
+import sys
+import zlib
+from pathlib import Path
+
+from compress_assets import COMPRESS_SUFFIXES, GZIP_LEVEL
+from critical_css import DEFERRED_ATTRIBUTE
+from html_utils import iter_elements
+from reference_graph import SKIP_DIRS, import_pattern, resolve, url_pattern
+
+# Page weight report and budget gate.
+# For every HTML page, works out what a browser fetches to show it and adds it up:
+#   critical   what has to arrive before first render or is asked for at high priority: the page
+#              itself, blocking stylesheets (and their @imports and fonts), parser-blocking
+#              scripts, preloads and fetchpriority="high" images
+#   total      everything loaded with the page, lazy images included (also counted separately)
+# Images go through srcset/sizes the way a browser would for VIEWPORT_WIDTH at DEVICE_PIXEL_RATIO.
+# Compressed bytes are gzip at compress_assets.py's level for text assets and the raw size for
+# everything else (images and fonts are compressed already), so the numbers don't depend on
+# whether the sidecars have been built. External URLs count as requests with unknown bytes.
+#
+# Background images in external stylesheets only load when a rule matches, which can't be known
+# without the DOM, so they are left out; @font-face files are counted for every face (an upper
+# bound, browsers skip faces nothing uses).
+#
+# Results go to .page-weight.json and a table. Each page is checked against budgets (DEFAULT_BUDGETS,
+# overridden by page-budgets.json) and against the stored baseline (page-weight-baseline.json,
+# written with --update-baseline); any violation or regression exits 1, so this can gate a build.
+# Run it on the built site: the authored pages still load every stylesheet render-blocking.
+
+REPORT_FILE_NAME = '.page-weight.json'
+BUDGETS_FILE_NAME = 'page-budgets.json'
+BASELINE_FILE_NAME = 'page-weight-baseline.json'
+
+VIEWPORT_WIDTH = 1366
+DEVICE_PIXEL_RATIO = 1
+# Byte metrics may grow this much over the baseline before it counts as a regression
+# (request counts may not grow at all)
+BASELINE_TOLERANCE = 0.02
+
+# Per page ceilings, with headroom over the heaviest pages of the built site; the baseline catches
+# smaller regressions. page-budgets.json can tighten them as {"default": {...}, "pages": {"shop.html": {...}}}
+DEFAULT_BUDGETS = {
+    'critical_requests': 12,
+    'critical_gzip_bytes': 1024 * 1024,
+    'requests': 80,
+    'gzip_bytes': 3 * 1024 * 1024,
+}
+METRICS = ('requests', 'bytes', 'gzip_bytes', 'critical_requests', 'critical_bytes', 'critical_gzip_bytes',
+           'lazy_requests', 'lazy_bytes', 'external_requests')
+COUNT_METRICS = {'requests', 'critical_requests', 'lazy_requests', 'external_requests'}
+
+# Fetched with the page at low priority and never render-blocking
+NON_CRITICAL_RELS = {'icon', 'shortcut', 'manifest'}
+PRELOAD_RELS = {'preload', 'modulepreload'}
+SCRIPT_TYPES = {'', 'text/javascript', 'application/javascript', 'module'}
+
+media_feature_pattern = re.compile(r'\(\s*(min|max)-width\s*:\s*([\d.]+)px\s*\)', re.IGNORECASE)
+font_face_pattern = re.compile(r'@font-face\s*{([^}]*)}', re.IGNORECASE)
+length_pattern = re.compile(r'^([\d.]+)(px|vw)$', re.IGNORECASE)
+
+# Sizes per file for the whole run; the same stylesheets and scripts are on nearly every page
+_sizes = {}
+_stylesheets = {}
+
+def file_sizes(path):
+    # (raw bytes, gzip bytes), or None for a missing file
+    if path not in _sizes:
+        if not os.path.isfile(path):
+            _sizes[path] = None
+        else:
+            with open(path, 'rb') as f:
+                data = f.read()
+            gzip_size = len(data)
+            if Path(path).suffix.lower() in COMPRESS_SUFFIXES:
+                compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+                gzip_size = len(compressor.compress(data) + compressor.flush())
+            _sizes[path] = (len(data), gzip_size)
+    return _sizes[path]
+
+def media_matches(media, viewport):
+    # Just enough of media queries for this site: all/screen/print and min/max-width in px
+    media = (media or 'all').strip().lower()
+    if not media or media in ('all', 'screen'):
+        return True
+    if 'print' in media and 'screen' not in media:
+        return False
+    for kind, value in media_feature_pattern.findall(media):
+        value = float(value)
+        if (kind.lower() == 'min' and viewport < value) or (kind.lower() == 'max' and viewport > value):
+            return False
+    return True
+
+def slot_width(sizes, viewport):
+    # Evaluates a sizes attribute to a CSS pixel width; anything it can't read means the full viewport
+    for entry in (sizes or '').split(','):
+        entry = entry.strip()
+        if not entry:
+            continue
+        condition, _, length = entry.rpartition(' ') if entry.endswith(('px', 'vw')) else ('', '', entry)
+        if condition and not media_matches(condition, viewport):
+            continue
+        match = length_pattern.match(length.strip())
+        if not match:
+            return viewport
+        value = float(match.group(1))
+        return value if match.group(2).lower() == 'px' else viewport * value / 100
+    return viewport
+
+def pick_candidate(src, srcset, sizes, viewport, dpr):
+    # The URL a browser would pick: the smallest candidate covering the slot at this pixel ratio
+    candidates = []
+    for item in (srcset or '').split(','):
+        parts = item.split()
+        if not parts:
+            continue
+        descriptor = parts[1].lower() if len(parts) > 1 else '1x'
+        if descriptor.endswith('w'):
+            candidates.append((float(descriptor[:-1]), parts[0]))
+        elif descriptor.endswith('x'):
+            candidates.append((float(descriptor[:-1]) * slot_width(sizes, viewport), parts[0]))
+    if not candidates:
+        return src
+    needed = slot_width(sizes, viewport) * dpr
+    candidates.sort()
+    for width, url in candidates:
+        if width >= needed:
+            return url
+    return candidates[-1][1]
+
+def stylesheet_deps(path, root_dir):
+    # [(ref, kind, base_dir)] for @imports and font files of a stylesheet
+    if path not in _stylesheets:
+        deps = []
+        if os.path.isfile(path):
+            with open(path, 'r', encoding='utf-8', errors='replace') as f:
+                css = f.read()
+            deps = css_deps(css, os.path.dirname(path))
+        _stylesheets[path] = deps
+    return _stylesheets[path]
+
+def css_deps(css, base_dir, images=False):
+    deps = [(match.group(2), 'style', base_dir) for match in import_pattern.finditer(css)]
+    for face in font_face_pattern.finditer(css):
+        urls = [m.group(2) for m in url_pattern.finditer(face.group(1)) if m.group(2).strip()]
+        if urls:
+            # The browser takes the first format it supports; every browser we care about has woff2
+            woff2 = [url for url in urls if re.split(r'[?#]', url)[0].lower().endswith('.woff2')]
+            deps.append(((woff2 or urls)[0], 'font', base_dir))
+    if images:
+        # Inline styles (style attributes, <style> blocks) belong to this page, so their images count
+        outside_faces = font_face_pattern.sub('', css)
+        deps += [(m.group(2), 'image', base_dir) for m in url_pattern.finditer(outside_faces) if m.group(2).strip()]
+    return [dep for dep in deps if not dep[0].strip().startswith('data:')]
+
+class Page:
+    # The requests of one page, deduplicated by URL: critical wins over not, eager over lazy
+    def __init__(self, path, root_dir):
+        self.path = path
+        self.root_dir = root_dir
+        self.base_dir = os.path.dirname(path)
+        self.requests = {}
+
+    def add(self, ref, kind, base_dir, critical=False, lazy=False):
+        ref = ref.strip()
+        if not ref or ref.startswith(('data:', '#', 'mailto:', 'tel:', 'javascript:')):
+            return
+        key = resolve(ref, base_dir, self.root_dir)
+        if key is None:
+            if not re.match(r'^(https?:)?//', ref):
+                return
+            key = ref.split('#')[0]
+            external = True
+        else:
+            external = False
+        entry = self.requests.get(key)
+        if entry is not None:
+            entry['critical'] = entry['critical'] or critical
+            entry['lazy'] = entry['lazy'] and lazy
+            return
+        self.requests[key] = {'kind': kind, 'critical': critical, 'lazy': lazy, 'external': external}
+        if kind == 'style' and not external:
+            for dep_ref, dep_kind, dep_base in stylesheet_deps(os.path.join(self.root_dir, key), self.root_dir):
+                self.add(dep_ref, dep_kind, dep_base, critical=critical)
+
+def collect_requests(content, file_path, root_dir, viewport, dpr):
+    page = Page(file_path, root_dir)
+    page.add(os.path.basename(file_path), 'document', page.base_dir, critical=True)
+    picture_sources = []
+    for match, name, attributes, ancestors in iter_elements(content):
+        # <noscript> fallbacks (the deferred stylesheet links among them) don't load when scripts run
+        if any(tag == 'noscript' for tag, _ in ancestors) or name == 'noscript':
+            continue
+        if 'style' in attributes and attributes['style']:
+            for ref, kind, base in css_deps(attributes['style'], page.base_dir, images=True):
+                page.add(ref, kind, base)
+        if name == 'link':
+            rels = set(attributes.get('rel', '').lower().split())
+            href = attributes.get('href', '')
+            if 'stylesheet' in rels:
+                blocking = (DEFERRED_ATTRIBUTE not in attributes and 'disabled' not in attributes
+                            and media_matches(attributes.get('media'), viewport))
+                page.add(href, 'style', page.base_dir, critical=blocking)
+            elif rels & PRELOAD_RELS:
+                as_kind = attributes.get('as', 'script' if 'modulepreload' in rels else 'other')
+                if attributes.get('imagesrcset'):
+                    href = pick_candidate(href, attributes['imagesrcset'], attributes.get('imagesizes'), viewport, dpr)
+                page.add(href, as_kind, page.base_dir, critical=True)
+            elif rels & NON_CRITICAL_RELS:
+                page.add(href, 'other', page.base_dir)
+        elif name == 'script':
+            kind = attributes.get('type', '').lower()
+            if 'src' not in attributes or kind not in SCRIPT_TYPES:
+                continue
+            blocking = not ({'async', 'defer'} & set(attributes)) and kind != 'module'
+            page.add(attributes['src'], 'script', page.base_dir, critical=blocking)
+        elif name == 'style':
+            close = re.compile(r'</style\s*>', re.IGNORECASE).search(content, match.end())
+            css = content[match.end():close.start() if close else len(content)]
+            # Fonts of the inlined critical CSS block first render like those of a blocking stylesheet
+            for ref, kind, base in css_deps(css, page.base_dir, images=True):
+                page.add(ref, kind, base, critical=kind != 'image')
+        elif name == 'source' and ancestors and ancestors[-1][0] == 'picture':
+            if attributes.get('srcset') and media_matches(attributes.get('media'), viewport):
+                picture_sources.append(attributes)
+        elif name == 'img':
+            srcset, sizes = attributes.get('srcset'), attributes.get('sizes')
+            # Inside <picture> the first matching <source> replaces the img's own src
+            if ancestors and ancestors[-1][0] == 'picture' and picture_sources:
+                srcset, sizes = picture_sources[0].get('srcset'), picture_sources[0].get('sizes', sizes)
+            picture_sources = []
+            url = pick_candidate(attributes.get('src', ''), srcset, sizes, viewport, dpr)
+            lazy = attributes.get('loading', '').lower() == 'lazy'
+            high = attributes.get('fetchpriority', '').lower() == 'high'
+            page.add(url, 'image', page.base_dir, critical=high and not lazy, lazy=lazy)
+        elif name in ('video', 'audio', 'source', 'iframe'):
+            if name == 'source' and not (ancestors and ancestors[-1][0] in ('video', 'audio')):
+                continue
+            media = ancestors[-1][1] if name == 'source' else attributes
+            if media.get('preload', '').lower() == 'none' or media.get('loading', '').lower() == 'lazy':
+                continue
+            if attributes.get('src'):
+                page.add(attributes['src'], 'document' if name == 'iframe' else 'media', page.base_dir)
+            if attributes.get('poster'):
+                page.add(attributes['poster'], 'image', page.base_dir)
+    return page.requests
+
+def measure_page(file_path, root_dir, viewport=VIEWPORT_WIDTH, dpr=DEVICE_PIXEL_RATIO):
+    with open(file_path, 'r', encoding='utf-8', errors='replace') as f:
+        content = f.read()
+    requests = collect_requests(content, file_path, root_dir, viewport, dpr)
+    result = {metric: 0 for metric in METRICS}
+    missing = []
+    for key, request in requests.items():
+        sizes = None if request['external'] else file_sizes(os.path.join(root_dir, key))
+        if not request['external'] and sizes is None:
+            missing.append(key)
+        raw, gzip_size = sizes or (0, 0)
+        result['requests'] += 1
+        result['bytes'] += raw
+        result['gzip_bytes'] += gzip_size
+        if request['external']:
+            result['external_requests'] += 1
+        if request['critical']:
+            result['critical_requests'] += 1
+            result['critical_bytes'] += raw
+            result['critical_gzip_bytes'] += gzip_size
+        if request['lazy']:
+            result['lazy_requests'] += 1
+            result['lazy_bytes'] += raw
+    result['missing'] = sorted(missing)
+    result['resources'] = {key: request['kind'] + (' critical' if request['critical'] else '')
+                           + (' lazy' if request['lazy'] else '') for key, request in sorted(requests.items())}
+    return result
+
+def iter_pages(root_dir):
+    for root, dirs, files in os.walk(root_dir):
+        dirs[:] = sorted(d for d in dirs if d not in SKIP_DIRS and not d.startswith('.'))
+        for file in sorted(files):
+            if file.lower().endswith('.html'):
+                yield os.path.join(root, file)
+
+def load_json(path, default):
+    if not path or not os.path.isfile(path):
+        return default
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def write_json(data, path):
+    tmp_path = str(path) + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=1, sort_keys=True)
+        f.write('\n')
+    os.replace(tmp_path, path)
+
+def page_budget(budgets, page):
+    budget = dict(DEFAULT_BUDGETS)
+    budget.update(budgets.get('default', {}))
+    budget.update(budgets.get('pages', {}).get(page, {}))
+    return budget
+
+def check_page(page, result, budget, baseline, tolerance):
+    # Returns a list of problems: budget violations and regressions against the baseline
+    problems = []
+    for metric, limit in sorted(budget.items()):
+        if limit is not None and result.get(metric, 0) > limit:
+            problems.append(f"{metric} {format_value(metric, result[metric])} over budget {format_value(metric, limit)}")
+    previous = baseline.get('pages', {}).get(page)
+    if previous:
+        for metric in METRICS:
+            if metric not in previous:
+                continue
+            allowed = previous[metric] if metric in COUNT_METRICS else previous[metric] * (1 + tolerance)
+            if result[metric] > allowed:
+                problems.append(f"{metric} {format_value(metric, previous[metric])} -> {format_value(metric, result[metric])} (regression)")
+    return problems
+
+def format_value(metric, value):
+    return str(value) if metric in COUNT_METRICS else f"{value/1024:.1f}KB"
+
+def print_table(report):
+    header = f"{'Page':<40} {'Req':>4} {'Crit':>4} {'KB':>8} {'gz KB':>8} {'Crit KB':>8} {'Crit gz':>8} {'Lazy':>4} {'Ext':>4}  Status"
+    print(header)
+    print('-' * len(header))
+    for page, result in sorted(report['pages'].items()):
+        status = 'FAIL' if result['problems'] else 'ok'
+        print(f"{page:<40} {result['requests']:>4} {result['critical_requests']:>4} "
+              f"{result['bytes']/1024:>8.1f} {result['gzip_bytes']/1024:>8.1f} "
+              f"{result['critical_bytes']/1024:>8.1f} {result['critical_gzip_bytes']/1024:>8.1f} "
+              f"{result['lazy_requests']:>4} {result['external_requests']:>4}  {status}")
+    print('-' * len(header))
+    for page, result in sorted(report['pages'].items()):
+        for problem in result['problems']:
+            print(f"[BUDGET] {page}: {problem}")
+        for key in result['missing']:
+            print(f"[MISSING] {page}: {key}")
+
+def page_weight(root_dir, budgets, baseline, viewport=VIEWPORT_WIDTH, dpr=DEVICE_PIXEL_RATIO,
+                tolerance=BASELINE_TOLERANCE):
+    report = {'viewport': viewport, 'dpr': dpr, 'pages': {}}
+    for file_path in iter_pages(root_dir):
+        page = Path(os.path.relpath(file_path, root_dir)).as_posix()
+        result = measure_page(file_path, root_dir, viewport, dpr)
+        result['budget'] = page_budget(budgets, page)
+        result['problems'] = check_page(page, result, result['budget'], baseline, tolerance)
+        report['pages'][page] = result
+    return report
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Report what every page costs (requests, bytes, critical path) and check it against budgets and a baseline.")
+    parser.add_argument('root', nargs='?', default=os.path.dirname(os.path.abspath(__file__)),
+                        help="site root (defaults to this script's directory)")
+    parser.add_argument('--output', help=f"where to write the report JSON (default: <root>/{REPORT_FILE_NAME})")
+    parser.add_argument('--budgets', help=f"budget file (default: <root>/{BUDGETS_FILE_NAME} if present)")
+    parser.add_argument('--baseline', help=f"baseline file (default: <root>/{BASELINE_FILE_NAME})")
+    parser.add_argument('--update-baseline', action='store_true', help="store this run as the new baseline")
+    parser.add_argument('--viewport', type=int, default=VIEWPORT_WIDTH, help="viewport width in CSS px for srcset/sizes and media queries")
+    parser.add_argument('--dpr', type=float, default=DEVICE_PIXEL_RATIO, help="device pixel ratio for srcset")
+    parser.add_argument('--tolerance', type=float, default=BASELINE_TOLERANCE,
+                        help="allowed growth in bytes over the baseline, as a fraction")
+    args = parser.parse_args(argv)
+
+    budgets = load_json(args.budgets or os.path.join(args.root, BUDGETS_FILE_NAME), {})
+    baseline_path = args.baseline or os.path.join(args.root, BASELINE_FILE_NAME)
+    # The baseline is only compared against, not enforced, when it is about to be replaced
+    baseline = {} if args.update_baseline else load_json(baseline_path, {})
+    if baseline and (baseline.get('viewport'), baseline.get('dpr')) != (args.viewport, args.dpr):
+        # Different srcset picks would show up as regressions that aren't
+        print(f"Baseline was taken at {baseline.get('viewport')}px @{baseline.get('dpr')}x; not comparing")
+        baseline = {}
+    report = page_weight(args.root, budgets, baseline, args.viewport, args.dpr, args.tolerance)
+
+    output = args.output or os.path.join(args.root, REPORT_FILE_NAME)
+    write_json(report, output)
+    print_table(report)
+    failed = sorted(page for page, result in report['pages'].items() if result['problems'])
+    print(f"Pages: {len(report['pages'])}")
+    print(f"Over budget or regressed: {len(failed)}")
+    print(f"Report written to {output}")
+    if args.update_baseline:
+        pages = {page: {metric: result[metric] for metric in METRICS} for page, result in report['pages'].items()}
+        write_json({'viewport': args.viewport, 'dpr': args.dpr, 'pages': pages}, baseline_path)
+        print(f"Baseline written to {baseline_path}")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
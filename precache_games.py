@@ -0,0 +1,277 @@
+import json
+import os
+import re
+import sys
+import textwrap
+from pathlib import Path
+
+from build_cache import cache_for_root, hash_text, is_dry_run
+from html_utils import iter_elements
+from minify_assets import minify_css, minify_js
+from reference_graph import IMAGE_SUFFIXES, derived_from, extract_refs, resolve
+
+# Offline mini-games.
+# The arcade games under mini-games/ are single index.html files with all their code inline, and
+# every relaunch goes back to the network for all of it. Two parts:
+#
+# 'game-assets' stage: moves each game's inline <style> and <script> out to game.css / game.js next
+# to the page (once; those become the sources to edit) and links game.min.css / game.min.js, which
+# it keeps minified from the sources on every run. External files can be cached; inline code can't.
+# Game pages and the mini-games hub also get a small snippet registering the service worker.
+#
+# Finisher: writes mini-games/sw.js with the precache manifest built in. Each game is its own group
+# (its page and every same-origin file it loads, stylesheets followed into their url()s) with a
+# content hash per file and a version per group; the hub page and the arcade_thumbnails images form
+# the 'arcade' group. The worker keeps one cache per group and version, so updating one game only
+# refetches that game. Any change to a file changes sw.js itself, which is how browsers notice a
+# new worker.
+
+GAMES_DIR = 'mini-games'
+SERVICE_WORKER = 'sw.js'
+THUMBNAILS_DIR = 'assets/img/arcade_thumbnails'
+HUB_GROUP = 'arcade'
+REVISION_LENGTH = 8
+# Marks the registration snippet, so it is added once and never extracted
+SW_ATTRIBUTE = 'data-sw'
+JS_TYPES = {'', 'text/javascript', 'application/javascript', 'module'}
+# Reference kinds the browser actually fetches (not links to other pages, data-bundle sources,
+# og:image and the like)
+FETCHED_KINDS = {'src', 'href', 'srcset', 'imagesrcset', 'poster', 'style', 'url', 'import'}
+
+close_tag_patterns = {name: re.compile(rf'</{name}\s*>', re.IGNORECASE) for name in ('script', 'style')}
+
+SW_TEMPLATE = r"""// Generated by precache_games.py from the mini-games build. Do not edit.
+const PRECACHE = __MANIFEST__;
+const PREFIX = 'arcade-';
+
+const cacheName = (name) => PREFIX + name + '-' + PRECACHE.groups[name].version;
+const absolute = (url) => new URL(url, self.location).href;
+const precached = new Set(Object.values(PRECACHE.groups).flatMap((group) => group.files.map((file) => absolute(file.url))));
+
+self.addEventListener('install', (event) => {
+    // Fill only what a group's cache is missing: an unchanged game keeps its cache as it is, and
+    // an interrupted install picks up where it stopped. A changed game has a new version and so an
+    // empty cache; its misses use 'reload' so the HTTP cache can't hand back the previous revision.
+    event.waitUntil(Promise.all(Object.keys(PRECACHE.groups).map((name) =>
+        caches.open(cacheName(name)).then((cache) => Promise.all(PRECACHE.groups[name].files.map((file) =>
+            cache.match(absolute(file.url)).then((hit) => hit || cache.add(new Request(absolute(file.url), {cache: 'reload'})))
+        )))
+    )).then(() => self.skipWaiting()));
+});
+
+self.addEventListener('activate', (event) => {
+    const current = new Set(Object.keys(PRECACHE.groups).map(cacheName));
+    event.waitUntil(caches.keys()
+        .then((names) => Promise.all(names.filter((name) => name.startsWith(PREFIX) && !current.has(name)).map((name) => caches.delete(name))))
+        .then(() => self.clients.claim()));
+});
+
+self.addEventListener('fetch', (event) => {
+    if (event.request.method !== 'GET') return;
+    const url = new URL(event.request.url);
+    url.search = '';
+    url.hash = '';
+    if (url.pathname.endsWith('/')) url.pathname += 'index.html';
+    if (!precached.has(url.href)) return;
+    event.respondWith(caches.match(url.href).then((hit) => hit || fetch(event.request)));
+});
+"""
+
+REGISTER_SNIPPET = (f"<script {SW_ATTRIBUTE}>if ('serviceWorker' in navigator) "
+                    "navigator.serviceWorker.register('{url}');</script>")
+
+def game_dirs(root_dir):
+    games_dir = os.path.join(root_dir, GAMES_DIR)
+    if not os.path.isdir(games_dir):
+        return []
+    return sorted(name for name in os.listdir(games_dir)
+                  if os.path.isfile(os.path.join(games_dir, name, 'index.html')))
+
+def page_role(file_path, root_dir):
+    # 'game', 'hub' or None
+    parts = Path(os.path.relpath(file_path, root_dir)).parts
+    if len(parts) == 3 and parts[0] == GAMES_DIR and parts[2] == 'index.html':
+        return 'game'
+    if parts == (GAMES_DIR, 'index.html'):
+        return 'hub'
+    return None
+
+def source_name(directory, stem, suffix, body, taken):
+    # game.js, then game-2.js, ... for pages with more than one inline block. A file that already
+    # holds exactly this code is reused, so extracting again (after a dry run, or a page write that
+    # never happened) doesn't leave game-2.js copies behind. Returns the name and whether to write it.
+    index = 1
+    while True:
+        name = f"{stem}{suffix}" if index == 1 else f"{stem}-{index}{suffix}"
+        index += 1
+        if name in taken:
+            continue
+        path = os.path.join(directory, name)
+        if not os.path.exists(path):
+            return name, True
+        with open(path, 'r', encoding='utf-8', newline='') as f:
+            if f.read() == body:
+                return name, False
+
+def extract_inline(content, file_path):
+    # Moves inline <style>/<script> blocks to source files; returns the new content and their names
+    directory = os.path.dirname(file_path)
+    edits = []
+    written = []
+    for match, name, attributes, _ in iter_elements(content):
+        if name == 'style' and set(attributes) <= {'type'}:
+            suffix = '.css'
+        elif name == 'script' and 'src' not in attributes and SW_ATTRIBUTE not in attributes \
+                and attributes.get('type', '').lower() in JS_TYPES:
+            suffix = '.js'
+        else:
+            continue
+        close = close_tag_patterns[name].search(content, match.end())
+        if close is None:
+            continue
+        body = textwrap.dedent(content[match.end():close.start()]).strip('\n')
+        if not body.strip():
+            continue
+        body += '\n'
+        source, missing = source_name(directory, 'game', suffix, body, written)
+        if missing and not is_dry_run():
+            with open(os.path.join(directory, source), 'w', encoding='utf-8', newline='') as f:
+                f.write(body)
+        written.append(source)
+        minified = source[:-len(suffix)] + '.min' + suffix
+        if suffix == '.css':
+            tag = f'<link rel="stylesheet" href="{minified}">'
+        else:
+            module = ' type="module"' if attributes.get('type', '').lower() == 'module' else ''
+            tag = f'<script src="{minified}"{module}></script>'
+        edits.append((match.start(), close.end(), tag))
+    for start, end, tag in reversed(edits):
+        content = content[:start] + tag + content[end:]
+    return content, written
+
+def sync_minified(directory, root_dir):
+    # game.js -> game.min.js (and .css), rewritten only when the output changes
+    for name in sorted(os.listdir(directory)):
+        stem, suffix = os.path.splitext(name)
+        if suffix not in ('.js', '.css') or stem.endswith('.min') or not re.fullmatch(r'game(-\d+)?', stem):
+            continue
+        with open(os.path.join(directory, name), 'r', encoding='utf-8') as f:
+            source = f.read()
+        minified = minify_css(source) if suffix == '.css' else minify_js(source)
+        out_path = os.path.join(directory, f"{stem}.min{suffix}")
+        if is_dry_run():
+            continue
+        if os.path.isfile(out_path):
+            with open(out_path, 'r', encoding='utf-8') as f:
+                if f.read() == minified:
+                    continue
+        with open(out_path, 'w', encoding='utf-8', newline='') as f:
+            f.write(minified)
+        print(f"[GAME] {os.path.relpath(out_path, root_dir)}: {len(source)/1024:.1f}KB -> {len(minified)/1024:.1f}KB")
+
+def add_registration(content, file_path, root_dir):
+    if SW_ATTRIBUTE in content:
+        return content
+    body_end = content.rfind('</body>')
+    if body_end == -1:
+        return content
+    sw_path = os.path.join(root_dir, GAMES_DIR, SERVICE_WORKER)
+    url = Path(os.path.relpath(sw_path, os.path.dirname(file_path))).as_posix()
+    line_start = content.rfind('\n', 0, body_end) + 1
+    indent = re.match(r'[ \t]*', content[line_start:]).group()
+    return content[:line_start] + indent + '    ' + REGISTER_SNIPPET.format(url=url) + '\n' + content[line_start:]
+
+def game_assets_stage(content, file_path, root_dir):
+    # Pipeline stage (see build_pipeline.py)
+    role = page_role(file_path, root_dir)
+    if role is None:
+        return content
+    if role == 'game':
+        content, written = extract_inline(content, file_path)
+        for name in written:
+            print(f"[GAME] {os.path.relpath(file_path, root_dir)}: inline code -> {name}")
+        sync_minified(os.path.dirname(file_path), root_dir)
+    return add_registration(content, file_path, root_dir)
+
+def fetched_files(page_key, root_dir):
+    # Every same-origin file loading the page fetches, following stylesheets into their url()s
+    files = {page_key}
+    pending = [page_key]
+    while pending:
+        key = pending.pop()
+        path = os.path.join(root_dir, key)
+        with open(path, 'r', encoding='utf-8') as f:
+            content = f.read()
+        for start, end, ref, kind, base_dir in extract_refs(content, path, root_dir):
+            target = resolve(ref, base_dir, root_dir)
+            if kind not in FETCHED_KINDS or not target or target in files or target.endswith('.html'):
+                continue
+            if not os.path.isfile(os.path.join(root_dir, target)):
+                continue
+            files.add(target)
+            if target.endswith('.css'):
+                pending.append(target)
+    return files
+
+def precache_group(keys, root_dir):
+    cache = cache_for_root(root_dir)
+    games_dir = os.path.join(root_dir, GAMES_DIR)
+    files = []
+    for key in sorted(keys):
+        path = os.path.join(root_dir, key)
+        files.append({
+            'url': Path(os.path.relpath(path, games_dir)).as_posix(),
+            'revision': cache.fingerprint(path)[:REVISION_LENGTH],
+        })
+    version = hash_text(json.dumps(files, sort_keys=True))[:REVISION_LENGTH]
+    size = sum(os.path.getsize(os.path.join(root_dir, key)) for key in keys)
+    return {'version': version, 'files': files}, size
+
+def build_manifest(root_dir):
+    groups = {}
+    sizes = {}
+    for game in game_dirs(root_dir):
+        keys = fetched_files(f"{GAMES_DIR}/{game}/index.html", root_dir)
+        groups[game], sizes[game] = precache_group(keys, root_dir)
+
+    # The hub page and the game thumbnails; the rest of the hub (the site's own stylesheets, scripts
+    # and fonts) is several MB and stays with the normal HTTP cache
+    hub_key = f"{GAMES_DIR}/index.html"
+    keys = set()
+    if os.path.isfile(os.path.join(root_dir, hub_key)):
+        keys = {key for key in fetched_files(hub_key, root_dir)
+                if key == hub_key or derived_from(key).startswith(THUMBNAILS_DIR + '/')}
+    thumbnails = os.path.join(root_dir, THUMBNAILS_DIR)
+    covered = {derived_from(key) for key in keys}
+    if os.path.isdir(thumbnails):
+        for name in sorted(os.listdir(thumbnails)):
+            key = f"{THUMBNAILS_DIR}/{name}"
+            # The hub may already load a fingerprinted copy or a width variant of it
+            if Path(name).suffix.lower() in IMAGE_SUFFIXES and derived_from(key) == key and key not in covered:
+                keys.add(key)
+    if keys:
+        groups[HUB_GROUP], sizes[HUB_GROUP] = precache_group(keys, root_dir)
+    return {'groups': groups}, sizes
+
+def write_service_worker(root_dir):
+    # Pipeline finisher: mini-games/sw.js with the precache manifest, rewritten only when it changes
+    manifest, sizes = build_manifest(root_dir)
+    if not manifest['groups']:
+        return
+    for name, group in manifest['groups'].items():
+        print(f"[PRECACHE] {name}: {len(group['files'])} files, {sizes[name]/1024:.1f}KB, version {group['version']}")
+    code = SW_TEMPLATE.replace('__MANIFEST__', json.dumps(manifest, indent=1))
+    path = os.path.join(root_dir, GAMES_DIR, SERVICE_WORKER)
+    if os.path.isfile(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            if f.read() == code:
+                return
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        f.write(code)
+    print(f"[PRECACHE] {GAMES_DIR}/{SERVICE_WORKER} written ({len(manifest['groups'])} groups)")
+
+if __name__ == "__main__":
+    # Standalone: run just this stage (and the service worker finisher) through the pipeline
+    from build_pipeline import main
+    root = sys.argv[1] if len(sys.argv) > 1 else os.path.dirname(os.path.abspath(__file__))
+    sys.exit(main([root, '--stages', 'game-assets']))
@@ -0,0 +1,148 @@
+import html
+import json
+import os
+import re
+import sys
+
+from build_cache import hash_text, is_dry_run
+from fingerprint_assets import restore_stage
+from html_utils import iter_elements, set_attributes, tag_pattern
+
+# Build-time game catalog.
+# app-loader.js used to carry the whole catalog (full store descriptions included) and build
+# #game-list-container after DOMContentLoaded, so the list appeared late and every page paid for
+# the data. This stage renders the cards from apps.json straight into every page that has the
+# container, and writes catalog.json with just the fields a card needs, for app-loader.js to fall
+# back on when a page hasn't been through the build. catalog.json is written before the walk, so
+# the fingerprint stage rewrites its image URLs in the same build; it is a build output, not a
+# source, and stays out of git.
+#
+# The container is stamped with data-catalog="<hash of apps.json + template>". A page whose stamp
+# matches is left alone, so the cards are only re-rendered when apps.json or the template changes.
+
+CATALOG_SOURCE = 'apps.json'
+CATALOG_OUTPUT = 'catalog.json'
+CONTAINER_ID = 'game-list-container'
+CATALOG_ATTRIBUTE = 'data-catalog'
+# The fields a card uses; everything else in apps.json stays out of the pages and catalog.json
+CARD_FIELDS = ('id', 'name', 'icon', 'thumbnail')
+
+# Keep in step with renderCard() in assets/js/app-loader.js
+CARD_TEMPLATE = '''<div class="col-xl-3 col-md-6 d-flex">
+    <div class="single-feature-inner fade-slide bottom" data-delay="{delay}">
+        <h4 class="title d-flex justify-content-between align-items-center">
+            {name}
+            <img src="{icon}" alt="{name} icon" width="40" height="40" style="width: 40px; height: 40px; border-radius: 8px; object-fit: cover;">
+        </h4>
+        <div class="thumb text-center">
+            <img src="{thumbnail}" alt="{name}">
+        </div>
+        <div class="details d-flex justify-content-between align-items-center">
+            <div class="left">
+                <h5 class="d-block" style="font-size: 14px; opacity: 0.8; margin-bottom: 5px;">Vexil Logic Games</h5>
+                <a href="game-details.html?id={id}" class="bid" style="font-size: 12px;">
+                    <span class="icon"><i class="fa fa-info-circle"></i></span>
+                    Details
+                </a>
+            </div>
+            <div class="right">
+                <a class="btn btn-base" href="game-details.html?id={id}">VIEW <i class="fa fa-arrow-right"></i></a>
+            </div>
+        </div>
+    </div>
+</div>'''
+
+# Rendered cards per catalog hash, so the markup is built once per build
+_rendered = {}
+
+def load_catalog(root_dir):
+    # Returns (trimmed cards, hash of the source and template), or (None, None) without apps.json
+    path = os.path.join(root_dir, CATALOG_SOURCE)
+    if not os.path.isfile(path):
+        return None, None
+    with open(path, 'r', encoding='utf-8') as f:
+        # The fingerprint stage rewrites apps.json in place; hash and render the original names
+        text = restore_stage(f.read(), path, root_dir)
+    digest = hash_text(text + CARD_TEMPLATE)[:12]
+    if digest not in _rendered:
+        apps = json.loads(text)
+        cards = [{field: app.get(field, '') for field in CARD_FIELDS} for app in apps]
+        _rendered[digest] = cards
+    return _rendered[digest], digest
+
+def write_catalog(root_dir):
+    # Pipeline preparer: catalog.json with the trimmed cards, rewritten only when it changes
+    cards, _ = load_catalog(root_dir)
+    if cards is None or is_dry_run():
+        return
+    path = os.path.join(root_dir, CATALOG_OUTPUT)
+    text = json.dumps(cards, ensure_ascii=False, separators=(',', ':')) + '\n'
+    if os.path.isfile(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            # Fingerprinted by a previous build's walk: still current
+            if restore_stage(f.read(), path, root_dir) == text:
+                return
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        f.write(text)
+    print(f"[CATALOG] {len(cards)} cards -> {CATALOG_OUTPUT} ({len(text.encode('utf-8'))} bytes)")
+
+def render_cards(cards, indent):
+    parts = []
+    for index, card in enumerate(cards):
+        values = {field: html.escape(str(value)) for field, value in card.items()}
+        # Same stagger as the old client-side rendering
+        values['delay'] = f"{0.2 + index * 0.1:.1f}"
+        markup = CARD_TEMPLATE.format(**values)
+        parts.append('\n'.join(indent + line if line else line for line in markup.split('\n')))
+    return '\n'.join(parts)
+
+def element_end(content, start_match, name):
+    # Offset of the closing tag that matches start_match (nested elements of the same name counted)
+    depth = 1
+    for match in tag_pattern.finditer(content, start_match.end()):
+        if match.group(0).startswith('<!--') or (match.group(2) or '').lower() != name:
+            continue
+        if match.group(1):
+            depth -= 1
+            if depth == 0:
+                return match.start()
+        elif not match.group(3).rstrip().endswith('/'):
+            depth += 1
+    return None
+
+def prerender_catalog(content, file_path, root_dir):
+    # Returns the new content and the number of cards rendered (None if the page was left alone)
+    if CONTAINER_ID not in content:
+        return content, None
+    for match, name, attributes, _ in iter_elements(content):
+        if attributes.get('id') == CONTAINER_ID:
+            break
+    else:
+        return content, None
+
+    cards, digest = load_catalog(root_dir)
+    if cards is None or attributes.get(CATALOG_ATTRIBUTE) == digest:
+        return content, None
+    end = element_end(content, match, name)
+    if end is None:
+        return content, None
+
+    line_start = content.rfind('\n', 0, match.start()) + 1
+    indent = re.match(r'[ \t]*', content[line_start:]).group()
+    markup = render_cards(cards, indent + '    ')
+    start_tag = set_attributes(match.group(0), {CATALOG_ATTRIBUTE: digest})
+    new_content = content[:match.start()] + start_tag + '\n' + markup + '\n' + indent + content[end:]
+    return new_content, len(cards)
+
+def prerender_stage(content, file_path, root_dir):
+    # Pipeline stage wrapper (see build_pipeline.py)
+    new_content, count = prerender_catalog(content, file_path, root_dir)
+    if count is not None:
+        print(f"[CATALOG] {os.path.relpath(file_path, root_dir)}: {count} cards rendered")
+    return new_content
+
+if __name__ == "__main__":
+    # Standalone: run just this stage through the pipeline
+    from build_pipeline import main
+    root = sys.argv[1] if len(sys.argv) > 1 else os.path.dirname(os.path.abspath(__file__))
+    sys.exit(main([root, '--stages', 'prerender-catalog']))
@@ -0,0 +1,234 @@
+import argparse
+import os
+import re
+import sys
+from pathlib import Path
+
+from build_cache import cache_for_root, save_shared_caches
+from minify_assets import collect_used_selectors, parse_stylesheet, prune_stylesheet, pruned_path, serialize_stylesheet
+from reference_graph import build_graph, derived_from
+
+try:
+    from fontTools import subset as font_subset
+except ImportError:
+    font_subset = None
+
+# FontAwesome pruning.
+# Every page loads the whole of fontawesome.min.css (one rule per icon, ~1600 icons) and its
+# @font-face rules offer eot/woff2/woff/ttf/svg versions of every face. This writes
+# fontawesome.pruned.min.css with:
+#   - only the rules for the icon classes the pages and the site's own scripts use
+#   - only the faces a remaining rule can select, each with just its woff2 source
+#     (every browser we support reads woff2; the others were fallbacks for IE and old Android)
+#   - with fontTools installed, the woff2 files subset to the glyphs of the used icons
+# update_html_links.py swaps the page links over once the pruned file exists.
+# It finishes by listing the webfont files no page-linked stylesheet references any more, apart
+# from the woff2 sources of the subsets, which every rebuild reads again.
+
+FONTAWESOME_CSS = os.path.join('assets', 'css', 'fontawesome.min.css')
+# fontawesome.min.js names every icon; scanning it would mark them all as used
+VENDOR_SCRIPTS = ('fontawesome.min.js',)
+WEBFONT_SUFFIXES = {'.eot', '.svg', '.ttf', '.otf', '.woff', '.woff2'}
+
+font_url_pattern = re.compile(r'''url\((['"]?)([^'")]+\.woff2)\1\)\s*format\((['"])woff2\3\)''')
+codepoint_pattern = re.compile(r'''^["']\\([0-9a-fA-F]{1,6})["']$''')
+
+FONT_WEIGHTS = {'normal': '400', 'bold': '700'}
+
+def _class_styles(items, styles):
+    for item in items:
+        if item['kind'] == 'block':
+            _class_styles(item['children'], styles)
+        elif item['kind'] == 'rule' and not item.get('at'):
+            for selector in item['selector'].split(','):
+                if not re.fullmatch(r'\.[\w-]+', selector):
+                    continue
+                for prop, value in item['declarations']:
+                    if prop in ('font-family', 'font-weight'):
+                        styles.setdefault(selector, {})[prop] = value
+    return styles
+
+def face_styles(items):
+    # (family, weight) pairs the remaining single-class rules select, e.g. .fab -> ('Font Awesome 5 Brands', '400')
+    pairs = set()
+    for style in _class_styles(items, {}).values():
+        if 'font-family' in style:
+            family = style['font-family'].split(',')[0].strip('\'" ')
+            weight = style.get('font-weight', '400')
+            pairs.add((family, FONT_WEIGHTS.get(weight, weight)))
+    return pairs
+
+def used_codepoints(items):
+    codepoints = set()
+    for item in items:
+        if item['kind'] == 'block':
+            codepoints |= used_codepoints(item['children'])
+        elif item['kind'] == 'rule':
+            for prop, value in item['declarations']:
+                match = codepoint_pattern.match(value or '') if prop == 'content' else None
+                if match:
+                    codepoints.add(int(match.group(1), 16))
+    return codepoints
+
+def subset_path(font_path):
+    path = Path(font_path)
+    return path.with_name(f"{path.stem}.pruned{path.suffix}")
+
+def subset_font(font_path, codepoints, root_dir):
+    # Writes name.pruned.woff2 with only the given glyphs; returns its path, or None if it couldn't
+    if font_subset is None:
+        return None
+    cache = cache_for_root(root_dir)
+    out_path = subset_path(font_path)
+    key = cache.key(font_path)
+    settings = {'source': cache.fingerprint(font_path), 'codepoints': sorted(codepoints)}
+    entry = cache.lookup('font-subset', key)
+    if entry and entry['settings'] == settings and entry['output'] == cache.fingerprint(out_path):
+        return out_path
+    try:
+        options = font_subset.Options()
+        options.flavor = 'woff2'
+        options.layout_features = ['*']
+        # FontForge's timestamp table; fontTools can't subset it and would warn about every font
+        options.drop_tables += ['FFTM']
+        font = font_subset.load_font(str(font_path), options)
+        subsetter = font_subset.Subsetter(options)
+        subsetter.populate(unicodes=codepoints)
+        subsetter.subset(font)
+        font_subset.save_font(font, str(out_path), options)
+    except Exception as e:
+        # woff2 output needs the brotli module too; fall back to the full font
+        print(f"Could not subset {font_path}: {e}")
+        return None
+    cache.store('font-subset', key, {'settings': settings, 'output': cache.fingerprint(out_path)})
+    return out_path
+
+def rewrite_font_faces(items, css_path, root_dir, codepoints=None):
+    # Keeps the faces the remaining rules use, each with only its woff2 source.
+    # With codepoints (and fontTools) the woff2 is replaced by a subset.
+    faces = face_styles(items)
+    css_dir = os.path.dirname(css_path)
+    kept = []
+    report = []
+    for item in items:
+        if not (item['kind'] == 'rule' and item.get('at') and item['selector'].lower() == '@font-face'):
+            kept.append(item)
+            continue
+        props = dict(item['declarations'])
+        family = props.get('font-family', '').strip('\'" ')
+        weight = FONT_WEIGHTS.get(props.get('font-weight', '400'), props.get('font-weight', '400'))
+        woff2 = None
+        for prop, value in item['declarations']:
+            match = font_url_pattern.search(value or '') if prop == 'src' else None
+            if match:
+                woff2 = match.group(2)
+        if (family, weight) not in faces or woff2 is None:
+            report.append((family, weight, None))
+            continue
+        if codepoints:
+            subset = subset_font(os.path.join(css_dir, woff2.split('?')[0]), codepoints, root_dir)
+            if subset is not None:
+                woff2 = woff2.rsplit('/', 1)[0] + '/' + subset.name if '/' in woff2 else subset.name
+        declarations = [(prop, value) for prop, value in item['declarations'] if prop != 'src']
+        declarations.append(('src', f'url({woff2}) format("woff2")'))
+        kept.append(dict(item, declarations=declarations))
+        report.append((family, weight, woff2))
+    return kept, report
+
+def page_linked_targets(graph, substitutions):
+    # Everything reachable from the pages through stylesheets (CSS can @import CSS).
+    # substitutions maps a stylesheet to the one that will replace it (the pruned copy).
+    # Fingerprinted copies count as the file they were made from, so a built tree (pages linking
+    # name.<hash>.css, which loads font.<hash>.woff2) reaches the same sources as an unbuilt one.
+    edges = {}
+    for edge in graph['edges']:
+        if edge['exists']:
+            edges.setdefault(derived_from(edge['source']), set()).add(derived_from(edge['target']))
+    pending = [target for source, targets in edges.items() if source.endswith('.html') for target in targets]
+    reached = set()
+    while pending:
+        target = pending.pop()
+        target = substitutions.get(target, target)
+        if target in reached:
+            continue
+        reached.add(target)
+        if target.endswith('.css'):
+            pending.extend(edges.get(target, ()))
+    return reached
+
+def unreferenced_webfonts(root_dir, substitutions):
+    # Returns (fonts nothing references, fonts kept only as the source of a referenced subset).
+    # The second list must stay: subset_font() reads them again on every rebuild.
+    graph = build_graph(root_dir)
+    reached = page_linked_targets(graph, substitutions)
+    fonts = []
+    sources = []
+    for root, dirs, files in os.walk(os.path.join(root_dir, 'assets')):
+        for file in sorted(files):
+            if Path(file).suffix.lower() not in WEBFONT_SUFFIXES:
+                continue
+            path = os.path.join(root, file)
+            key = Path(os.path.relpath(path, root_dir)).as_posix()
+            # .svg in the webfont folders are font files; elsewhere they're images
+            if file.endswith('.svg') and 'webfont' not in root:
+                continue
+            if derived_from(key) in reached:
+                continue
+            if Path(subset_path(key)).as_posix() in reached:
+                sources.append((key, os.path.getsize(path)))
+            else:
+                fonts.append((key, os.path.getsize(path)))
+    return fonts, sources
+
+def pruned_fontawesome(root_dir, used, subset=True):
+    # Returns (original css, pruned css, codepoints kept or None, face report); writes the subsets
+    css_path = os.path.join(root_dir, FONTAWESOME_CSS)
+    with open(css_path, 'r', encoding='utf-8') as f:
+        content = f.read()
+    items = prune_stylesheet(parse_stylesheet(content), used)
+    codepoints = used_codepoints(items) if subset else None
+    items, faces = rewrite_font_faces(items, css_path, root_dir, codepoints)
+    return content, serialize_stylesheet(items), codepoints, faces
+
+def prune_fontawesome(root_dir, subset=True):
+    css_path = os.path.join(root_dir, FONTAWESOME_CSS)
+    used = collect_used_selectors(root_dir, skip_scripts=VENDOR_SCRIPTS)
+    icons = sorted(c for c in used['classes'] if c.startswith('fa-'))
+    print(f"Icon classes in use: {len(icons)}")
+    if subset and font_subset is None:
+        print("fontTools not available, keeping the full woff2 files")
+
+    content, minified, codepoints, faces = pruned_fontawesome(root_dir, used, subset)
+    for family, weight, source in faces:
+        print(f"[FACE] {family} {weight}: {source or 'dropped'}")
+
+    out_path = pruned_path(css_path)
+    with open(out_path, 'w', encoding='utf-8') as f:
+        f.write(minified)
+    print(f"Pruned {css_path}: {len(content)/1024:.2f}KB -> {len(minified)/1024:.2f}KB "
+          f"({len(codepoints or ())} glyphs)")
+    save_shared_caches()
+
+    # Which webfonts the deployed stylesheets still reference once the pruned copy is linked
+    substitutions = {Path(FONTAWESOME_CSS).as_posix(): Path(os.path.relpath(out_path, root_dir)).as_posix()}
+    fonts, sources = unreferenced_webfonts(root_dir, substitutions)
+    for key, size in sources:
+        print(f"[SUBSET SOURCE] {key} ({size/1024:.1f}KB, kept: the subset is rebuilt from it)")
+    for key, size in fonts:
+        print(f"[UNUSED] {key} ({size/1024:.1f}KB)")
+    print("-" * 30)
+    print(f"Unreferenced webfonts: {len(fonts)} ({sum(size for _, size in fonts) / (1024*1024):.2f} MB)")
+    print(f"Kept as subset sources: {len(sources)} ({sum(size for _, size in sources) / 1024:.1f} KB)")
+    return out_path
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Prune fontawesome.min.css to the icons the site uses.")
+    parser.add_argument('root', nargs='?', default=os.path.dirname(os.path.abspath(__file__)),
+                        help="site root (defaults to this script's directory)")
+    parser.add_argument('--no-subset', action='store_true', help="don't subset the woff2 files even if fontTools is installed")
+    args = parser.parse_args(argv)
+    prune_fontawesome(args.root, subset=not args.no_subset)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,270 @@
+import argparse
+import json
+import os
+import posixpath
+import re
+import sys
+from pathlib import Path
+
+from html_utils import attr_pattern, is_local_url, site_origins, tag_pattern
+
+# Site reference graph.
+# The asset tree is listed once into an in-memory index, so "does this exist" is a set lookup
+# instead of a stat() per reference. References are parsed per file type and resolved against
+# the base the browser would use:
+#   HTML        src/href/poster/data-*, srcset, inline style url(), <style> url(), quoted paths in
+#               inline scripts -- all relative to the page
+#   CSS         url() and @import -- relative to the stylesheet
+#   JS/JSON     quoted paths -- relative to the site root, since they end up in pages at the root
+#   XML         <loc> and friends -- absolute URLs on the site's own domain
+# Every reference becomes an edge (source file -> target). From the edges come the broken
+# references and the orphaned images nothing points at. The graph is dumped as JSON
+# (.reference-graph.json by default) for other scripts to reuse.
+
+GRAPH_FILE_NAME = '.reference-graph.json'
+SOURCE_SUFFIXES = {'.html', '.css', '.js', '.json', '.xml'}
+IMAGE_SUFFIXES = {'.webp', '.png', '.jpg', '.jpeg', '.gif', '.svg', '.avif', '.ico'}
+PATH_SUFFIXES = IMAGE_SUFFIXES | {
+    '.html', '.css', '.js', '.json', '.xml', '.pdf', '.txt',
+    '.woff', '.woff2', '.ttf', '.otf', '.eot', '.mp4', '.webm', '.mp3', '.ogg', '.wav',
+}
+SKIP_DIRS = {'node_modules', '.git'}
+
+# Attributes holding a single URL, and those holding several
+# (data-inline/data-sprite keep the original src of images inline_images.py turned into data: URIs or sprites)
+URL_ATTRIBUTES = {
+    'src', 'href', 'poster', 'action', 'data-src', 'data-bg', 'data-background', 'data-href',
+    'data-inline', 'data-sprite',
+}
+LIST_ATTRIBUTES = {'srcset', 'imagesrcset', 'data-srcset', 'data-bundle'}
+# <meta content> only counts when it looks like a file
+PATH_ATTRIBUTES = {'content'}
+
+url_pattern = re.compile(r'''url\(\s*(['"]?)([^'")]*)\1\s*\)''')
+import_pattern = re.compile(r'''@import\s+(['"])([^'"]+)\1''')
+string_pattern = re.compile(r'''(["'`])((?:\\.|(?!\1)[^\\\n])*)\1''')
+xml_text_pattern = re.compile(r'>\s*([^<>\s]+)\s*<')
+path_like_pattern = re.compile(
+    r'''^[^\s<>"'`{}()*$]+(?:''' + '|'.join(re.escape(s) for s in sorted(PATH_SUFFIXES)) + r')(?:[?#][^\s]*)?$',
+    re.IGNORECASE,
+)
+raw_text_pattern = re.compile(r'<(script|style)\b([^>]*)>(.*?)</\1\s*>', re.DOTALL | re.IGNORECASE)
+
+class AssetIndex:
+    # Every file under the site root, as root relative posix paths, from a single walk
+    def __init__(self, root_dir):
+        self.root_dir = os.path.abspath(root_dir)
+        self.files = set()
+        for root, dirs, files in os.walk(self.root_dir):
+            dirs[:] = [d for d in dirs if d not in SKIP_DIRS]
+            rel_dir = os.path.relpath(root, self.root_dir)
+            prefix = '' if rel_dir == '.' else Path(rel_dir).as_posix() + '/'
+            self.files.update(prefix + file for file in files)
+
+    def key(self, path):
+        # Root relative posix path, or None for paths outside the site
+        rel = os.path.relpath(os.path.abspath(path), self.root_dir)
+        if rel == '..' or rel.startswith('..' + os.sep):
+            return None
+        return Path(rel).as_posix()
+
+    def exists(self, key):
+        if key is None:
+            return False
+        # Directory references (about/ -> about/index.html) are served by the index page
+        return key in self.files or posixpath.join(key, 'index.html') in self.files
+
+# One index per site root for the whole process (the pipeline stages call this per file)
+_indexes = {}
+
+def asset_index(root_dir, refresh=False):
+    key = os.path.abspath(root_dir)
+    if refresh or key not in _indexes:
+        _indexes[key] = AssetIndex(root_dir)
+    return _indexes[key]
+
+def split_url(ref):
+    # 'a/b.webp?v=2#x' -> ('a/b.webp', '?v=2#x')
+    match = re.search(r'[?#]', ref)
+    return (ref[:match.start()], ref[match.start():]) if match else (ref, '')
+
+def resolve(ref, base_dir, root_dir):
+    # Root relative key for a reference, or None if it points off-site
+    ref = ref.strip()
+    for origin in site_origins(root_dir):
+        if ref.startswith(origin + '/') or ref == origin:
+            ref = '/' + ref[len(origin) + 1:]
+            break
+    else:
+        if not is_local_url(ref):
+            return None
+    path = split_url(ref)[0]
+    if not path:
+        return None
+    if path.startswith('/'):
+        target = os.path.join(root_dir, path.lstrip('/'))
+    else:
+        target = os.path.join(base_dir, path)
+    rel = os.path.relpath(os.path.normpath(os.path.abspath(target)), os.path.abspath(root_dir))
+    if rel == '..' or rel.startswith('..' + os.sep):
+        return None
+    return Path(rel).as_posix() if rel != '.' else ''
+
+def _css_refs(css, offset, base_dir, kind='url'):
+    for match in url_pattern.finditer(css):
+        if match.group(2).strip() and not match.group(2).startswith('data:'):
+            yield match.start(2) + offset, match.end(2) + offset, match.group(2), kind, base_dir
+    for match in import_pattern.finditer(css):
+        yield match.start(2) + offset, match.end(2) + offset, match.group(2), 'import', base_dir
+
+def _string_refs(text, offset, base_dir):
+    for match in string_pattern.finditer(text):
+        value = match.group(2)
+        if path_like_pattern.match(value):
+            yield match.start(2) + offset, match.end(2) + offset, value, 'string', base_dir
+
+def _list_refs(value, offset, base_dir, kind):
+    # srcset style lists ("a.webp 640w, b.webp 1024w") and space separated lists (data-bundle)
+    for match in re.finditer(r'[^\s,]+', value):
+        if re.fullmatch(r'\d+(\.\d+)?[wx]', match.group()):
+            continue
+        yield match.start() + offset, match.end() + offset, match.group(), kind, base_dir
+
+def _html_refs(content, base_dir):
+    raw_bodies = [(match.start(3), match.end(3)) for match in raw_text_pattern.finditer(content)]
+    for match in tag_pattern.finditer(content):
+        if match.group(0).startswith('<!--') or match.group(1):
+            continue
+        # Markup inside a script string isn't a tag
+        if any(start <= match.start() < end for start, end in raw_bodies):
+            continue
+        attrs_start = match.start(3)
+        for attr in attr_pattern.finditer(match.group(3)):
+            name = attr.group(1).lower()
+            value = attr.group(2) or ''
+            quoted = value[:1] in ('"', "'")
+            start = attrs_start + attr.start(2) + (1 if quoted else 0)
+            value = value[1:-1] if quoted else value
+            if name in URL_ATTRIBUTES:
+                if value.strip():
+                    yield start, start + len(value), value, name, base_dir
+            elif name in LIST_ATTRIBUTES:
+                yield from _list_refs(value, start, base_dir, name)
+            elif name in PATH_ATTRIBUTES:
+                if path_like_pattern.match(value):
+                    yield start, start + len(value), value, name, base_dir
+            elif name == 'style':
+                yield from _css_refs(value, start, base_dir, 'style')
+    # iter_elements/tag_pattern see <script>/<style> bodies as text; scan them separately
+    for match in raw_text_pattern.finditer(content):
+        if match.group(1).lower() == 'style':
+            yield from _css_refs(match.group(3), match.start(3), base_dir)
+        else:
+            yield from _string_refs(match.group(3), match.start(3), base_dir)
+
+def extract_refs(content, file_path, root_dir):
+    # Returns [(start, end, reference as written, kind, base dir)] in document order.
+    # start/end are offsets of the reference in content, so callers can rewrite it in place.
+    suffix = Path(file_path).suffix.lower()
+    page_dir = os.path.dirname(os.path.abspath(file_path))
+    if suffix == '.html':
+        refs = _html_refs(content, page_dir)
+    elif suffix == '.css':
+        refs = _css_refs(content, 0, page_dir)
+    elif suffix in ('.js', '.json'):
+        refs = _string_refs(content, 0, os.path.abspath(root_dir))
+    elif suffix == '.xml':
+        refs = (
+            (m.start(1), m.end(1), m.group(1), 'xml', os.path.abspath(root_dir))
+            for m in xml_text_pattern.finditer(content) if re.match(r'^(https?://|/)', m.group(1))
+        )
+    else:
+        refs = ()
+    return sorted(set(refs))
+
+def iter_sources(root_dir):
+    for root, dirs, files in os.walk(root_dir):
+        dirs[:] = [d for d in dirs if d not in SKIP_DIRS]
+        for file in files:
+            if not file.startswith('.') and Path(file).suffix.lower() in SOURCE_SUFFIXES:
+                yield Path(root) / file
+
+def derived_from(key):
+    # Build outputs count as used when what they were made from is:
+    # name.<hash>.ext (fingerprinted copy) and name-640w.ext (responsive variant) -> name.ext
+    match = re.match(r'^(.*?)(?:\.[0-9a-f]{8,})?(?:-\d+w)?(\.[A-Za-z0-9]+)$', key)
+    return match.group(1) + match.group(2) if match else key
+
+def build_graph(root_dir):
+    # Returns {'files', 'edges', 'broken', 'orphans'}; edges are dicts
+    # {source, ref, kind, target (root relative, None if external), exists}
+    index = asset_index(root_dir, refresh=True)
+    edges = []
+    for file_path in iter_sources(root_dir):
+        try:
+            with open(file_path, 'r', encoding='utf-8') as f:
+                content = f.read()
+        except (OSError, UnicodeDecodeError) as e:
+            print(f"Error reading {file_path}: {e}")
+            continue
+        source = index.key(file_path)
+        for start, end, ref, kind, base_dir in extract_refs(content, file_path, root_dir):
+            target = resolve(ref, base_dir, root_dir)
+            edges.append({
+                'source': source,
+                'ref': ref,
+                'kind': kind,
+                'target': target,
+                'exists': index.exists(target) if target is not None else None,
+            })
+
+    referenced = {edge['target'] for edge in edges if edge['exists']}
+    orphans = []
+    for key in sorted(index.files):
+        if Path(key).suffix.lower() not in IMAGE_SUFFIXES or key in referenced or derived_from(key) in referenced:
+            continue
+        orphan = {'path': key, 'bytes': os.path.getsize(os.path.join(root_dir, key))}
+        # PNG/JPG originals of referenced WebPs are build inputs: keep them in the repo, not on the server
+        if str(Path(key).with_suffix('.webp').as_posix()) in referenced:
+            orphan['source_of'] = Path(key).with_suffix('.webp').as_posix()
+        orphans.append(orphan)
+    broken = [edge for edge in edges if edge['exists'] is False]
+    return {'files': len(index.files), 'edges': edges, 'broken': broken, 'orphans': orphans}
+
+def write_graph(graph, path):
+    tmp_path = str(path) + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(graph, f, indent=1)
+    os.replace(tmp_path, path)
+
+def print_report(graph, verbose=False):
+    print(f"Files indexed: {graph['files']}")
+    print(f"References: {len(graph['edges'])}")
+    print(f"Broken references: {len(graph['broken'])}")
+    for edge in graph['broken']:
+        print(f"[BROKEN] {edge['source']}: {edge['ref']} ({edge['kind']})")
+    orphan_bytes = sum(orphan['bytes'] for orphan in graph['orphans'])
+    print(f"Unreferenced images: {len(graph['orphans'])} ({orphan_bytes / (1024*1024):.2f} MB)")
+    if verbose:
+        for orphan in graph['orphans']:
+            print(f"[ORPHAN] {orphan['path']} ({orphan['bytes']/1024:.1f}KB)")
+    # Paths assembled at runtime (e.g. 'img/' + id + '.webp' in a script) aren't visible here
+    print("Note: images only referenced from dynamically built paths show up as unreferenced")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Index every reference in the site and report broken links and unreferenced images.")
+    parser.add_argument('root', nargs='?', default=os.path.dirname(os.path.abspath(__file__)),
+                        help="site root (defaults to this script's directory)")
+    parser.add_argument('--output', help=f"where to write the graph JSON (default: <root>/{GRAPH_FILE_NAME})")
+    parser.add_argument('--verbose', action='store_true', help="list every unreferenced image")
+    args = parser.parse_args(argv)
+
+    graph = build_graph(args.root)
+    output = args.output or os.path.join(args.root, GRAPH_FILE_NAME)
+    write_graph(graph, output)
+    print_report(graph, args.verbose)
+    print(f"Graph written to {output}")
+    return 1 if graph['broken'] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,139 @@
+import os
+import re
+import struct
+from pathlib import Path
+
+from build_cache import cache_for_root
+from html_utils import add_attributes, img_tag_pattern, parse_attributes, resolve_local
+
+# Responsive image support.
+# optimize_images.generate_variants writes a width ladder next to every image
+# (assets/img/banner/1.webp -> banner/1-320w.webp, 1-640w.webp, ...).
+# srcset_stage then points each <img> at the variants that exist and adds intrinsic
+# width/height so the browser can reserve space before the image arrives.
+
+WIDTHS = (320, 640, 1024, 1600)
+
+# A variant within this fraction of the source width saves too little to be worth a request
+MIN_VARIANT_RATIO = 0.9
+
+variant_pattern = re.compile(r'-\d+w$')
+
+def variant_path(path, width):
+    path = Path(path)
+    return path.with_name(f"{path.stem}-{width}w{path.suffix}")
+
+def is_variant(path):
+    return variant_pattern.search(Path(path).stem) is not None
+
+def read_image_size(path):
+    # Reads (width, height) from the file header without decoding the image.
+    # Supports WebP, PNG, GIF and JPEG. Returns None for anything else.
+    with open(path, 'rb') as f:
+        head = f.read(32)
+        if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+            chunk = head[12:16]
+            if chunk == b'VP8 ' and head[23:26] == b'\x9d\x01\x2a':
+                width, height = struct.unpack('<HH', head[26:30])
+                return width & 0x3fff, height & 0x3fff
+            if chunk == b'VP8L' and head[20] == 0x2f:
+                bits = struct.unpack('<I', head[21:25])[0]
+                return (bits & 0x3fff) + 1, ((bits >> 14) & 0x3fff) + 1
+            if chunk == b'VP8X':
+                width = int.from_bytes(head[24:27], 'little') + 1
+                height = int.from_bytes(head[27:30], 'little') + 1
+                return width, height
+            return None
+        if head[:8] == b'\x89PNG\r\n\x1a\n':
+            return struct.unpack('>II', head[16:24])
+        if head[:4] in (b'GIF8',):
+            return struct.unpack('<HH', head[6:10])
+        if head[:2] == b'\xff\xd8':
+            # Walk the JPEG markers until a start-of-frame segment
+            f.seek(2)
+            while True:
+                marker = f.read(2)
+                if len(marker) < 2 or marker[0] != 0xff:
+                    return None
+                while marker[1] == 0xff:
+                    marker = marker[:1] + f.read(1)
+                code = marker[1]
+                if code in (0xd8, 0x01) or 0xd0 <= code <= 0xd7:
+                    continue
+                length = struct.unpack('>H', f.read(2))[0]
+                if 0xc0 <= code <= 0xcf and code not in (0xc4, 0xc8, 0xcc):
+                    height, width = struct.unpack('>xHH', f.read(5))
+                    return width, height
+                f.seek(length - 2, os.SEEK_CUR)
+    return None
+
+def image_size(path, cache):
+    # Header reads are memoised in the build cache against size and mtime
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    key = cache.key(path)
+    entry = cache.lookup('image-size', key)
+    if entry and entry['stat'] == [st.st_size, st.st_mtime_ns]:
+        return tuple(entry['size']) if entry['size'] else None
+    try:
+        size = read_image_size(path)
+    except (OSError, struct.error):
+        size = None
+    cache.store('image-size', key, {'stat': [st.st_size, st.st_mtime_ns], 'size': list(size) if size else None})
+    return size
+
+def responsive_attributes(attrs, path, src, width, height):
+    extra = {}
+    if 'srcset' not in attrs:
+        url = re.split(r'[?#]', src, maxsplit=1)[0]
+        base = url.rsplit('/', 1)[0] + '/' if '/' in url else ''
+        candidates = [
+            f"{base}{variant_path(path, w).name} {w}w"
+            for w in WIDTHS
+            if w < width and variant_path(path, w).is_file()
+        ]
+        if candidates:
+            candidates.append(f"{src} {width}w")
+            extra['srcset'] = ', '.join(candidates)
+            if 'sizes' not in attrs:
+                # We don't know the rendered size at build time; assume an image is never shown
+                # wider than its intrinsic size, which holds for this site's templates.
+                extra['sizes'] = f"(max-width: {width}px) 100vw, {width}px"
+    style = attrs.get('style', '').replace(' ', '').lower()
+    sized_inline = 'width:' in style or 'height:' in style
+    if 'width' not in attrs and 'height' not in attrs and not sized_inline:
+        # style.css sets img { height: auto } so these only reserve the aspect ratio.
+        # An inline width/height would win over that rule and distort the image, so skip those.
+        extra['width'] = str(width)
+        extra['height'] = str(height)
+    return extra
+
+def add_srcset(content, file_path, root_dir):
+    # Returns the new content and the number of <img> tags changed
+    cache = cache_for_root(root_dir)
+    images_patched = 0
+
+    def replacement(match):
+        nonlocal images_patched
+        tag = match.group(0)
+        attrs = parse_attributes(match.group(1))
+        src = attrs.get('src', '')
+        path = resolve_local(src, file_path, root_dir)
+        if path is None or not path.is_file():
+            return tag
+        size = image_size(path, cache)
+        if not size:
+            return tag
+        extra = responsive_attributes(attrs, path, src, *size)
+        if not extra:
+            return tag
+        images_patched += 1
+        return add_attributes(tag, extra)
+
+    return img_tag_pattern.sub(replacement, content), images_patched
+
+def srcset_stage(content, file_path, root_dir):
+    # Pipeline stage wrapper (see build_pipeline.py)
+    return add_srcset(content, file_path, root_dir)[0]
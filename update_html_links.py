@@ -1,14 +1,80 @@
 import os
+import re
+import sys
 from pathlib import Path
 
+from build_cache import is_dry_run
+from minify_assets import collect_used_selectors, minify_css
+from prerender_catalog import prerender_catalog
+from prune_fontawesome import FONTAWESOME_CSS, VENDOR_SCRIPTS, pruned_fontawesome
+
+replacements = {
+    'assets/css/style.css': 'assets/css/style.min.css',
+    'assets/js/main.js': 'assets/js/main.min.js',
+    'assets/js/app-loader.js': 'assets/js/app-loader.min.js'
+}
+
+# Pruned vendor stylesheets written by minify_assets.py --prune and prune_fontawesome.py.
+# Only swapped in once the pruned file has actually been built; from then on the pipeline keeps
+# it in step with the pages and scripts (see refresh_pruned).
+optional_replacements = {
+    'assets/css/bootstrap.min.css': 'assets/css/bootstrap.pruned.min.css',
+    'assets/css/animate.min.css': 'assets/css/animate.pruned.min.css',
+    'assets/css/fontawesome.min.css': 'assets/css/fontawesome.pruned.min.css',
+}
+
+def active_replacements(root_dir):
+    active = dict(replacements)
+    for original, pruned in optional_replacements.items():
+        if os.path.exists(os.path.join(root_dir, pruned)):
+            active[original] = pruned
+    return active
+
+def refresh_pruned(root_dir):
+    # Pipeline preparer: a pruned stylesheet only holds the rules for the classes in use when it
+    # was written, so a class added to a page or main.js since would silently lose its styles.
+    # Rebuilds the pruned files that exist from the current site, each written only on change.
+    if is_dry_run():
+        return
+    existing = [(original, pruned) for original, pruned in optional_replacements.items()
+                if os.path.exists(os.path.join(root_dir, pruned))]
+    if not existing:
+        return
+    # The pages as this build will write them: the prerendered catalog replaces the static
+    # fallback cards (and their icons), which would otherwise only drop out on the next build
+    render = lambda content, page: prerender_catalog(content, page, root_dir)[0]
+    used = collect_used_selectors(root_dir, skip_scripts=VENDOR_SCRIPTS, render=render)
+    for original, pruned in existing:
+        if original == Path(FONTAWESOME_CSS).as_posix():
+            _, text, _, _ = pruned_fontawesome(root_dir, used)
+        else:
+            with open(os.path.join(root_dir, original), 'r', encoding='utf-8') as f:
+                text = minify_css(f.read(), used)
+        path = os.path.join(root_dir, pruned)
+        with open(path, 'r', encoding='utf-8') as f:
+            if f.read() == text:
+                continue
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(text)
+        print(f"[PRUNE] {pruned} rebuilt ({len(text)/1024:.1f}KB)")
+
+def rewrite_links(content, links=replacements):
+    # Returns the new content; unchanged content is returned as-is.
+    # Only whole references are swapped (assets/js/main.js, not assets/js/main.json or xassets/js/main.js);
+    # a leading ../ or / is fine.
+    links = {original: minified for original, minified in links.items() if original in content}
+    if not links:
+        return content
+    pattern = re.compile(r'(?<![\w.-])((?:\.\./|\./|/)*)(' + '|'.join(map(re.escape, links)) + r')(?![\w.-])')
+    return pattern.sub(lambda match: match.group(1) + links[match.group(2)], content)
+
+def html_links_stage(content, file_path, root_dir):
+    # Pipeline stage wrapper (see build_pipeline.py)
+    return rewrite_links(content, active_replacements(root_dir))
+
 def update_html_links(root_dir):
-    replacements = {
-        'assets/css/style.css': 'assets/css/style.min.css',
-        'assets/js/main.js': 'assets/js/main.min.js',
-        'assets/js/app-loader.js': 'assets/js/app-loader.min.js'
-    }
-    
     files_modified = 0
+    links = active_replacements(root_dir)
     
     print(f"Scanning for HTML files in {root_dir}")
     
@@ -23,15 +89,9 @@ def update_html_links(root_dir):
                     with open(file_path, 'r', encoding='utf-8') as f:
                         content = f.read()
                     
-                    new_content = content
-                    modified = False
-                    
-                    for original, minified in replacements.items():
-                        if original in new_content:
-                            new_content = new_content.replace(original, minified)
-                            modified = True
+                    new_content = rewrite_links(content, links)
                             
-                    if modified:
+                    if new_content != content:
                         with open(file_path, 'w', encoding='utf-8') as f:
                             f.write(new_content)
                         files_modified += 1
@@ -45,4 +105,4 @@ def update_html_links(root_dir):
     print(f"Files Modified: {files_modified}")
 
 if __name__ == "__main__":
-    update_html_links("e:/appdev/vexil-logic-games")
+    update_html_links(sys.argv[1] if len(sys.argv) > 1 else os.path.dirname(os.path.abspath(__file__)))